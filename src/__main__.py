@@ -0,0 +1,5 @@
+from .cli import main
+
+# the guard keeps the worker processes of a crawl, which import this module again, from running the command
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,703 @@
+import argparse
+import gc
+import json
+import multiprocessing
+import os
+import platform
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import bs4
+import numpy as np
+import pandas as pd
+from . import fixtures
+from .cache import ResponseCache
+from .localsite import LocalSite
+from .metrics import enable_metrics, disable_metrics
+from .normalize import normalize
+from .pipeline import Pipeline
+from .records import TextStore
+from .spatial import SpatialIndex
+from .scraper import PARSERS, RealEstateHungarySettings, RealEstateHungaryPageListings, RealEstateHungary, RequestWithHeaders, records_to_df
+from .transport import Response, Session
+
+# Offline micro-benchmarks over the synthetic pages of fixtures, run as: python -m real_estate_hungary.benchmarks
+
+
+def offline_page_listings(lang, page_num=1, parser=None, content=None):
+    # the options of the fixtures never go to the on-disk cache of the live sites
+    settings = RealEstateHungarySettings(lang=lang, content=fixtures.homepage(lang), parser=parser, cache_dir=None)
+    return RealEstateHungaryPageListings(real_estate_hun_settings=settings,
+                                         city='budapest',
+                                         listing_type=fixtures.LISTING_TYPES[lang][0],
+                                         property_type=fixtures.PROPERTY_TYPES[lang][0],
+                                         page_num=page_num,
+                                         content=content or fixtures.result_page(lang, page_num),
+                                         parser=parser)
+
+
+def available_parsers():
+    parsers = []
+    for parser in PARSERS:
+        try:
+            bs4.BeautifulSoup('', parser)
+        except bs4.FeatureNotFound:
+            continue
+        parsers.append(parser)
+    return parsers
+
+
+def _detail_pages(lang, num_listings):
+    return [fixtures.detail_page(lang, fixtures.property_id(1, i, lang)) for i in range(num_listings)]
+
+
+def check_parser_parity(lang, result_pages=None, detail_pages=None, parsers=None):
+    '''
+    Comparing the page attributes, listings and property records extracted with each parser to the ones of html5lib.
+    Saved pages can be given as lists of bytes, the synthetic pages are used otherwise. Returns the mismatches.
+    '''
+    result_pages = result_pages or [fixtures.result_page(lang, 1)]
+    detail_pages = detail_pages or _detail_pages(lang, 10)
+    mismatches = []
+    def extract(parser):
+        pages = [offline_page_listings(lang, parser=parser, content=content) for content in result_pages]
+        page_records = [(page.extract_attrs(), page.get_page_listings()) for page in pages]
+        property_records = [RealEstateHungary('https://example.com/{}'.format(i), pages[0], content=content, parser=parser).extract_attrs()
+                            for i, content in enumerate(detail_pages)]
+        return page_records + property_records
+    reference = extract('html5lib')
+    for parser in parsers or available_parsers():
+        for i, (expected, actual) in enumerate(zip(reference, extract(parser))):
+            if expected != actual:
+                mismatches.append({'lang': lang, 'parser': parser, 'document': i, 'expected': expected, 'actual': actual})
+    return mismatches
+
+
+def bench_parsers(lang, documents=None, parsers=None, repeat=3):
+    '''
+    Parsing throughput of each available parser in documents per second, over saved or synthetic detail pages.
+    '''
+    documents = documents or _detail_pages(lang, 50)
+    results = []
+    for parser in parsers or available_parsers():
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for content in documents:
+                bs4.BeautifulSoup(content, parser)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        results.append({'lang': lang, 'parser': parser, 'documents': len(documents), 'docs_per_sec': len(documents) / best})
+    return results
+
+
+class ReferenceExtraction:
+    '''
+    Field extraction of RealEstateHungary as it was before the single walk over the document: every field searches
+    the parsed tree again and 'eng' coordinates are cut out of the serialised document. Kept as the reference
+    bench_extract_attrs compares the current extraction with.
+    '''
+    def __init__(self, property_url, lang, parsed_html):
+        self.property_url = property_url
+        self._lang = lang
+        self.parsed_html = parsed_html
+
+    @property
+    def gps_coordinates(self):
+        if self._lang == 'hun':
+            gps_img = self.parsed_html.find('a', class_='static-map', href='#terkep').img.get('src')
+            lat, lng = gps_img.split('&')[2].split('=')[1].split(',')
+            return {'lat': float(lat), 'lng': float(lng)}
+        raw_html = str(self.parsed_html)
+        gps_keyword = 'map.addMarker'
+        intermed_part = raw_html[raw_html.find(gps_keyword) + len(gps_keyword):]
+        result = re.sub(pattern=r'[\[({})]', string=intermed_part[:intermed_part.find(',title')], repl='')
+        try:
+            return {v.split(':')[0]: float(v.split(':')[1].strip()) for v in result.split(',')}
+        except IndexError:
+            return {'lat': None, 'lng': None}
+
+    @property
+    def full_address(self):
+        if self._lang == 'hun':
+            addrs_full = self.parsed_html.find('h1', class_='js-listing-title').get_text()
+            try:
+                city_district, addrs = addrs_full.split(',')
+            except ValueError:
+                city_district, addrs = addrs_full, None
+            return {'city_district': city_district, 'address': None if addrs is None else addrs.strip()}
+        addrs_full = self.parsed_html.find(name='h1', class_='ApartmentPage__Title').get_text()
+        return {'city_district': ','.join(addrs_full.split(',')[1:]).strip(), 'address': None}
+
+    @property
+    def main_params(self):
+        if self._lang == 'hun':
+            listing_params = self.parsed_html.find('div', class_='listing-parameters')
+            main_params = {'_'.join(par.get('class')[1].split('-')[1:]): par.find(name='span', class_='parameter-value').get_text().strip()
+                           for par in listing_params.find_all('div')}
+            main_params['price'] = {'huf': main_params['price']}
+            return main_params
+        price_huf = self.parsed_html.find(name='h4', class_='ApartmentPage__Price').get_text()
+        price_eur = self.parsed_html.find(name='span', class_='ApartmentPage__Price--eur').get_text()
+        return {'price': {'huf': price_huf.strip(), 'eur': price_eur.strip()}}
+
+    @property
+    def param_details(self):
+        if self._lang == 'hun':
+            details_l = [td.string for td in self.parsed_html.find('div', class_='paramterers').find_all('td')]
+            return {k.replace(' ', '_').lower(): v.replace(',', '|') for k, v in zip(details_l[::2], details_l[1::2])}
+        details_section = self.parsed_html.find(name='div', class_='row ApartmentPage__detailsrow')
+        details_cols = details_section.find_all(name='div', class_='col-sm-4')
+        all_details_d = {col.div.label.get_text(): col.div.p.get_text().strip() for col in details_cols}
+        return {k.replace(' ', '_').lower(): v for k, v in all_details_d.items() if v != 'n/a'}
+
+    @property
+    def public_transports(self):
+        transports = {}
+        if self._lang == 'hun':
+            transports_html = self.parsed_html.find('div', class_='public-transports')
+            if transports_html:
+                for div in transports_html.find_all('div', class_='public-transport-group'):
+                    modes_lines = {div.span.get_text().lower(): [a.get_text().strip() for a in div.find_all('a')]}
+                    transports.update({mode: '|'.join(lines) for mode, lines in modes_lines.items()})
+                    transports.update({'{}_count'.format(mode.lower()): len(lines) for mode, lines in modes_lines.items()})
+        return transports
+
+    @property
+    def desc(self):
+        if self._lang == 'hun':
+            if self.parsed_html.find('div', class_='long-description'):
+                return self.parsed_html.find('div', class_='long-description').get_text()
+            return None
+        desc_html_tag = self.parsed_html.find('div', class_='ApartmentPage__section')
+        return ' '.join(' '.join(text.split()) for text in [p.get_text() for p in desc_html_tag.find_all(name='p')])
+
+    @property
+    def num_photos(self):
+        if self._lang == 'hun':
+            card_listing = self.parsed_html.find('div', class_='card listing')
+            # .string, get_text skips script bodies on bs4 4.13+
+            script = card_listing.script.string.strip()
+            return len(json.loads(script.split('=')[1].split(';')[0].strip()))
+        images = self.parsed_html.find('div', class_='row ApartmentImage__list')
+        return len(images.find_all('a'))
+
+    def extract_attrs(self):
+        main_params = self.main_params
+        if self._lang == 'hun':
+            area_size, lot_size = main_params.get('area_size'), main_params.get('lot_size', None)
+        else:
+            area_size, lot_size = self.param_details.get('ground_area_size', None), self.param_details.get('size_of_land', None)
+        single = {'property_url': self.property_url, 'city_district': self.full_address['city_district'],
+                  'address': self.full_address['address'], 'lot_size': lot_size, 'area_size': area_size,
+                  'room': main_params.get('room', None), 'photos': self.num_photos, 'desc': self.desc}
+        multiple = {**{'price_in_{}'.format(k): v for k, v in self.main_params.get('price', None).items()},
+                    **self.gps_coordinates, **self.param_details, **self.public_transports}
+        return {**single, **multiple}
+
+
+def bench_extract_attrs(lang, num_listings=100, reference=True):
+    '''
+    Per-listing time of RealEstateHungary.extract_attrs on already parsed detail pages, in milliseconds. With
+    reference, the same trees are also timed with ReferenceExtraction, the extraction before the single walk.
+    '''
+    page = offline_page_listings(lang)
+    properties = [RealEstateHungary('https://example.com/{}'.format(i), page, content=content)
+                  for i, content in enumerate(_detail_pages(lang, num_listings))]
+    for prop in properties:
+        prop.parsed_html
+    start = time.perf_counter()
+    for prop in properties:
+        prop.extract_attrs()
+    elapsed = time.perf_counter() - start
+    result = {'lang': lang, 'listings': num_listings, 'ms_per_listing': elapsed / num_listings * 1000}
+    if reference:
+        references = [ReferenceExtraction(prop.property_url, lang, prop.parsed_html) for prop in properties]
+        start = time.perf_counter()
+        for ref in references:
+            ref.extract_attrs()
+        reference_elapsed = time.perf_counter() - start
+        result.update(reference_ms_per_listing=reference_elapsed / num_listings * 1000, speedup=reference_elapsed / elapsed)
+    return result
+
+
+def bench_extract_fields(lang, fields=('price_in_huf', 'area_size', 'lat', 'lng'), num_listings=100, parsers=None):
+    '''
+    Per-listing time of extracting all the fields against only the given ones from the downloaded detail pages,
+    parsing included, in milliseconds, by parser.
+    '''
+    page = offline_page_listings(lang)
+    documents = _detail_pages(lang, num_listings)
+    results = []
+    for parser in parsers or available_parsers():
+        timings = {}
+        for name, selected in (('all', None), ('selected', list(fields))):
+            start = time.perf_counter()
+            for i, content in enumerate(documents):
+                RealEstateHungary('https://example.com/{}'.format(i), page, content=content, parser=parser).extract_attrs(selected)
+            timings[name] = (time.perf_counter() - start) / num_listings * 1000
+        results.append({'lang': lang, 'parser': parser, 'fields': len(fields), 'ms_per_listing_all': timings['all'],
+                        'ms_per_listing_selected': timings['selected'], 'speedup': timings['all'] / timings['selected']})
+    return results
+
+
+def bench_page_overhead(lang, num_pages=20, parser='lxml'):
+    '''
+    Per-page time in milliseconds of the accesses a crawl makes to an already parsed result page: the page
+    attributes, the listing parameters and the page attributes again for each record. Served from the single walk
+    of the page against rescanning the document on every access, as each accessor used to.
+    '''
+    pages = [offline_page_listings(lang, page_num=page_num, parser=parser) for page_num in range(1, num_pages + 1)]
+    for page in pages:
+        page.parsed_html
+    def crawl_accesses(page, rescan):
+        accessors = [page.extract_attrs, lambda: list(page._iter_listing_params())]
+        accessors += [page.extract_attrs] * len(page.get_property_urls())
+        for accessor in accessors:
+            if rescan:
+                page.__dict__.pop('_summary', None)
+            accessor()
+    results = {'lang': lang, 'parser': parser, 'pages': num_pages}
+    for name, rescan in (('rescanning', True), ('single_pass', False)):
+        for page in pages:
+            page.__dict__.pop('_summary', None)
+        start = time.perf_counter()
+        for page in pages:
+            crawl_accesses(page, rescan)
+        results['ms_per_page_{}'.format(name)] = (time.perf_counter() - start) / num_pages * 1000
+    results['speedup'] = results['ms_per_page_rescanning'] / results['ms_per_page_single_pass']
+    return results
+
+
+def bench_metrics_overhead(lang, num_listings=100, repeat=3):
+    '''
+    Per-listing time in milliseconds of parsing and extracting detail pages with the metrics disabled and enabled.
+    '''
+    page = offline_page_listings(lang)
+    documents = _detail_pages(lang, num_listings)
+    results = {'lang': lang, 'listings': num_listings}
+    for name in ('disabled', 'enabled'):
+        if name == 'enabled':
+            enable_metrics()
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for i, content in enumerate(documents):
+                RealEstateHungary('https://example.com/{}'.format(i), page, content=content).extract_attrs()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        results['ms_per_listing_{}'.format(name)] = best / num_listings * 1000
+    disable_metrics()
+    results['overhead'] = results['ms_per_listing_enabled'] / results['ms_per_listing_disabled'] - 1
+    return results
+
+
+def synthetic_records(num_records, seed=0):
+    '''
+    Records shaped like the ones of listings_to_df, with varying param_details and public_transports keys.
+    '''
+    rnd = random.Random(seed)
+    optional_keys = [k.replace(' ', '_').lower() for k in list(fixtures.HUN_DETAILS) + list(fixtures.ENG_DETAILS)]
+    optional_keys += [mode.lower() for mode in fixtures.TRANSPORTS] + ['{}_count'.format(mode.lower()) for mode in fixtures.TRANSPORTS]
+    records = []
+    for i in range(num_records):
+        record = {'property_url': 'https://ingatlan.com/{}'.format(i), 'city_district': rnd.choice(fixtures.DISTRICTS),
+                  'area_size': '{} m²'.format(rnd.randint(25, 180)), 'photos': rnd.randint(0, 30),
+                  'price_in_huf': '{} M Ft'.format(rnd.randint(150, 1500) / 10), 'lat': 47.4 + rnd.random() / 5, 'lng': 19 + rnd.random() / 5,
+                  'property_id': str(i), 'page_num': i // 20 + 1}
+        record.update((k, 'value') for k in rnd.sample(optional_keys, rnd.randint(3, len(optional_keys))))
+        records.append(record)
+    return records
+
+
+def bench_record_accumulation(sizes=(1000, 10000, 100000), concat_limit=10000):
+    '''
+    Seconds to turn synthetic records into one DataFrame: one-row DataFrames concatenated in a loop (the old way,
+    skipped above concat_limit records as it is quadratic) against records_to_df on the buffered dicts.
+    '''
+    results = []
+    for num_records in sizes:
+        records = synthetic_records(num_records)
+        result = {'records': num_records, 'concat_loop_sec': None}
+        if num_records <= concat_limit:
+            start = time.perf_counter()
+            df = pd.DataFrame()
+            for record in records:
+                df = pd.concat([df, pd.DataFrame(record, index=[0])], axis=0, sort=False)
+            result['concat_loop_sec'] = time.perf_counter() - start
+        start = time.perf_counter()
+        records_to_df(records)
+        result['records_to_df_sec'] = time.perf_counter() - start
+        results.append(result)
+    return results
+
+
+def synthetic_raw_frame(num_rows, seed=0):
+    '''
+    Raw string columns as scraped, half of the rows in the 'hun' and half in the 'eng' format.
+    '''
+    rng = np.random.default_rng(seed)
+    half = num_rows // 2
+    def choice(values, size):
+        return np.asarray(values, dtype=object)[rng.integers(0, len(values), size)]
+    hun = pd.DataFrame({'lang': 'hun',
+                        'price_in_huf': ['{} M Ft'.format(p).replace('.', ',') for p in np.round(rng.uniform(15, 250, half), 1)],
+                        'area_size': ['{} m²'.format(a) for a in rng.integers(20, 250, half)],
+                        'room': ['{0} + {1} fél'.format(r, h) for r, h in zip(rng.integers(1, 6, half), rng.integers(0, 3, half))],
+                        'emelet': choice(fixtures.HUN_DETAILS['Emelet'], half),
+                        'építés_éve': choice(fixtures.HUN_DETAILS['Építés éve'], half),
+                        'fűtés': choice(fixtures.HUN_DETAILS['Fűtés'], half),
+                        'ingatlan_állapota': choice(fixtures.HUN_DETAILS['Ingatlan állapota'], half),
+                        'erkély': choice([v.replace(',', '|') for v in fixtures.HUN_DETAILS['Erkély']], half)})
+    prices = rng.integers(15000, 250000, num_rows - half) * 1000
+    eng = pd.DataFrame({'lang': 'eng',
+                        'price_in_huf': ['{:,} HUF'.format(p) for p in prices],
+                        'price_in_eur': ['{} EUR'.format(p) for p in prices // 390],
+                        'area_size': ['{} square meter'.format(a) for a in rng.integers(20, 250, num_rows - half)],
+                        'floors': choice(fixtures.ENG_DETAILS['Floors'], num_rows - half),
+                        'year_built': choice(fixtures.ENG_DETAILS['Year built'], num_rows - half),
+                        'type_of_heating': choice(fixtures.ENG_DETAILS['Type of heating'], num_rows - half),
+                        'condition_of_real_estate': choice(fixtures.ENG_DETAILS['Condition of real estate'], num_rows - half)})
+    return pd.concat([hun, eng], ignore_index=True)
+
+
+def bench_normalize(num_rows=1000000):
+    '''
+    Seconds and memory of normalize on num_rows synthetic raw rows of both languages.
+    '''
+    df = synthetic_raw_frame(num_rows)
+    start = time.perf_counter()
+    typed = normalize(df)
+    elapsed = time.perf_counter() - start
+    return {'rows': num_rows, 'sec': elapsed, 'rows_per_sec': num_rows / elapsed,
+            'raw_mb': df.memory_usage(deep=True).sum() / 1024 ** 2, 'typed_mb': typed.memory_usage(deep=True).sum() / 1024 ** 2}
+
+
+def bench_spatial(num_points=1000000, num_queries=200, seed=0):
+    '''
+    Milliseconds per query of SpatialIndex over num_points random listings in the bounding box of Hungary,
+    around random points of Budapest.
+    '''
+    rng = np.random.default_rng(seed)
+    start = time.perf_counter()
+    index = SpatialIndex(np.arange(num_points), rng.uniform(45.7, 48.6, num_points), rng.uniform(16.1, 22.9, num_points))
+    result = {'points': num_points, 'build_sec': time.perf_counter() - start}
+    centers = np.column_stack([rng.uniform(47.4, 47.6, num_queries), rng.uniform(18.95, 19.2, num_queries)])
+    queries = {'radius_500m': lambda lat, lng: index.radius(lat, lng, 500),
+               'knn_10': lambda lat, lng: index.knn(lat, lng, 10),
+               'bbox_2km': lambda lat, lng: index.bbox(lat - 0.009, lng - 0.013, lat + 0.009, lng + 0.013)}
+    for name, query in queries.items():
+        start = time.perf_counter()
+        for lat, lng in centers:
+            query(lat, lng)
+        result['{}_ms'.format(name)] = (time.perf_counter() - start) / num_queries * 1000
+    return result
+
+
+def replay_session(cache_path, pages):
+    '''
+    Session replaying the synthetic property pages of the given page listings from a cache at cache_path.
+    '''
+    cache = ResponseCache(cache_path, mode='replay')
+    for page in pages:
+        for url, additional_ids in page._iter_listing_params():
+            headers = RequestWithHeaders(url).headers
+            cache.put(url, headers, Response(url, 200, {}, fixtures.detail_page(page.lang, int(additional_ids['property_id']))))
+    return Session(cache=cache)
+
+
+def bench_pipeline(lang, num_pages=5, processes=(1, 2, 4), fetchers=8):
+    '''
+    Listings per second of the whole crawl with Pipeline replaying cached pages, against the number of processes.
+    '''
+    pages = [offline_page_listings(lang, page_num) for page_num in range(1, num_pages + 1)]
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        session = replay_session(os.path.join(tmp_dir, 'responses.sqlite'), pages)
+        for num_processes in processes:
+            pipeline = Pipeline(processes=num_processes, fetchers=fetchers, session=session)
+            start = time.perf_counter()
+            num_records = sum(1 for _ in pipeline.iter_records(pages))
+            elapsed = time.perf_counter() - start
+            results.append({'lang': lang, 'processes': num_processes, 'listings': num_records, 'listings_per_sec': num_records / elapsed})
+        session.cache.close()
+    return results
+
+
+class _TimedSession(Session):
+    '''
+    Session keeping the latency of every request, for the percentiles of the end-to-end benchmarks.
+    '''
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.latencies = []
+        self._latencies_lock = threading.Lock()
+
+    def request(self, url, headers=None, method='GET', priority=None):
+        start = time.perf_counter()
+        try:
+            return super().request(url, headers=headers, method=method, priority=priority)
+        finally:
+            with self._latencies_lock:
+                self.latencies.append(time.perf_counter() - start)
+
+
+def peak_rss_mb():
+    '''
+    Peak resident memory of the process so far in megabytes, None where the resource module is missing.
+    '''
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+
+
+def _site_result(benchmark, lang, concurrency, listings, elapsed, latencies):
+    latencies = np.asarray(latencies) * 1000
+    return {'benchmark': benchmark, 'lang': lang, 'concurrency': concurrency, 'listings': listings, 'seconds': elapsed,
+            'listings_per_sec': listings / elapsed if listings and elapsed else None,
+            'p50_ms': float(np.percentile(latencies, 50)) if len(latencies) else None,
+            'p99_ms': float(np.percentile(latencies, 99)) if len(latencies) else None,
+            'peak_rss_mb': peak_rss_mb()}
+
+
+def bench_site(lang, num_pages=2, concurrency=(None, 'threads', 'asyncio'), latency=0.02, jitter=0.01, error_rate=0.,
+               parser=None, max_workers=8):
+    '''
+    End-to-end benchmarks against a LocalSite: the settings from the homepage, listings_to_df over num_pages result
+    pages in each concurrency mode, and fetching, parsing and extract_attrs of the properties one by one. Reports
+    listings per second, p50/p99 latency of the requests (of each listing for extract_attrs) and peak RSS.
+    '''
+    results = []
+    with LocalSite(latency=latency, jitter=jitter, error_rate=error_rate) as site:
+        session = _TimedSession(backoff_factor=0.)
+        start = time.perf_counter()
+        settings = RealEstateHungarySettings(lang, session=session, parser=parser, cache_dir=None, url=site.url(lang))
+        results.append(_site_result('settings', lang, None, 0, time.perf_counter() - start, session.latencies))
+        def pages():
+            return [RealEstateHungaryPageListings(settings, 'budapest', fixtures.LISTING_TYPES[lang][0], fixtures.PROPERTY_TYPES[lang][0],
+                                                  page_num, parser=parser) for page_num in range(1, num_pages + 1)]
+        for mode in concurrency:
+            session.latencies = []
+            start = time.perf_counter()
+            listings = sum(len(page.listings_to_df(concurrency=mode, max_workers=max_workers)) for page in pages())
+            results.append(_site_result('listings_to_df', lang, mode, listings, time.perf_counter() - start, session.latencies))
+        page = pages()[0]
+        latencies = []
+        start = time.perf_counter()
+        for url in page.get_property_urls():
+            listing_start = time.perf_counter()
+            RealEstateHungary(url, page, parser=parser).extract_attrs()
+            latencies.append(time.perf_counter() - listing_start)
+        results.append(_site_result('extract_attrs', lang, None, len(latencies), time.perf_counter() - start, latencies))
+        session.close()
+    return results
+
+
+def records_size_mb(records):
+    '''
+    Memory held by the records in megabytes: the records, their keys and values, shared objects counted once.
+    '''
+    seen = set()
+    total = 0
+    def add(obj):
+        nonlocal total
+        if id(obj) not in seen:
+            seen.add(id(obj))
+            total += sys.getsizeof(obj)
+    for record in records:
+        add(record)
+        for name in ('_index', '_values'):
+            if hasattr(record, name):
+                add(getattr(record, name))
+        for key, value in record.items():
+            add(key)
+            add(value)
+    return total / 1024 / 1024
+
+
+def _memory_run(lang, num_pages, workers, compact, desc, latency, parser, results):
+    # in a fresh process, so the peak RSS is of this run only
+    with LocalSite(latency=latency) as site:
+        # a session of its own, the rate limits of the default one would keep the workers from running at once
+        settings = RealEstateHungarySettings(lang, parser=parser, cache_dir=None, url=site.url(lang), session=Session(backoff_factor=0.))
+        desc = TextStore() if desc == 'store' else desc
+        gc.collect()
+        baseline = peak_rss_mb()
+        records = []
+        start = time.perf_counter()
+        for page_num in range(1, num_pages + 1):
+            page = RealEstateHungaryPageListings(settings, 'budapest', fixtures.LISTING_TYPES[lang][0], fixtures.PROPERTY_TYPES[lang][0],
+                                                 page_num, parser=parser, compact=compact, desc=desc)
+            records.extend(page.iter_listings(concurrency='threads', max_workers=workers, max_per_host=workers))
+        elapsed = time.perf_counter() - start
+        peak = peak_rss_mb()
+    results.put({'listings': len(records), 'seconds': elapsed, 'baseline_rss_mb': baseline, 'peak_rss_mb': peak,
+                 'records_mb': records_size_mb(records)})
+
+
+def bench_memory(lang, workers=(1, 4, 8), num_pages=3, modes=((False, None), (True, None), (True, 'intern'), (True, 'store')),
+                 latency=0.01, parser=None):
+    '''
+    Peak RSS of scraping num_pages result pages in threads against a LocalSite, keeping the records, with dict records
+    and with compact records (desc as it is, interned, or in a TextStore). Each run is a fresh process; the growth of
+    the peak over the RSS after start-up is reported, and the memory of one worker as the difference of the growth to
+    the run of the same mode with the fewest workers, per added worker, as all runs keep the same records.
+    '''
+    context = multiprocessing.get_context('spawn')
+    rows = []
+    fewest = {}
+    for num_workers in sorted(workers):
+        for compact, desc in modes:
+            results = context.Queue()
+            process = context.Process(target=_memory_run, args=(lang, num_pages, num_workers, compact, desc, latency, parser, results))
+            process.start()
+            result = results.get()
+            process.join()
+            growth = result['peak_rss_mb'] - result['baseline_rss_mb'] if result['peak_rss_mb'] is not None else None
+            base_workers, base_growth = fewest.setdefault((compact, desc), (num_workers, growth))
+            per_worker = None
+            if growth is not None and base_growth is not None and num_workers > base_workers:
+                per_worker = (growth - base_growth) / (num_workers - base_workers)
+            rows.append({'lang': lang, 'workers': num_workers, 'compact': compact, 'desc': desc, **result,
+                         'rss_growth_mb': growth, 'rss_per_added_worker_mb': per_worker})
+    return rows
+
+
+HEAVY_MODULES = ('pandas', 'numpy', 'bs4', 'lxml', 'html5lib', 'asyncio')
+
+
+def _package_env():
+    # the interpreters started by the benchmarks import the package from the directory it is in
+    env = dict(os.environ)
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env['PYTHONPATH'] = os.pathsep.join([root] + ([env['PYTHONPATH']] if env.get('PYTHONPATH') else []))
+    return env
+
+
+def bench_import_time(modules=('cli', 'utils', 'crawler', 'scraper', 'pipeline'), repeat=5):
+    '''
+    Import time of each module in a fresh interpreter, the best of repeat runs, and the heavy modules it loads.
+    '''
+    package = __name__.rpartition('.')[0]
+    code = ('import json, sys, time; start = time.perf_counter(); import {0}.{1}; '
+            'print(json.dumps([time.perf_counter() - start, [m for m in {2!r} if m in sys.modules]]))')
+    env = _package_env()
+    results = []
+    for module in modules:
+        runs = [json.loads(subprocess.run([sys.executable, '-c', code.format(package, module, HEAVY_MODULES)], env=env,
+                                          capture_output=True, text=True, check=True).stdout) for _ in range(repeat)]
+        results.append({'module': module, 'import_ms': min(seconds for seconds, loaded in runs) * 1000, 'loads': runs[0][1]})
+    return results
+
+
+def bench_cli_jobs(num_jobs=10):
+    '''
+    Milliseconds per job of num_jobs resume commands on an empty queue, each in a new interpreter and all in one worker.
+    '''
+    package = __name__.rpartition('.')[0]
+    env = _package_env()
+    with tempfile.TemporaryDirectory() as tmp:
+        job = ['resume', os.path.join(tmp, 'queue.sqlite')]
+        start = time.perf_counter()
+        for _ in range(num_jobs):
+            subprocess.run([sys.executable, '-m', package] + job, env=env, capture_output=True, check=True)
+        process_per_job = (time.perf_counter() - start) / num_jobs
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-m', package, 'worker'], input='\n'.join([json.dumps(job)] * num_jobs), env=env,
+                       capture_output=True, text=True, check=True)
+        worker_per_job = (time.perf_counter() - start) / num_jobs
+    return {'jobs': num_jobs, 'process_per_job_ms': process_per_job * 1000, 'worker_per_job_ms': worker_per_job * 1000}
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def save_results(results, path):
+    '''
+    Writing benchmark results to a JSON file along with the commit and the environment they were measured in.
+    '''
+    report = {'commit': _git_commit(), 'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'), 'python': platform.python_version(),
+              'platform': platform.platform(), 'cpu_count': os.cpu_count(), 'results': results}
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=1)
+    return report
+
+
+def compare_results(baseline_path, results, tolerance=0.1):
+    '''
+    Comparing listings per second to the ones of a saved run, matched by benchmark, lang and concurrency.
+    Rows slower than the baseline by more than tolerance are flagged as regressions.
+    '''
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = {(r['benchmark'], r['lang'], r['concurrency']): r for r in json.load(f)['results']}
+    rows = []
+    for result in results:
+        before = baseline.get((result['benchmark'], result['lang'], result['concurrency']))
+        if before is None or not before['listings_per_sec'] or not result['listings_per_sec']:
+            continue
+        ratio = result['listings_per_sec'] / before['listings_per_sec']
+        rows.append({'benchmark': result['benchmark'], 'lang': result['lang'], 'concurrency': result['concurrency'],
+                     'before': before['listings_per_sec'], 'after': result['listings_per_sec'], 'ratio': ratio,
+                     'regression': ratio < 1 - tolerance})
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Offline benchmarks of real_estate_hungary.')
+    parser.add_argument('--site', action='store_true', help='only the end-to-end benchmarks against the local stand-in site')
+    parser.add_argument('--output', help='JSON file to save the end-to-end results to')
+    parser.add_argument('--baseline', help='JSON file of an earlier run to compare the end-to-end results with')
+    parser.add_argument('--pages', type=int, default=2, help='result pages of each end-to-end run')
+    parser.add_argument('--latency', type=float, default=0.02, help='simulated latency of the site in seconds')
+    parser.add_argument('--error-rate', type=float, default=0., help='fraction of the requests failing with 503')
+    args = parser.parse_args(argv)
+    site_results = []
+    for lang in ('hun', 'eng'):
+        for result in bench_site(lang, num_pages=args.pages, latency=args.latency, error_rate=args.error_rate):
+            print(result)
+            site_results.append(result)
+    if args.output:
+        save_results(site_results, args.output)
+    if args.baseline:
+        for row in compare_results(args.baseline, site_results):
+            print(row)
+    if args.site:
+        return
+    for result in bench_memory('hun'):
+        print(result)
+    for result in bench_import_time():
+        print(result)
+    print(bench_cli_jobs())
+    for lang in ('hun', 'eng'):
+        print(bench_extract_attrs(lang))
+        for result in bench_extract_fields(lang):
+            print(result)
+        print(bench_page_overhead(lang))
+        print(bench_metrics_overhead(lang))
+        for result in bench_parsers(lang):
+            print(result)
+        for mismatch in check_parser_parity(lang):
+            print('Parser mismatch: {}'.format(mismatch))
+    for result in bench_record_accumulation():
+        print(result)
+    for result in bench_pipeline('hun'):
+        print(result)
+    print(bench_normalize())
+    print(bench_spatial())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,205 @@
+import hashlib
+import http.client
+import io
+import json
+import sqlite3
+import threading
+import time
+import zlib
+from urllib.error import HTTPError
+from .transport import Response
+
+RECORD = 'record'
+REPLAY = 'replay'
+READ_THROUGH = 'read-through'
+MODES = (RECORD, REPLAY, READ_THROUGH)
+# errors cached like pages, the others (429, 5xx, ...) are transient and always go to the network again
+PERMANENT_ERROR_STATUSES = (404, 410)
+# headers of conditional requests, a recording made without them answers the requests with them too
+CONDITIONAL_HEADERS = ('if-none-match', 'if-modified-since', 'if-match', 'if-unmodified-since', 'if-range')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    final_url TEXT NOT NULL,
+    status INTEGER NOT NULL,
+    headers TEXT NOT NULL,
+    body_hash TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_accessed_at ON entries (accessed_at);
+CREATE INDEX IF NOT EXISTS entries_body_hash ON entries (body_hash);
+CREATE TABLE IF NOT EXISTS bodies (
+    hash TEXT PRIMARY KEY,
+    data BLOB NOT NULL,
+    size INTEGER NOT NULL
+);
+'''
+
+
+class CacheMiss(KeyError):
+    pass
+
+
+def cache_key(url, headers, method='GET'):
+    headers = sorted((k.lower(), v) for k, v in (headers or {}).items() if k.lower() not in CONDITIONAL_HEADERS)
+    return hashlib.sha256(json.dumps([method, url, headers]).encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    '''
+    On-disk HTTP response cache in SQLite, keyed by method, URL and request headers other than CONDITIONAL_HEADERS.
+    Bodies are stored zlib compressed and content addressed, so identical pages are kept once. A conditional
+    request is answered with the stored page, a 304 Not Modified is passed on but never stored over it.
+
+    Parameters
+    ----------
+    path : string
+        Path of the SQLite file.
+    mode : string
+        'record' always fetches and stores the responses, 'replay' serves only from the cache and raises CacheMiss
+        on anything else, without touching the network, 'read-through' serves fresh entries and fetches the rest.
+        Of the error responses only the permanent ones (404, 410) are stored, 429 and 5xx are always fetched again.
+    ttl : float, optional
+        Seconds after which an entry is stale in read-through mode. Replay serves entries of any age.
+    max_bytes : int, optional
+        Maximum size of the compressed bodies, least recently used entries are evicted above it.
+    compress_level : int
+        zlib compression level of the bodies.
+
+    Examples
+    --------
+    >>> cache=ResponseCache('responses.sqlite', mode='record', max_bytes=2*1024**3)
+    >>> set_default_session(Session(cache=cache))
+    '''
+    def __init__(self, path, mode=READ_THROUGH, ttl=None, max_bytes=None, compress_level=6):
+        if mode not in MODES:
+            raise ValueError('Please specify one of the following modes: {}'.format(', '.join(MODES)))
+        self.path = path
+        self.mode = mode
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.compress_level = compress_level
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=60., check_same_thread=False, isolation_level=None)
+        # freed pages of evicted bodies are returned to the file system by incremental vacuum
+        self._conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript(SCHEMA)
+        self._total_bytes = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM bodies').fetchone()[0]
+        self.stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+
+    def __repr__(self):
+        return 'ResponseCache({0}, mode={1}, stats={2})'.format(self.path, self.mode, self.stats)
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+
+    @property
+    def total_bytes(self):
+        return self._total_bytes
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def get(self, url, headers=None, method='GET', ignore_ttl=False):
+        '''
+        Cached Response of the request or None. Cached error responses are raised as HTTPError, like the network would.
+        '''
+        key = cache_key(url, headers, method)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute('''SELECT e.final_url, e.status, e.headers, e.fetched_at, b.data
+                FROM entries e JOIN bodies b ON b.hash = e.body_hash WHERE e.key = ?''', (key,)).fetchone()
+            if row is None or (not ignore_ttl and self.ttl is not None and now - row[3] > self.ttl):
+                self.stats['misses'] += 1
+                return None
+            self._conn.execute('UPDATE entries SET accessed_at = ? WHERE key = ?', (now, key))
+            self.stats['hits'] += 1
+        final_url, status, headers_json, _, data = row
+        resp_headers = http.client.HTTPMessage()
+        for k, v in json.loads(headers_json):
+            resp_headers[k] = v
+        content = zlib.decompress(data)
+        if status >= 400:
+            raise HTTPError(final_url, status, 'Cached error response', resp_headers, io.BytesIO(content))
+        return Response(final_url, status, resp_headers, content)
+
+    def put(self, url, headers, resp, method='GET'):
+        key = cache_key(url, headers, method)
+        body_hash = hashlib.sha256(resp.content).hexdigest()
+        resp_headers = json.dumps([(k, v) for k, v in resp.headers.items() if k.lower() not in ('content-encoding', 'content-length', 'transfer-encoding')])
+        now = time.time()
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                if self._conn.execute('SELECT 1 FROM bodies WHERE hash = ?', (body_hash,)).fetchone() is None:
+                    data = zlib.compress(resp.content, self.compress_level)
+                    self._conn.execute('INSERT INTO bodies (hash, data, size) VALUES (?, ?, ?)', (body_hash, data, len(data)))
+                    self._total_bytes += len(data)
+                old = self._conn.execute('SELECT body_hash FROM entries WHERE key = ?', (key,)).fetchone()
+                self._conn.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                                   (key, url, resp.url, resp.status, resp_headers, body_hash, now, now))
+                if old is not None and old[0] != body_hash:
+                    self._delete_orphans([old[0]])
+                self._conn.execute('COMMIT')
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+            self.stats['stores'] += 1
+            if self.max_bytes is not None and self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _delete_orphans(self, body_hashes):
+        for body_hash in body_hashes:
+            if self._conn.execute('SELECT 1 FROM entries WHERE body_hash = ? LIMIT 1', (body_hash,)).fetchone() is None:
+                row = self._conn.execute('SELECT size FROM bodies WHERE hash = ?', (body_hash,)).fetchone()
+                if row is not None:
+                    self._conn.execute('DELETE FROM bodies WHERE hash = ?', (body_hash,))
+                    self._total_bytes -= row[0]
+
+    def _evict(self, batch_size=100):
+        # evicting down to 90% of the limit, so not every store triggers an eviction
+        target = self.max_bytes * 0.9
+        while self._total_bytes > target:
+            rows = self._conn.execute('SELECT key, body_hash FROM entries ORDER BY accessed_at LIMIT ?', (batch_size,)).fetchall()
+            if not rows:
+                break
+            self._conn.execute('BEGIN IMMEDIATE')
+            for key, body_hash in rows:
+                self._conn.execute('DELETE FROM entries WHERE key = ?', (key,))
+                self._delete_orphans([body_hash])
+                self.stats['evictions'] += 1
+                if self._total_bytes <= target:
+                    break
+            self._conn.execute('COMMIT')
+        self._conn.execute('PRAGMA incremental_vacuum')
+
+    def request(self, url, headers, method, send):
+        '''
+        Serving the request according to the mode, send(url, headers, method) is the network fallback.
+        '''
+        if self.mode != RECORD:
+            resp = self.get(url, headers, method, ignore_ttl=self.mode == REPLAY)
+            if resp is not None:
+                return resp
+            if self.mode == REPLAY:
+                raise CacheMiss('{} is not in the cache.'.format(url))
+        try:
+            resp = send(url, headers, method)
+        except HTTPError as err:
+            content = err.read()
+            if err.code in PERMANENT_ERROR_STATUSES:
+                self.put(url, headers, Response(err.geturl(), err.code, err.headers, content), method)
+            raise HTTPError(err.geturl(), err.code, err.msg, err.headers, io.BytesIO(content))
+        if resp.status != 304:
+            self.put(url, headers, resp, method)
+        return resp
+
+    def urls(self):
+        with self._lock:
+            return [r[0] for r in self._conn.execute('SELECT url FROM entries ORDER BY fetched_at')]
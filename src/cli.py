@@ -0,0 +1,263 @@
+import argparse
+import contextlib
+import json
+import os
+import shlex
+import sys
+import time
+
+# Command line of the package: python -m real_estate_hungary <command>. The commands import what they need when they
+# run, so --help or reorganise never load bs4 or pandas, and a crawl loads pandas only to write its output.
+# worker runs a stream of commands in one process, paying the imports and the connection setup once: its jobs share
+# one session per response cache, with its pooled connections and the rate limits of its scheduler.
+
+
+def _session(cache, cache_mode, processes=1):
+    from .scheduler import DEFAULT_HOST_RATES, DEFAULT_RATE, Scheduler
+    from .transport import Session
+    # every process has its own scheduler, together they keep to the rates of the sites
+    scheduler = Scheduler(host_rates={host: rate / processes for host, rate in DEFAULT_HOST_RATES.items()},
+                          default_rate=DEFAULT_RATE / processes)
+    if cache is None:
+        return Session(scheduler=scheduler)
+    from .cache import ResponseCache
+    return Session(cache=ResponseCache(cache, mode=cache_mode), scheduler=scheduler)
+
+
+def _close_session(session):
+    session.close()
+    if session.cache is not None:
+        session.cache.close()
+
+
+def _shared_session(args, cache, cache_mode):
+    # the session of the worker for this cache, or a new one closed by the command
+    if args.sessions is None:
+        return _session(cache, cache_mode)
+    if (cache, cache_mode) not in args.sessions:
+        args.sessions[(cache, cache_mode)] = _session(cache, cache_mode)
+    return args.sessions[(cache, cache_mode)]
+
+
+def _run_worker(db_path, kwargs, cache, cache_mode, max_tasks, processes):
+    from .crawler import Crawler
+    session = _session(cache, cache_mode, processes)
+    crawler = Crawler(db_path, session=session, **kwargs)
+    try:
+        return crawler.run(max_tasks=max_tasks)
+    finally:
+        crawler.close()
+        _close_session(session)
+
+
+def _drain(args, combinations=None, cache_mode=None, retry_failed=False):
+    '''
+    Seeding the queue of args.db with combinations and draining it, in args.processes processes.
+    '''
+    from .crawler import Crawler
+    cache_mode = cache_mode or args.cache_mode
+    kwargs = {'photos_dir': args.photos_dir, 'index_path': args.index, 'recheck_after': args.recheck_after,
+              'cluster_path': args.clusters, 'cluster_keep': args.cluster_keep}
+    metrics = None
+    # run rejects --metrics and --profile with several processes, the registry and the profiler only see this one
+    if args.metrics:
+        from .metrics import enable_metrics
+        metrics = enable_metrics()
+    session = _shared_session(args, args.cache, cache_mode)
+    crawler = Crawler(args.db, session=session, **kwargs)
+    try:
+        if combinations:
+            crawler.add([tuple(combination) for combination in combinations])
+        if retry_failed:
+            crawler.reset_failed()
+        if args.processes > 1:
+            import multiprocessing
+            # sessions belong to a single process, each worker opens the cache itself
+            with multiprocessing.Pool(args.processes) as pool:
+                processed = sum(pool.starmap(_run_worker, [(args.db, kwargs, args.cache, cache_mode, args.max_tasks, args.processes)] * args.processes))
+        else:
+            processed = crawler.run(max_tasks=args.max_tasks, profile_path=args.profile)
+        result = {'db': args.db, 'processed': processed}
+        if args.output:
+            df = crawler.to_df()
+            if args.output.endswith('.parquet'):
+                df.to_parquet(args.output, index=False)
+            else:
+                df.to_csv(args.output, index=False)
+            result.update(output=args.output, records=len(df))
+    finally:
+        crawler.close()
+        if args.sessions is None:
+            _close_session(session)
+        if metrics is not None:
+            from .metrics import disable_metrics
+            metrics.dump(args.metrics)
+            disable_metrics()
+    return result
+
+
+def _crawl(args):
+    return _drain(args, combinations=args.search)
+
+
+def _resume(args):
+    return _drain(args, retry_failed=args.retry_failed)
+
+
+def _replay(args):
+    return _drain(args, combinations=args.search, cache_mode='replay')
+
+
+def _reorganise(args):
+    from .utils import feed_dir, make_output_dirs, mv_files
+    files = [p for p, date_name in feed_dir(args.output_dir)]
+    make_output_dirs(args.output_dir)
+    mv_files(args.output_dir)
+    return {'output_dir': args.output_dir, 'moved': files}
+
+
+def _follow(path, poll_interval=1., exit_when_empty=False):
+    '''
+    Yielding the lines appended to the queue file at path. The offset of the next line is saved to path.offset once
+    the previous one is processed, so a restarted worker goes on where it stopped.
+    '''
+    offset_path = path + '.offset'
+    offset = 0
+    if os.path.exists(offset_path):
+        with open(offset_path) as f:
+            offset = int(f.read() or 0)
+    open(path, 'ab').close()
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        while True:
+            start = f.tell()
+            line = f.readline()
+            if line.endswith(b'\n'):
+                yield line.decode('utf-8')
+                with open(offset_path, 'w') as o:
+                    o.write(str(f.tell()))
+            else:
+                # a line still being written is read again once it is complete
+                f.seek(start)
+                if exit_when_empty:
+                    return
+                time.sleep(poll_interval)
+
+
+def _run_job(line, sessions=None):
+    start = time.perf_counter()
+    job = {'job': line}
+    try:
+        argv = json.loads(line) if line.startswith('[') else shlex.split(line)
+        # the output of the command goes to stderr, stdout carries one result line per job
+        with contextlib.redirect_stdout(sys.stderr):
+            job.update(status='ok', result=run(argv, in_worker=True, sessions=sessions))
+    except SystemExit as err:
+        # argparse exits on invalid arguments and on --help
+        job.update(status='error', error='exit status {}'.format(err.code))
+    except Exception as err:
+        job.update(status='error', error=repr(err))
+    job['seconds'] = time.perf_counter() - start
+    return job
+
+
+def _worker(args):
+    out = sys.stdout
+    lines = sys.stdin if args.queue is None else _follow(args.queue, args.poll_interval, args.exit_when_empty)
+    jobs = 0
+    sessions = {}
+    try:
+        for line in lines:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            print(json.dumps(_run_job(line, sessions), default=str), file=out, flush=True)
+            jobs += 1
+    finally:
+        for session in sessions.values():
+            _close_session(session)
+    return {'jobs': jobs}
+
+
+def _add_crawler_arguments(parser, cache_mode=True):
+    parser.add_argument('db', help='SQLite file of the crawl queue and the scraped records')
+    parser.add_argument('--processes', type=int, default=1, help='number of worker processes')
+    parser.add_argument('--max-tasks', type=int, help='tasks each process handles before stopping')
+    parser.add_argument('--photos-dir', help='directory to save the photos of the properties to')
+    parser.add_argument('--index', help='SQLite file of the listing index, unchanged properties are not scraped again')
+    parser.add_argument('--recheck-after', type=float, help='seconds during which an indexed property is trusted')
+    parser.add_argument('--clusters', help='SQLite file of the cluster map, one listing of each cluster of duplicates is scraped')
+    parser.add_argument('--cluster-keep', default='first', help="listing scraped of each cluster: first, cheapest or newest")
+    if cache_mode:
+        parser.add_argument('--cache', help='SQLite file of the response cache')
+        parser.add_argument('--cache-mode', default='read-through', help='record, replay or read-through')
+    parser.add_argument('--output', help='CSV or Parquet file to write the scraped records to')
+    parser.add_argument('--metrics', help='file to write the metrics of a single process run to, Prometheus text if it ends with .prom, JSON otherwise')
+    parser.add_argument('--profile', help='file to write the hot paths of a single process run to')
+
+
+def _search_argument(parser, required):
+    parser.add_argument('--search', nargs=4, action='append', required=required,
+                        metavar=('LANG', 'CITY', 'LISTING_TYPE', 'PROPERTY_TYPE'), help='search combination to crawl, repeatable')
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='real_estate_hungary', description='Scraping real estates listed in Hungary.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    crawl = commands.add_parser('crawl', help='crawl search combinations into a queue database, resuming it if it exists')
+    _add_crawler_arguments(crawl)
+    _search_argument(crawl, required=True)
+    crawl.set_defaults(func=_crawl)
+
+    resume = commands.add_parser('resume', help='drain the unfinished tasks of a queue database')
+    _add_crawler_arguments(resume)
+    resume.add_argument('--retry-failed', action='store_true', help='hand out the failed tasks again')
+    resume.set_defaults(func=_resume)
+
+    replay = commands.add_parser('replay', help='crawl from the responses recorded in a response cache, without the network')
+    _add_crawler_arguments(replay, cache_mode=False)
+    replay.add_argument('--cache', required=True, help='SQLite file of the response cache')
+    _search_argument(replay, required=False)
+    replay.set_defaults(func=_replay)
+
+    reorganise = commands.add_parser('reorganise', help='move the raw files of an output directory into the <date>/data/ layout')
+    reorganise.add_argument('output_dir', nargs='?', default='../output/')
+    reorganise.set_defaults(func=_reorganise)
+
+    worker = commands.add_parser('worker', help='run the commands read line by line from stdin or a queue file')
+    worker.add_argument('--queue', help='file to follow for commands instead of stdin')
+    worker.add_argument('--poll-interval', type=float, default=1., help='seconds between looking for new lines of the queue file')
+    worker.add_argument('--exit-when-empty', action='store_true', help='stop at the end of the queue file instead of waiting')
+    worker.set_defaults(func=_worker)
+    return parser
+
+
+def run(argv=None, in_worker=False, sessions=None):
+    '''
+    Running the command of argv, returns its result dict. sessions is the dict of the sessions a worker shares
+    between its jobs by response cache, the command creates and closes its own without it.
+    '''
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    args.sessions = sessions
+    if getattr(args, 'processes', 1) > 1 and (args.metrics or args.profile):
+        parser.error('--metrics and --profile need --processes 1, the worker processes would not be covered')
+    if in_worker and args.command == 'worker':
+        raise ValueError('Please specify a command other than worker for the jobs of a worker.')
+    return args.func(args)
+
+
+def main(argv=None):
+    '''
+    Entry point of python -m real_estate_hungary, printing the result of the command as a JSON line.
+
+    Examples
+    --------
+    python -m real_estate_hungary crawl budapest.sqlite --search eng budapest for-sale apartment --output budapest.parquet
+    python -m real_estate_hungary resume budapest.sqlite --retry-failed
+    python -m real_estate_hungary replay replayed.sqlite --cache responses.sqlite --search eng budapest for-sale apartment
+    python -m real_estate_hungary reorganise ../output/
+    python -m real_estate_hungary worker --queue jobs.txt
+    '''
+    print(json.dumps(run(argv), default=str))
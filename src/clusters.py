@@ -0,0 +1,213 @@
+import functools
+import sqlite3
+import threading
+import time
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS clusters (
+    cluster_id TEXT PRIMARY KEY,
+    property_id TEXT NOT NULL,
+    url TEXT,
+    price REAL,
+    first_seen REAL NOT NULL,
+    last_seen REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS cluster_members (
+    property_id TEXT PRIMARY KEY,
+    cluster_id TEXT NOT NULL,
+    url TEXT,
+    price REAL,
+    first_seen REAL NOT NULL,
+    last_seen REAL NOT NULL,
+    failed INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS cluster_members_cluster_id ON cluster_members (cluster_id);
+'''
+MEMBER_COLUMNS = ('property_id', 'cluster_id', 'url', 'price', 'first_seen', 'last_seen', 'failed')
+KEEP = ('first', 'cheapest', 'newest')
+
+
+@functools.lru_cache(maxsize=None)
+def _price_parsing():
+    # imported once, on the first select, so a crawl without clusters never loads pandas through this module
+    import pandas as pd
+    from .normalize import parse_price
+    return pd, parse_price
+
+
+def _id_order(property_id):
+    # ids of the site grow over time, numeric ones are compared as numbers
+    try:
+        return (1, int(property_id), '')
+    except (TypeError, ValueError):
+        return (0, 0, str(property_id))
+
+
+class ClusterMap:
+    '''
+    Persistent map of the listing clusters of 'hun', the same property advertised by several agencies.
+
+    Of the cards of a cluster only its representative is fetched, the others are recorded as its members without a
+    request, on the same page, on later pages and in later runs. keep decides the representative: the first one seen,
+    the cheapest by the price on the card, or the newest by property id. A cheaper or newer member found later
+    becomes the representative and is fetched. Cards without cluster id are always fetched. When the fetch of the
+representative fails for good, fail() hands the cluster over to the best of the other members.
+
+    Parameters
+    ----------
+    path : string
+        Path of the SQLite file, ':memory:' keeps the map for the lifetime of the object.
+    keep : {'first', 'cheapest', 'newest'}
+        Representative of each cluster.
+
+    Examples
+    --------
+    >>> cluster_map=ClusterMap('clusters.sqlite', keep='cheapest')
+    >>> page=RealEstateHungaryPageListings(..., cluster_map=cluster_map)
+    >>> df=page.listings_to_df()
+    >>> cluster_map.members(df.cluster_id[0])
+    '''
+    def __init__(self, path=':memory:', keep='first'):
+        if keep not in KEEP:
+            raise ValueError('Please specify keep as one of the following: {}.'.format(', '.join(KEEP)))
+        self.path = path
+        self.keep = keep
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=60., check_same_thread=False, isolation_level=None)
+        if path != ':memory:':
+            self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript(SCHEMA)
+        self.stats = {'representatives': 0, 'replaced': 0, 'skipped': 0}
+
+    def __repr__(self):
+        return 'ClusterMap({0}, keep={1}, stats={2})'.format(self.path, self.keep, self.stats)
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM clusters').fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _better(self, candidate, current):
+        if self.keep == 'cheapest':
+            price, current_price = candidate['price'], current['price']
+            return price is not None and (current_price is None or price < current_price)
+        if self.keep == 'newest':
+            return _id_order(candidate['property_id']) > _id_order(current['property_id'])
+        return False
+
+    def select(self, property_ids, cluster_ids, urls, prices=None):
+        '''
+        Deciding which cards of a result page to fetch, given as parallel lists, prices as written on the cards.
+        Returns a list of booleans, True for the cards to fetch. The map is updated in one transaction, so
+        processes sharing the file agree on the representatives.
+        '''
+        pd, parse_price = _price_parsing()
+        prices = [None] * len(urls) if prices is None else prices
+        parsed_prices = parse_price(pd.Series(prices, dtype=object).fillna('').astype(str)) if len(urls) else []
+        cards = [{'property_id': None if property_id is None else str(property_id), 'cluster_id': cluster_id, 'url': url,
+                  'price': None if pd.isna(price) else float(price)}
+                 for property_id, cluster_id, url, price in zip(property_ids, cluster_ids, urls, parsed_prices)]
+        selected = [not card['cluster_id'] or card['property_id'] is None for card in cards]
+        by_cluster = {}
+        for i, card in enumerate(cards):
+            if not selected[i]:
+                by_cluster.setdefault(card['cluster_id'], []).append(i)
+        now = time.time()
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                for cluster_id, positions in by_cluster.items():
+                    row = self._conn.execute('SELECT property_id, url, price FROM clusters WHERE cluster_id = ?', (cluster_id,)).fetchone()
+                    current = None if row is None else dict(zip(('property_id', 'url', 'price'), row))
+                    failed = {r[0] for r in self._conn.execute('SELECT property_id FROM cluster_members WHERE cluster_id = ? AND failed',
+                                                               (cluster_id,))}
+                    if current is not None and current['property_id'] in failed:
+                        # a representative that failed without other members to take its place
+                        current = None
+                    # the stored representative competes with the cards, it is fetched again only when it is on the page
+                    best, champion = None, current
+                    for i in positions:
+                        card = cards[i]
+                        if card['property_id'] in failed:
+                            continue
+                        on_page = current is not None and best is None and card['property_id'] == current['property_id']
+                        if champion is None or on_page or self._better(card, champion):
+                            best, champion = i, card
+                    if best is not None and current is not None and cards[best]['property_id'] != current['property_id']:
+                        self.stats['replaced'] += 1
+                    if best is not None:
+                        selected[best] = True
+                        self.stats['representatives'] += 1
+                        card = cards[best]
+                        self._conn.execute('''INSERT INTO clusters VALUES (?, ?, ?, ?, ?, ?)
+                            ON CONFLICT (cluster_id) DO UPDATE SET property_id = excluded.property_id, url = excluded.url,
+                            price = excluded.price, last_seen = excluded.last_seen''',
+                                           (cluster_id, card['property_id'], card['url'], card['price'], now, now))
+                    self.stats['skipped'] += len(positions) - (best is not None)
+                    self._conn.executemany('''INSERT INTO cluster_members (property_id, cluster_id, url, price, first_seen, last_seen)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                        ON CONFLICT (property_id) DO UPDATE SET cluster_id = excluded.cluster_id, url = excluded.url,
+                        price = excluded.price, last_seen = excluded.last_seen''',
+                                           [(cards[i]['property_id'], cluster_id, cards[i]['url'], cards[i]['price'], now, now) for i in positions])
+                self._conn.execute('COMMIT')
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+        return selected
+
+    def fail(self, cluster_id, property_id):
+        '''
+        Marking a member whose listing could not be fetched, it is not chosen as representative again. If it was the
+        representative, the best of the other members seen so far takes its place and is returned as a dict of
+        property_id, url and price to be fetched instead, otherwise None.
+        '''
+        cluster_id, property_id = str(cluster_id), str(property_id)
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                self._conn.execute('UPDATE cluster_members SET failed = 1 WHERE property_id = ?', (property_id,))
+                row = self._conn.execute('SELECT property_id FROM clusters WHERE cluster_id = ?', (cluster_id,)).fetchone()
+                best = None
+                if row is not None and row[0] == property_id:
+                    for member in self._conn.execute('''SELECT property_id, url, price FROM cluster_members
+                            WHERE cluster_id = ? AND NOT failed ORDER BY first_seen, property_id''', (cluster_id,)):
+                        member = dict(zip(('property_id', 'url', 'price'), member))
+                        if best is None or self._better(member, best):
+                            best = member
+                if best is not None:
+                    self._conn.execute('UPDATE clusters SET property_id = ?, url = ?, price = ?, last_seen = ? WHERE cluster_id = ?',
+                                       (best['property_id'], best['url'], best['price'], time.time(), cluster_id))
+                    self.stats['replaced'] += 1
+                self._conn.execute('COMMIT')
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+        return best
+
+    def representative(self, cluster_id):
+        with self._lock:
+            row = self._conn.execute('SELECT property_id, url, price FROM clusters WHERE cluster_id = ?', (str(cluster_id),)).fetchone()
+        return None if row is None else dict(zip(('property_id', 'url', 'price'), row))
+
+    def members(self, cluster_id):
+        '''
+        Every listing seen in the cluster, the representative included, as dicts.
+        '''
+        with self._lock:
+            rows = self._conn.execute('SELECT {} FROM cluster_members WHERE cluster_id = ? ORDER BY first_seen, property_id'.format(', '.join(MEMBER_COLUMNS)),
+                                      (str(cluster_id),)).fetchall()
+        return [dict(zip(MEMBER_COLUMNS, row)) for row in rows]
+
+    def to_df(self):
+        '''
+        DataFrame of the members of every cluster, is_representative marks the listings that were fetched for them.
+        '''
+        import pandas as pd
+        with self._lock:
+            df = pd.read_sql_query('''SELECT m.*, m.property_id = c.property_id AS is_representative
+                FROM cluster_members m LEFT JOIN clusters c USING (cluster_id) ORDER BY m.cluster_id, m.first_seen''', self._conn)
+        df['is_representative'] = df['is_representative'].fillna(0).astype(bool)
+        return df
@@ -0,0 +1,370 @@
+import json
+import multiprocessing
+import os
+import socket
+import sqlite3
+import time
+from urllib.error import HTTPError
+from .clusters import ClusterMap
+from .index import ListingIndex
+from .metrics import profile
+from .photos import PhotoDownloader
+from .scraper import RealEstateHungarySettings, RealEstateHungaryPageListings, records_to_df
+
+PAGE = 'page'
+PROPERTY = 'property'
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    lang TEXT NOT NULL,
+    city TEXT NOT NULL,
+    listing_type TEXT NOT NULL,
+    property_type TEXT NOT NULL,
+    page_num INTEGER NOT NULL,
+    property_url TEXT NOT NULL DEFAULT '',
+    property_id TEXT,
+    cluster_id TEXT,
+    page_attrs TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    claimed_at REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    UNIQUE (kind, lang, city, listing_type, property_type, page_num, property_url)
+);
+CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status, kind);
+CREATE TABLE IF NOT EXISTS records (
+    task_id INTEGER PRIMARY KEY REFERENCES tasks (id),
+    property_url TEXT NOT NULL,
+    record TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+'''
+
+
+class Crawler:
+    '''
+    Crawling every page and every property of the given search combinations through a work queue persisted in SQLite.
+
+    Page 1 of each combination is seeded, its max_page expands into the remaining page tasks and every page
+    expands into property tasks. Progress survives crashes: running the crawler again on the same database
+    resumes with the unfinished tasks. Tasks are claimed atomically, so several processes, or several machines
+    sharing the database file, can drain the same queue without fetching anything twice.
+
+    Parameters
+    ----------
+    db_path : string
+        Path of the SQLite file holding the queue and the scraped records.
+    worker_id : string, optional
+        Name of this worker in the queue, defaults to host name and process id.
+    lease_timeout : float
+        Seconds after which a task claimed by a worker that stopped responding is handed out again. The tasks of
+        a crashed worker of this host are handed out again at the start of the next run, see requeue_orphans.
+    max_attempts : int
+        Number of tries of a task before it is marked as failed.
+    photos_dir : string, optional
+        Directory to save the photos of the properties to.
+    session : transport.Session, optional
+        Shared transport of the worker.
+    wal : bool
+        Using SQLite write-ahead logging, switch it off when the database file is on a network file system.
+    index_path : string, optional
+        SQLite file of an index.ListingIndex, properties unchanged since earlier crawls are then not scraped again.
+    recheck_after : float, optional
+        Seconds during which an indexed property is trusted without asking the server.
+    cluster_path : string, optional
+        SQLite file of a clusters.ClusterMap, only one listing of each cluster of duplicates is then scraped.
+        When it fails for good, the next member of the cluster is queued in its place.
+    cluster_keep : {'first', 'cheapest', 'newest'}
+        Listing scraped of each cluster.
+
+    Examples
+    --------
+    >>> crawler=Crawler('budapest.sqlite')
+    >>> crawler.add([('eng', 'budapest', 'for-sale', 'apartment')])
+    >>> crawler.run()
+    >>> crawler.to_df()
+    '''
+    def __init__(self, db_path, worker_id=None, lease_timeout=600., max_attempts=3, photos_dir=None, session=None, wal=True,
+                 index_path=None, recheck_after=None, cluster_path=None, cluster_keep='first'):
+        self.db_path = db_path
+        self.worker_id = worker_id or '{0}:{1}'.format(socket.gethostname(), os.getpid())
+        self.lease_timeout = lease_timeout
+        self.max_attempts = max_attempts
+        self.photos_dir = photos_dir
+        self.session = session
+        self._photo_downloader = None
+        self.listing_index = None if index_path is None else ListingIndex(index_path, recheck_after=recheck_after)
+        self.cluster_map = None if cluster_path is None else ClusterMap(cluster_path, keep=cluster_keep)
+        self._settings = {}
+        self._conn = sqlite3.connect(db_path, timeout=60., isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        if wal:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript(SCHEMA)
+
+    def __repr__(self):
+        return 'Crawler({0}, {1})'.format(self.db_path, self.worker_id)
+
+    def close(self):
+        if self._photo_downloader is not None:
+            self._photo_downloader.close()
+        if self.listing_index is not None:
+            self.listing_index.close()
+        if self.cluster_map is not None:
+            self.cluster_map.close()
+        self._conn.close()
+
+    @property
+    def photo_downloader(self):
+        if self._photo_downloader is None and self.photos_dir is not None:
+            self._photo_downloader = PhotoDownloader(self.photos_dir, session=self.session)
+        return self._photo_downloader
+
+    def _settings_for(self, lang):
+        if lang not in self._settings:
+            self._settings[lang] = RealEstateHungarySettings(lang=lang, session=self.session)
+        return self._settings[lang]
+
+    def _page_listings(self, task):
+        settings = self._settings_for(task['lang'])
+        return RealEstateHungaryPageListings(real_estate_hun_settings=settings,
+                                             city=task['city'],
+                                             listing_type=task['listing_type'],
+                                             property_type=task['property_type'],
+                                             page_num=task['page_num'],
+                                             session=self.session,
+                                             photo_downloader=self.photo_downloader,
+                                             listing_index=self.listing_index,
+                                             cluster_map=self.cluster_map)
+
+    def _insert_tasks(self, rows):
+        self._conn.executemany('''INSERT OR IGNORE INTO tasks
+            (kind, lang, city, listing_type, property_type, page_num, property_url, property_id, cluster_id, page_attrs)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', rows)
+
+    def add(self, combinations):
+        '''
+        Seeding the queue with (lang, city, listing_type, property_type) combinations, already seeded ones are ignored.
+        '''
+        rows = [(PAGE, lang.lower(), city, listing_type, property_type, 1, '', None, None, None)
+                for lang, city, listing_type, property_type in combinations]
+        with self._transaction():
+            self._insert_tasks(rows)
+
+    def _transaction(self):
+        return _ImmediateTransaction(self._conn)
+
+    def claim(self):
+        '''
+        Claiming the next task, properties before pages to keep the queue short. Returns None if nothing is left.
+        '''
+        now = time.time()
+        with self._transaction():
+            row = self._conn.execute('''SELECT * FROM tasks
+                WHERE status = ? OR (status = ? AND claimed_at < ?)
+                ORDER BY kind = ? DESC, id LIMIT 1''', (PENDING, RUNNING, now - self.lease_timeout, PROPERTY)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute('UPDATE tasks SET status = ?, worker = ?, claimed_at = ?, attempts = attempts + 1 WHERE id = ?',
+                               (RUNNING, self.worker_id, now, row['id']))
+        task = dict(row)
+        task['attempts'] += 1
+        return task
+
+    def _process_page(self, task):
+        page = self._page_listings(task)
+        page_attrs = page.extract_attrs()
+        rows = []
+        if task['page_num'] == 1:
+            rows.extend((PAGE, task['lang'], task['city'], task['listing_type'], task['property_type'], page_num, '', None, None, None)
+                        for page_num in range(2, page_attrs['max_page'] + 1))
+        page_attrs_json = json.dumps(page_attrs)
+        for url, additional_ids in page._iter_listing_params():
+            rows.append((PROPERTY, task['lang'], task['city'], task['listing_type'], task['property_type'], task['page_num'],
+                         url, additional_ids['property_id'], additional_ids['cluster_id'], page_attrs_json))
+        with self._transaction():
+            self._insert_tasks(rows)
+            self._finish(task)
+
+    def _process_property(self, task):
+        page = self._page_listings(task)
+        record = page._create_record(task['property_url'],
+                                     page_attrs=json.loads(task['page_attrs']),
+                                     property_id=task['property_id'],
+                                     cluster_id=task['cluster_id'])
+        with self._transaction():
+            # no record when the listing index found the page unchanged
+            if record is not None:
+                self._conn.execute('INSERT OR REPLACE INTO records (task_id, property_url, record, created_at) VALUES (?, ?, ?, ?)',
+                                   (task['id'], task['property_url'], json.dumps(record, default=str), time.time()))
+            self._finish(task)
+        return record
+
+    def _finish(self, task):
+        self._conn.execute('UPDATE tasks SET status = ?, error = NULL WHERE id = ? AND worker = ?', (DONE, task['id'], self.worker_id))
+
+    def _fail(self, task, err):
+        gone = isinstance(err, HTTPError) and err.code == 404
+        status = FAILED if gone or task['attempts'] >= self.max_attempts else PENDING
+        with self._transaction():
+            self._conn.execute('UPDATE tasks SET status = ?, error = ? WHERE id = ? AND worker = ?',
+                               (status, repr(err), task['id'], self.worker_id))
+            if status == FAILED and task['kind'] == PROPERTY and task['cluster_id'] and self.cluster_map is not None:
+                # the cluster is not lost with its representative, the next member is fetched instead
+                member = self.cluster_map.fail(task['cluster_id'], task['property_id'])
+                if member is not None:
+                    self._insert_tasks([(PROPERTY, task['lang'], task['city'], task['listing_type'], task['property_type'], task['page_num'],
+                                         member['url'], member['property_id'], task['cluster_id'], task['page_attrs'])])
+
+    def requeue_orphans(self):
+        '''
+        Handing out again, without waiting for their lease to expire, the running tasks of the workers of this host
+        whose process is gone, e.g. after a crash. Returns their number. Workers on other hosts, and on Windows,
+        where a process cannot be probed safely, keep their tasks until lease_timeout.
+        '''
+        host = socket.gethostname()
+        rows = self._conn.execute('SELECT DISTINCT worker FROM tasks WHERE status = ?', (RUNNING,)).fetchall()
+        orphans = [row['worker'] for row in rows if row['worker'] != self.worker_id and not _worker_alive(row['worker'], host)]
+        if not orphans:
+            return 0
+        with self._transaction():
+            cursor = self._conn.execute('UPDATE tasks SET status = ? WHERE status = ? AND worker IN ({})'.format(', '.join('?' * len(orphans))),
+                                        [PENDING, RUNNING] + orphans)
+        return cursor.rowcount
+
+    def _others_running(self):
+        row = self._conn.execute('SELECT COUNT(*) FROM tasks WHERE status = ? AND claimed_at >= ?',
+                                 (RUNNING, time.time() - self.lease_timeout)).fetchone()
+        return row[0] > 0
+
+    def _drain(self, max_tasks, poll_interval):
+        # the tasks of a crashed run would hold the queue for lease_timeout
+        self.requeue_orphans()
+        processed = 0
+        while max_tasks is None or processed < max_tasks:
+            task = self.claim()
+            if task is None:
+                if self._others_running():
+                    time.sleep(poll_interval)
+                    continue
+                break
+            record = None
+            try:
+                if task['kind'] == PAGE:
+                    self._process_page(task)
+                else:
+                    record = self._process_property(task)
+            except Exception as err:
+                self._fail(task, err)
+            processed += 1
+            yield record
+        if self._photo_downloader is not None:
+            self._photo_downloader.wait()
+
+    def run(self, max_tasks=None, poll_interval=1., profile_path=None):
+        '''
+        Draining the queue until it is empty or max_tasks tasks are processed. Returns the number of processed tasks.
+        While other workers are still expanding pages into new tasks, it waits for them instead of stopping.
+        With profile_path the run is profiled and its hot paths are written there, see metrics.profile.
+        '''
+        if profile_path is None:
+            return sum(1 for _ in self._drain(max_tasks, poll_interval))
+        with profile(profile_path):
+            return sum(1 for _ in self._drain(max_tasks, poll_interval))
+
+    def iter_records(self, max_tasks=None, poll_interval=1.):
+        '''
+        Draining the queue like run, yielding the record dict of each property as soon as it is scraped.
+        '''
+        for record in self._drain(max_tasks, poll_interval):
+            if record is not None:
+                yield record
+
+    def progress(self):
+        import pandas as pd
+        rows = self._conn.execute('SELECT kind, status, COUNT(*) AS n FROM tasks GROUP BY kind, status').fetchall()
+        return pd.DataFrame([dict(r) for r in rows], columns=['kind', 'status', 'n'])
+
+    def reset_failed(self):
+        with self._transaction():
+            self._conn.execute('UPDATE tasks SET status = ?, attempts = 0 WHERE status = ?', (PENDING, FAILED))
+
+    def to_df(self):
+        rows = self._conn.execute('SELECT record FROM records ORDER BY task_id').fetchall()
+        return records_to_df([json.loads(r['record']) for r in rows])
+
+
+def _worker_alive(worker_id, host):
+    # worker ids default to <host name>:<process id>, other ids cannot be checked and count as alive
+    worker_host, _, pid = (worker_id or '').rpartition(':')
+    if worker_host != host or not pid.isdigit() or os.name == 'nt':
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class _ImmediateTransaction:
+    '''
+    Taking the write lock of the database at the start of the transaction, so two workers cannot claim the same task.
+    '''
+    def __init__(self, conn):
+        self._conn = conn
+
+    def __enter__(self):
+        self._conn.execute('BEGIN IMMEDIATE')
+        return self._conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self._conn.execute('ROLLBACK' if exc_type else 'COMMIT')
+        return False
+
+
+def _run_worker(db_path, kwargs):
+    crawler = Crawler(db_path, **kwargs)
+    try:
+        return crawler.run()
+    finally:
+        crawler.close()
+
+
+def crawl(db_path, combinations, processes=1, **kwargs):
+    '''
+    Seeding the queue with the given combinations and draining it with the given number of worker processes.
+    Calling it again with the same db_path resumes an interrupted crawl. Returns the scraped records.
+
+    Parameters
+    ----------
+    db_path : string
+        Path of the SQLite file holding the queue and the scraped records.
+    combinations : list of tuples
+        (lang, city, listing_type, property_type) tuples, e.g. [('eng', 'budapest', 'for-sale', 'apartment')].
+    processes : int
+        Number of worker processes.
+    kwargs :
+        Passed to Crawler.
+    '''
+    crawler = Crawler(db_path, **kwargs)
+    crawler.add(combinations)
+    if processes > 1:
+        # sessions and worker ids belong to a single process
+        worker_kwargs = {k: v for k, v in kwargs.items() if k not in ('session', 'worker_id')}
+        with multiprocessing.Pool(processes) as pool:
+            pool.starmap(_run_worker, [(db_path, worker_kwargs)] * processes)
+    else:
+        crawler.run()
+    records = crawler.to_df()
+    crawler.close()
+    return records
@@ -0,0 +1,132 @@
+import json
+import random
+
+# Synthetic pages mimicking the layout of ingatlan.com ('hun') and realestate.hu ('eng'), used by the benchmarks.
+# Only the parts the scraper reads are reproduced, the rest is filler text to get realistic document sizes.
+
+LISTINGS_PER_PAGE = {'hun': 20, 'eng': 12}
+
+LISTING_TYPES = {'hun': ['elado', 'kiado'], 'eng': ['for-sale', 'for-rent']}
+PROPERTY_TYPES = {'hun': ['lakas', 'haz', 'telek', 'garazs', 'nyaralo', 'iroda', 'ipari', 'vendeglato', 'fejlesztesi-terulet'],
+                  'eng': ['apartment', 'house', 'land', 'garage', 'summer-resort', 'industrial', 'office', 'catering-unit', 'pension']}
+
+DISTRICTS = ['I', 'II', 'III', 'V', 'VI', 'VII', 'VIII', 'IX', 'XI', 'XIII', 'XIV']
+STREETS = ['Váci út', 'Andrássy út', 'Bartók Béla út', 'Üllői út', 'Szent István körút', 'Fő utca']
+HUN_DETAILS = {'Ingatlan állapota': ['felújított', 'jó állapotú', 'új építésű', 'közepes állapotú'],
+               'Építés éve': ['1950 előtt', '1950 és 1980 között', '2001 és 2010 között', '2016'],
+               'Emelet': ['földszint', '1', '2', '3', '4', '10 felett'],
+               'Fűtés': ['gáz (cirko)', 'gáz (konvektor)', 'távfűtés', 'elektromos'],
+               'Komfort': ['összkomfortos', 'duplakomfortos', 'komfortos'],
+               'Kilátás': ['udvari', 'utcai', 'panorámás'],
+               'Erkély': ['4,5 m²', '6 m²', 'nincs megadva']}
+ENG_DETAILS = {'Condition of real estate': ['Renovated', 'Good', 'Average', 'Building in progress'],
+               'Year built': ['Newly built', '50+ years', '1981-2000', 'n/a'],
+               'Floors': ['Ground floor', '1st floor', '2nd floor', '3rd floor', '4th floor'],
+               'Type of heating': ['Convector', 'Termosifone', 'In-house with unique meter', 'District heating'],
+               'Building material': ['Brick', 'Panel', 'n/a'],
+               'Orientation': ['Yard', 'Street front', 'Panoramic', 'n/a'],
+               'Convenience level': ['Modern convenience', 'Double convenience', 'n/a']}
+TRANSPORTS = {'Metró': ['M1', 'M2', 'M3', 'M4'], 'Villamos': ['4', '6', '47', '49'], 'Busz': ['7', '9', '133E', '178']}
+FILLER = ('Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do eiusmod tempor incididunt ut labore '
+          'et dolore magna aliqua. Ut enim ad minim veniam, quis nostrud exercitation ullamco laboris. ')
+
+
+def _filler(rnd, paragraphs):
+    return ''.join('<p>{0}</p>\n'.format(FILLER * rnd.randint(2, 6)) for _ in range(paragraphs))
+
+
+def _page(head, body):
+    return '<!DOCTYPE html>\n<html>\n<head>\n<meta charset="utf-8">\n{0}</head>\n<body>\n{1}</body>\n</html>\n'.format(head, body).encode('utf-8')
+
+
+def homepage(lang):
+    if lang == 'hun':
+        property_options = ''.join('<option value="{0}">{0}</option>'.format(tp) for tp in PROPERTY_TYPES[lang])
+        listing_inputs = ''.join('<label><input type="radio" name="listing-type" value="{0}">{0}</label>'.format(tp) for tp in LISTING_TYPES[lang])
+        body = ('<div class="search-filter-box listing-type">{0}</div>\n'
+                '<select class="search-filter-select search-filter-select-long"><option value="">Ingatlan típusa</option>{1}</select>\n').format(listing_inputs, property_options)
+    elif lang == 'eng':
+        property_options = ''.join('<option value="{0}">{0}</option>'.format(tp) for tp in PROPERTY_TYPES[lang])
+        listing_options = ''.join('<option value="{0}">{0}</option>'.format(tp) for tp in LISTING_TYPES[lang])
+        body = ('<form><select class="input-type" name="type"><option value="">Property type</option>{0}</select>\n'
+                '<select class="input-type" name="sell_type"><option value="">Listing type</option>{1}</select></form>\n').format(property_options, listing_options)
+    return _page('<title>Home</title>\n', body + _filler(random.Random(lang), 10))
+
+
+def property_id(page_num, position, lang='hun'):
+    return 30000000 + (page_num - 1) * LISTINGS_PER_PAGE[lang] + position
+
+
+def result_page(lang, page_num, max_listing=13382, cluster_every=5):
+    '''
+    Result page with LISTINGS_PER_PAGE[lang] listing cards. Every cluster_every-th card shares the cluster of the previous one.
+    '''
+    per_page = LISTINGS_PER_PAGE[lang]
+    max_page = -(-max_listing // per_page)
+    first = (page_num - 1) * per_page
+    ids = [property_id(page_num, i, lang) for i in range(min(per_page, max(max_listing - first, 0)))]
+    rnd = random.Random(page_num)
+    if lang == 'hun':
+        cards = []
+        cluster_id = None
+        for i, prop_id in enumerate(ids):
+            if cluster_id is None or not (cluster_every and i % cluster_every == 0):
+                cluster_id = 'c{}'.format(prop_id)
+            cards.append('<div class="listing__card" data-id="{0}" data-cluster-id="{1}">'
+                         '<div class="listing__thumbnail"><a href="/{0}"><img src="/thumb/{0}.jpg"></a></div>'
+                         '<div class="price">{2} M Ft</div><div class="listing__address">Budapest {3}. kerület</div></div>\n'
+                         .format(prop_id, cluster_id, str(rnd.randint(200, 1500) / 10).replace('.', ','), rnd.choice(DISTRICTS)))
+        body = ('<span class="filtered_results_count">{0}</span>\n<div class="listings">{1}</div>\n'
+                '<div class="pagination__page-number">{2} / {3} oldal</div>\n').format(max_listing, ''.join(cards), page_num, '{:,}'.format(max_page).replace(',', ' '))
+    elif lang == 'eng':
+        cards = ''.join('<div class="col-md-4"><div class="Apartment--favorite"><a href="#" data-apartment-id="{0}">Save</a></div>'
+                        '<div class="Apartment__details"><a href="/en/apartment-for-sale/{0}">Apartment</a><span>{1} HUF</span></div></div>\n'
+                        .format(prop_id, rnd.randint(20, 150) * 1000000) for prop_id in ids)
+        body = ('<p>Found <strong>{0}</strong> listings</p>\n<div class="Apartment-Collection row">{1}</div>\n').format(max_listing, cards)
+    return _page('<title>Results</title>\n', body + _filler(rnd, 20))
+
+
+def detail_page(lang, prop_id, num_photos=12, photo_base=None):
+    rnd = random.Random(prop_id)
+    district = rnd.choice(DISTRICTS)
+    lat, lng = round(47.4 + rnd.random() * 0.2, 6), round(18.95 + rnd.random() * 0.2, 6)
+    price = rnd.randint(150, 1500) / 10
+    if lang == 'hun':
+        photos = [{'large_url': '{0}photo/large/{1}_{2}.jpg'.format(photo_base or 'https://img.ingatlan.com/', prop_id, i), 'label': str(i)} for i in range(num_photos)]
+        params = [('price', '{} M Ft'.format(str(price).replace('.', ','))), ('area-size', '{} m²'.format(rnd.randint(25, 180))),
+                  ('room', '{0} + {1} fél'.format(rnd.randint(1, 5), rnd.randint(0, 2)))]
+        details = ''.join('<tr><td>{0}</td><td>{1}</td></tr>'.format(k, rnd.choice(v)) for k, v in HUN_DETAILS.items())
+        transports = ''.join('<div class="public-transport-group"><span>{0}</span>{1}</div>'
+                             .format(mode, ''.join('<a href="#">{}</a>'.format(line) for line in rnd.sample(lines, 2)))
+                             for mode, lines in TRANSPORTS.items())
+        head = ('<title>Ingatlan</title>\n<script>var a = 1;</script>\n<script>var b = 2;</script>\n'
+                '<script>dataLayer.push({0})</script>\n').format(json.dumps({'listingId': prop_id, 'price': int(price * 1000000), 'district': district}))
+        body = ('<div class="card listing"><script>var photos = {0};</script><div class="gallery"></div></div>\n'
+                '<h1 class="js-listing-title">Budapest {1}. kerület, {2}</h1>\n'
+                '<div class="listing-parameters">{3}</div>\n'
+                '<div class="paramterers"><table>{4}</table></div>\n'
+                '<a class="static-map" href="#terkep"><img src="https://maps.googleapis.com/maps/api/staticmap?size=640x300&amp;zoom=15&amp;center={5},{6}&amp;key=x"></a>\n'
+                '<div class="public-transports">{7}</div>\n'
+                '<div class="long-description">{8}</div>\n'
+                ).format(json.dumps(photos), district, rnd.choice(STREETS),
+                         ''.join('<div class="parameter parameter-{0}"><span class="parameter-title">{0}</span><span class="parameter-value">{1}</span></div>'.format(k, v) for k, v in params),
+                         details, lat, lng, transports, FILLER * rnd.randint(3, 10))
+    elif lang == 'eng':
+        details = dict((k, rnd.choice(v)) for k, v in ENG_DETAILS.items())
+        details['Ground area size'] = '{} square meter'.format(rnd.randint(25, 180))
+        details_html = ''.join('<div class="col-sm-4"><div><label>{0}</label><p> {1} </p></div></div>'.format(k, v) for k, v in details.items())
+        photos = ''.join('<a href="{0}images/{1}/{2}"><img src="/thumb/{1}/{2}"></a>'.format(photo_base or 'https://realestate.hu/', prop_id, i) for i in range(num_photos))
+        head = '<title>Apartment</title>\n'
+        body = ('<h1 class="ApartmentPage__Title">Apartment for sale, Budapest, District {0}</h1>\n'
+                '<h4 class="ApartmentPage__Price"> {1} HUF </h4><span class="ApartmentPage__Price--eur"> {2} EUR </span>\n'
+                '<div class="row ApartmentImage__list">{3}</div>\n'
+                '<div class="row ApartmentPage__detailsrow">{4}</div>\n'
+                '<div class="ApartmentPage__section">{5}</div>\n'
+                '<script>var map = new Map("map");\nmap.addMarker({{lat:{6},lng:{7},title:"Apartment"}});</script>\n'
+                ).format(district, int(price * 1000000), int(price * 1000000 / 310), photos, details_html, _filler(rnd, 3), lat, lng)
+    return _page(head, body + _filler(rnd, 15))
+
+
+def photo(prop_id, index, size=150000):
+    rnd = random.Random('{0}_{1}'.format(prop_id, index))
+    return b'\xff\xd8\xff\xe0' + rnd.randbytes(size - 6) + b'\xff\xd9'
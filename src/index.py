@@ -0,0 +1,188 @@
+import glob
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import datetime
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS listings (
+    property_id TEXT PRIMARY KEY,
+    cluster_id TEXT,
+    url TEXT,
+    first_seen REAL NOT NULL,
+    last_seen REAL NOT NULL,
+    last_fetched REAL,
+    content_hash TEXT,
+    etag TEXT,
+    last_modified TEXT
+);
+CREATE INDEX IF NOT EXISTS listings_cluster_id ON listings (cluster_id);
+'''
+COLUMNS = ('property_id', 'cluster_id', 'url', 'first_seen', 'last_seen', 'last_fetched', 'content_hash', 'etag', 'last_modified')
+# columns of a record that do not come from the property page: page attributes, ids and the scraping time
+CONTEXT_COLUMNS = ('lang', 'listing_type', 'property_type', 'page_num', 'max_page', 'max_listing', 'property_id', 'cluster_id', 'timestamp')
+
+
+def content_hash(content):
+    return hashlib.sha256(content).hexdigest()
+
+
+def _canonical(value):
+    # numbers read back from a CSV snapshot as strings, or as floats in a column with gaps, hash like the scraped ones
+    if isinstance(value, bool):
+        return str(value)
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return str(value)
+    return str(int(number)) if number.is_integer() else repr(number)
+
+
+def record_hash(record):
+    '''
+    Hash of the fields a record took from its property page, the page attributes, ids and timestamp left out.
+    Unlike a hash of the page it ignores markup changing from request to request, e.g. ads or nonces.
+    '''
+    items = sorted((str(k), _canonical(v)) for k, v in record.items()
+                   if k not in CONTEXT_COLUMNS and v is not None and not (isinstance(v, float) and v != v))
+    return content_hash(json.dumps(items, ensure_ascii=False).encode('utf-8'))
+
+
+def _parse_timestamp(timestamp, ts_format='%Y-%m-%d %H:%M:%S'):
+    try:
+        return datetime.datetime.strptime(str(timestamp), ts_format).timestamp()
+    except ValueError:
+        return None
+
+
+class ListingIndex:
+    '''
+    Persistent index of the listings seen by earlier crawls, consulted before a property page is fetched.
+
+    A listing fetched less than recheck_after seconds ago is skipped without a request. Otherwise its page is fetched
+    conditionally with the stored ETag/Last-Modified and a 304 counts as unchanged. A page sent again is parsed, and
+    counts as unchanged if its record has the stored record_hash. Only new and changed listings are returned.
+
+    Parameters
+    ----------
+    path : string
+        Path of the SQLite file.
+    recheck_after : float, optional
+        Seconds during which a fetched listing is trusted without asking the server, None always asks.
+
+    Examples
+    --------
+    >>> index=ListingIndex('listings.sqlite', recheck_after=24*3600)
+    >>> index.ingest_output_dir('../output/')
+    >>> page=RealEstateHungaryPageListings(..., listing_index=index)
+    >>> changed=page.listings_to_df()
+    '''
+    def __init__(self, path, recheck_after=None):
+        self.path = path
+        self.recheck_after = recheck_after
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=60., check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript(SCHEMA)
+        self.stats = {'skipped_fresh': 0, 'not_modified': 0, 'unchanged': 0, 'changed': 0, 'new': 0}
+
+    def __repr__(self):
+        return 'ListingIndex({0}, stats={1})'.format(self.path, self.stats)
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM listings').fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def count(self, outcome):
+        '''
+        Counting the outcome of a lookup, one of the keys of stats.
+        '''
+        with self._lock:
+            self.stats[outcome] += 1
+
+    def get(self, property_id):
+        with self._lock:
+            row = self._conn.execute('SELECT {} FROM listings WHERE property_id = ?'.format(', '.join(COLUMNS)), (str(property_id),)).fetchone()
+        return None if row is None else dict(zip(COLUMNS, row))
+
+    def is_fresh(self, entry, now=None):
+        if self.recheck_after is None or entry is None or entry['last_fetched'] is None:
+            return False
+        return (now or time.time()) - entry['last_fetched'] < self.recheck_after
+
+    def conditional_headers(self, entry):
+        headers = {}
+        if entry is not None:
+            if entry['etag']:
+                headers['If-None-Match'] = entry['etag']
+            if entry['last_modified']:
+                headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def touch(self, property_id, cluster_id, url, seen_at=None):
+        '''
+        Marking the listing as seen, keeping its fetch state.
+        '''
+        seen_at = seen_at or time.time()
+        with self._lock:
+            self._conn.execute('''INSERT INTO listings (property_id, cluster_id, url, first_seen, last_seen) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (property_id) DO UPDATE SET cluster_id = COALESCE(excluded.cluster_id, cluster_id),
+                url = excluded.url, last_seen = MAX(last_seen, excluded.last_seen)''',
+                               (str(property_id), cluster_id, url, seen_at, seen_at))
+
+    def record_fetch(self, property_id, cluster_id, url, content_hash, etag=None, last_modified=None):
+        now = time.time()
+        with self._lock:
+            self._conn.execute('''INSERT INTO listings VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (property_id) DO UPDATE SET cluster_id = COALESCE(excluded.cluster_id, cluster_id),
+                url = excluded.url, last_seen = excluded.last_seen, last_fetched = excluded.last_fetched,
+                content_hash = excluded.content_hash, etag = excluded.etag, last_modified = excluded.last_modified''',
+                               (str(property_id), cluster_id, url, now, now, now, content_hash, etag, last_modified))
+
+    def ingest_snapshot(self, path):
+        '''
+        Adding the listings of a stored snapshot (raw.csv or Parquet of records with a property_id column) as fetched
+        at their timestamp, along with the record_hash of their fields. Within recheck_after of the snapshot they
+        are not fetched again, later they are reported only if their record changed.
+        '''
+        import pandas as pd
+        if path.endswith('.parquet'):
+            snapshot = pd.read_parquet(path)
+        else:
+            snapshot = pd.read_csv(path, dtype=str)
+        if 'property_id' not in snapshot.columns:
+            raise ValueError('Please specify a snapshot with a property_id column, {} has none.'.format(path))
+        now = time.time()
+        rows = []
+        for record in snapshot.dropna(subset=['property_id']).to_dict('records'):
+            record = {k: v for k, v in record.items() if not pd.isna(v)}
+            fetched_at = _parse_timestamp(record.get('timestamp'))
+            seen_at = fetched_at or now
+            rows.append((str(record['property_id']), None if record.get('cluster_id') is None else str(record['cluster_id']),
+                         record.get('property_url'), seen_at, seen_at, fetched_at, record_hash(record)))
+        with self._lock:
+            self._conn.execute('BEGIN')
+            # the fetch state of the latest snapshot wins, whatever order the snapshots are ingested in
+            self._conn.executemany('''INSERT INTO listings (property_id, cluster_id, url, first_seen, last_seen, last_fetched, content_hash)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (property_id) DO UPDATE SET cluster_id = COALESCE(excluded.cluster_id, cluster_id),
+                first_seen = MIN(first_seen, excluded.first_seen), last_seen = MAX(last_seen, excluded.last_seen),
+                content_hash = CASE WHEN last_fetched IS NULL OR excluded.last_fetched >= last_fetched THEN excluded.content_hash ELSE content_hash END,
+                last_fetched = CASE WHEN last_fetched IS NULL OR excluded.last_fetched >= last_fetched THEN excluded.last_fetched ELSE last_fetched END''',
+                                   rows)
+            self._conn.execute('COMMIT')
+        return len(rows)
+
+    def ingest_output_dir(self, output_dir):
+        '''
+        Adding every snapshot of the output/<date>/data/ layout.
+        '''
+        paths = sorted(glob.glob(os.path.join(output_dir, '*', 'data', 'raw*.csv')) + glob.glob(os.path.join(output_dir, '*', 'data', 'raw*.parquet')))
+        return sum(self.ingest_snapshot(path) for path in paths)
@@ -0,0 +1,162 @@
+import random
+import re
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+from . import fixtures
+
+# Local stand-in of ingatlan.com ('hun') and realestate.hu ('eng') serving the synthetic pages of fixtures,
+# so every code path can be driven end to end without the live sites.
+
+HOMEPAGE = 'homepage'
+RESULT_PAGE = 'result_page'
+DETAIL_PAGE = 'detail_page'
+PHOTO = 'photo'
+
+_ROUTES = {'hun': [(re.compile(r'^$'), HOMEPAGE),
+                   (re.compile(r'^lista/[^/]+$'), RESULT_PAGE),
+                   (re.compile(r'^photo/large/(\d+)_(\d+)\.jpg$'), PHOTO),
+                   (re.compile(r'^(\d+)$'), DETAIL_PAGE)],
+           'eng': [(re.compile(r'^$'), HOMEPAGE),
+                   (re.compile(r'^search$'), RESULT_PAGE),
+                   (re.compile(r'^images/(\d+)/(\d+)$'), PHOTO),
+                   (re.compile(r'^en/[^/]+/(\d+)$'), DETAIL_PAGE)]}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # headers and body go out in separate writes, delayed ACKs would add 40 ms to each response otherwise
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        site = self.server.site
+        parts = urlsplit(self.path)
+        lang, _, path = parts.path.lstrip('/').partition('/')
+        kind, match = site.route(lang, path)
+        if kind is None:
+            return self._send(404, b'Not found')
+        site._count(kind)
+        delay, error = site._draw(kind)
+        if delay:
+            time.sleep(delay)
+        if error:
+            site._count('errors')
+            return self._send(site.error_status, b'Simulated error', {'Retry-After': '0'})
+        query = parse_qs(parts.query)
+        if kind == HOMEPAGE:
+            body = fixtures.homepage(lang)
+        elif kind == RESULT_PAGE:
+            body = fixtures.result_page(lang, int(query.get('page', ['1'])[0]), max_listing=site.max_listing)
+        elif kind == DETAIL_PAGE:
+            body = fixtures.detail_page(lang, int(match.group(1)), num_photos=site.num_photos, photo_base=site.url(lang))
+        else:
+            body = fixtures.photo(int(match.group(1)), int(match.group(2)), size=site.photo_size)
+        content_type = 'image/jpeg' if kind == PHOTO else 'text/html; charset=utf-8'
+        self._send(200, body, {'Content-Type': content_type, 'ETag': '"{:08x}"'.format(zlib.crc32(body))})
+
+    def _send(self, status, body, headers=None):
+        self.send_response(status)
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class LocalSite:
+    '''
+    HTTP server on localhost standing in for both sites: homepage, paginated result pages, detail pages and photo
+    blobs of fixtures, under http://127.0.0.1:<port>/<lang>/. Pass url(lang) as the url of RealEstateHungarySettings.
+
+    Parameters
+    ----------
+    latency : float
+        Mean delay of the responses in seconds.
+    jitter : float
+        Responses are delayed uniformly within latency +- jitter.
+    error_rate : float
+        Fraction of the requests answered with error_status instead of the page.
+    error_status : int
+        Status of the simulated errors, 503 by default which the transport retries.
+    max_listing : int
+        Number of listings of every search, sets the pagination.
+    num_photos : int
+    photo_size : int
+        Photos of every property and their size in bytes.
+    port : int
+        0 picks a free port.
+    seed : int
+        Seed of the simulated latency and errors.
+
+    Examples
+    --------
+    >>> with LocalSite(latency=0.05, error_rate=0.01) as site:
+    ...     settings=RealEstateHungarySettings('hun', url=site.url('hun'), cache_dir=None)
+    ...     page=RealEstateHungaryPageListings(settings, 'budapest', 'elado', 'lakas', 1)
+    ...     df=page.listings_to_df(concurrency='threads')
+    '''
+    def __init__(self, latency=0., jitter=0., error_rate=0., error_status=503, max_listing=13382, num_photos=12,
+                 photo_size=150000, port=0, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.max_listing = max_listing
+        self.num_photos = num_photos
+        self.photo_size = photo_size
+        self.port = port
+        self.stats = {HOMEPAGE: 0, RESULT_PAGE: 0, DETAIL_PAGE: 0, PHOTO: 0, 'errors': 0}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    def __repr__(self):
+        return 'LocalSite(port={0}, stats={1})'.format(self.port, self.stats)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def start(self):
+        self._server = ThreadingHTTPServer(('127.0.0.1', self.port), _Handler)
+        self._server.daemon_threads = True
+        self._server.site = self
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, name='localsite', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join()
+            self._server = None
+
+    def url(self, lang):
+        return 'http://127.0.0.1:{0}/{1}/'.format(self.port, lang)
+
+    def route(self, lang, path):
+        for pattern, kind in _ROUTES.get(lang, ()):
+            match = pattern.match(path)
+            if match is not None:
+                return kind, match
+        return None, None
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def _draw(self, kind):
+        with self._lock:
+            delay = max(self.latency + self._random.uniform(-self.jitter, self.jitter), 0.) if self.latency or self.jitter else 0.
+            error = kind != HOMEPAGE and self.error_rate > 0 and self._random.random() < self.error_rate
+        return delay, error
@@ -0,0 +1,244 @@
+import bisect
+import contextlib
+import functools
+import io
+import json
+import threading
+import time
+
+# Instrumentation of the scraping stages: network, parsing, field extraction, records and photos. Disabled until
+# enable_metrics is called, an instrumented call then costs a global lookup. Worker processes of the Pipeline
+# record into their own registry, which is not collected.
+
+SECONDS_BUCKETS = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1., 2.5, 5., 10., 30.)
+BYTES_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+HELP = {'http_request_seconds': 'Latency of the page downloads.',
+        'http_response_bytes': 'Size of the downloaded pages.',
+        'http_responses_total': 'Downloads by HTTP status.',
+        'parse_seconds': 'Time of building the document tree.',
+        'document_bytes': 'Size of the parsed documents.',
+        'locate_seconds': 'Time of locating the regions of the fields in the document tree.',
+        'field_seconds': 'Time of extracting a field of a property page, once its region is located.',
+        'record_seconds': 'Time of scraping a property into a record, download included.',
+        'records_total': 'Scraped records.',
+        'photos_seconds': 'Time of downloading the photos of a property.',
+        'photo_download_seconds': 'Time of downloading a photo.',
+        'photo_bytes': 'Size of the downloaded photos.'}
+
+
+def _labels_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{{{}}}'.format(','.join('{0}="{1}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"')) for k, v in pairs))
+
+
+class Metrics:
+    '''
+    Registry of counters and histograms, labelled like Prometheus metrics and exported in its text format or as JSON.
+
+    Histograms named *_bytes use BYTES_BUCKETS, the others SECONDS_BUCKETS unless buckets gives their own.
+
+    Parameters
+    ----------
+    buckets : dict, optional
+        Upper bounds of the histogram buckets by metric name.
+
+    Examples
+    --------
+    >>> metrics=enable_metrics()
+    >>> df=page.listings_to_df()
+    >>> print(metrics.to_prometheus())
+    >>> metrics.dump('crawl_metrics.json')
+    '''
+    def __init__(self, buckets=None):
+        self.buckets = dict(buckets or {})
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+
+    def __repr__(self):
+        return 'Metrics(counters={0}, histograms={1})'.format(len(self._counters), len(self._histograms))
+
+    def _buckets_of(self, name):
+        if name not in self.buckets:
+            self.buckets[name] = BYTES_BUCKETS if name.endswith('_bytes') else SECONDS_BUCKETS
+        return self.buckets[name]
+
+    def count(self, name, value=1, **labels):
+        key = (name, _labels_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, _labels_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                buckets = self._buckets_of(name)
+                histogram = self._histograms[key] = {'buckets': [0] * (len(buckets) + 1), 'sum': 0., 'count': 0}
+            histogram['buckets'][bisect.bisect_left(self._buckets_of(name), value)] += 1
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def to_dict(self):
+        '''
+        Counters and histograms with their labels, the bucket counts are cumulative as in Prometheus.
+        '''
+        with self._lock:
+            counters = [{'name': name, 'labels': dict(labels), 'value': value} for (name, labels), value in sorted(self._counters.items())]
+            histograms = []
+            for (name, labels), histogram in sorted(self._histograms.items()):
+                cumulative, total = [], 0
+                for bound, n in zip(list(self._buckets_of(name)) + ['+Inf'], histogram['buckets']):
+                    total += n
+                    cumulative.append([bound, total])
+                histograms.append({'name': name, 'labels': dict(labels), 'buckets': cumulative,
+                                   'sum': histogram['sum'], 'count': histogram['count']})
+        return {'timestamp': time.time(), 'counters': counters, 'histograms': histograms}
+
+    def to_prometheus(self):
+        data = self.to_dict()
+        lines = []
+        described = set()
+        def describe(name, kind):
+            if name not in described:
+                described.add(name)
+                if name in HELP:
+                    lines.append('# HELP {0} {1}'.format(name, HELP[name]))
+                lines.append('# TYPE {0} {1}'.format(name, kind))
+        for counter in data['counters']:
+            describe(counter['name'], 'counter')
+            lines.append('{0}{1} {2}'.format(counter['name'], _format_labels(counter['labels'].items()), counter['value']))
+        for histogram in data['histograms']:
+            name, labels = histogram['name'], histogram['labels'].items()
+            describe(name, 'histogram')
+            for bound, n in histogram['buckets']:
+                lines.append('{0}_bucket{1} {2}'.format(name, _format_labels(labels, [('le', bound)]), n))
+            lines.append('{0}_sum{1} {2}'.format(name, _format_labels(labels), histogram['sum']))
+            lines.append('{0}_count{1} {2}'.format(name, _format_labels(labels), histogram['count']))
+        return '\n'.join(lines) + '\n'
+
+    def to_json(self, indent=1):
+        return json.dumps(self.to_dict(), indent=indent)
+
+    def dump(self, path):
+        '''
+        Writing the metrics to path, in the Prometheus text format if it ends with .prom, as JSON otherwise.
+        '''
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(self.to_prometheus() if path.endswith('.prom') else self.to_json())
+
+    def summary(self):
+        '''
+        DataFrame of the timings: count, total and mean seconds by stage and labels, the slowest stages first.
+        '''
+        import pandas as pd
+        rows = [{'name': h['name'], 'labels': ','.join('{0}={1}'.format(k, v) for k, v in h['labels'].items()),
+                 'count': h['count'], 'sum': h['sum'], 'mean': h['sum'] / h['count'] if h['count'] else None}
+                for h in self.to_dict()['histograms'] if h['name'].endswith('_seconds')]
+        return pd.DataFrame(rows, columns=['name', 'labels', 'count', 'sum', 'mean']).sort_values('sum', ascending=False, ignore_index=True)
+
+
+_metrics = None
+
+
+def enable_metrics(metrics=None):
+    '''
+    Recording the instrumented stages into metrics, a new Metrics registry by default. Returns the registry.
+    '''
+    global _metrics
+    _metrics = metrics if metrics is not None else Metrics()
+    return _metrics
+
+
+def disable_metrics():
+    global _metrics
+    _metrics = None
+
+
+def get_metrics():
+    return _metrics
+
+
+def count(name, value=1, **labels):
+    if _metrics is not None:
+        _metrics.count(name, value, **labels)
+
+
+def observe(name, value, **labels):
+    if _metrics is not None:
+        _metrics.observe(name, value, **labels)
+
+
+def timed(name, **labels):
+    '''
+    Decorator observing the duration of the calls in the histogram name while metrics are enabled.
+    '''
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            metrics = _metrics
+            if metrics is None:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                metrics.observe(name, time.perf_counter() - start, **labels)
+        return wrapper
+    return decorator
+
+
+@contextlib.contextmanager
+def profile(path, backend='cprofile', sort='cumulative', limit=60):
+    '''
+    Profiling the block and writing its hot paths to path. With cProfile the report is the limit slowest functions
+    by sort, or the raw stats if path ends with .prof; with pyinstrument it is its call tree, HTML if path ends with .html.
+
+    Examples
+    --------
+    >>> with profile('crawl_profile.txt'):
+    ...     crawler.run()
+    '''
+    if backend == 'cprofile':
+        import cProfile
+        import pstats
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield profiler
+        finally:
+            profiler.disable()
+            if path.endswith('.prof'):
+                profiler.dump_stats(path)
+            else:
+                report = io.StringIO()
+                pstats.Stats(profiler, stream=report).strip_dirs().sort_stats(sort).print_stats(limit)
+                with open(path, 'w', encoding='utf-8') as f:
+                    f.write(report.getvalue())
+    elif backend == 'pyinstrument':
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            raise ImportError('Please install pyinstrument to profile with it.')
+        profiler = Profiler()
+        profiler.start()
+        try:
+            yield profiler
+        finally:
+            profiler.stop()
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(profiler.output_html() if path.endswith('.html') else profiler.output_text(unicode=True))
+    else:
+        raise ValueError("Please specify backend as one of the following: 'cprofile', 'pyinstrument'.")
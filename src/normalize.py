@@ -0,0 +1,198 @@
+import datetime
+import functools
+import numpy as np
+import pandas as pd
+
+# Typed columns of the scraped raw strings. The columns of both languages are coalesced first, e.g. floor is
+# parsed from emelet ('hun') or floors ('eng'), so a snapshot mixing the two sites is normalized at once.
+
+SOURCES = {'price_huf': ['price_in_huf'],
+           'price_eur': ['price_in_eur'],
+           'area_size': ['area_size'],
+           'lot_size': ['lot_size'],
+           'balcony_size': ['erkély'],
+           'room': ['room'],
+           'floor': ['emelet', 'floors'],
+           'year_built': ['építés_éve', 'year_built'],
+           'heating': ['fűtés', 'type_of_heating'],
+           'condition': ['ingatlan_állapota', 'condition_of_real_estate']}
+
+CATEGORIES = ['lang', 'listing_type', 'property_type', 'city_district', 'heating', 'condition', 'year_built']
+# the <transport mode>_count columns are Int16 as well
+COUNTS = {'photos': 'Int16', 'page_num': 'Int32', 'max_page': 'Int32', 'max_listing': 'Int32'}
+
+# multipliers of the price units, 'M Ft' on ingatlan.com, plain 'HUF'/'EUR' on realestate.hu
+PRICE_UNITS = {'': 1, 'e': 10 ** 3, 'ezer': 10 ** 3, 'm': 10 ** 6, 'millió': 10 ** 6, 'mrd': 10 ** 9, 'milliárd': 10 ** 9}
+
+# floors without a number, 10 felett (above the 10th) counts as the 11th
+FLOOR_WORDS = {'földszint': 0., 'ground floor': 0., 'magasföldszint': 0.5, 'félemelet': 0.5, 'mezzanine': 0.5,
+               'szuterén': -1., 'basement': -1., 'semi-basement': -1., '10 felett': 11.}
+
+# 'hun' writes 1 250 000 and 4,5 ('|' in param_details), 'eng' writes 1,250,000 and 4.5
+NUMBERS = {'hun': r'(-?\d[\d\s\xa0]*(?:[.,|]\d+)?)',
+           'eng': r'(-?\d{1,3}(?:,\d{3})+(?:\.\d+)?|-?\d[\d\s\xa0]*(?:\.\d+)?)'}
+
+
+def _coalesce(df, columns):
+    present = [c for c in columns if c in df.columns]
+    if not present:
+        return None
+    series = df[present[0]]
+    for column in present[1:]:
+        series = series.where(series.notna(), df[column])
+    return series
+
+
+def _on_uniques(series, parse, langs=None):
+    '''
+    Applying the vectorized parse to the distinct values only and broadcasting the results back by their codes.
+    The scraped strings repeat a lot, so a million rows are typically a few thousand values to parse.
+    Given the languages of the rows, the rows of each language are parsed with its number format.
+    '''
+    if langs is not None:
+        langs = langs.astype(object).fillna('').to_numpy(dtype=str)
+        keys = pd.unique(langs)
+        if len(keys) <= 1:
+            return _on_uniques(series, functools.partial(parse, lang=keys[0]) if len(keys) else parse)
+        results = {}
+        for lang in keys:
+            mask = langs == lang
+            parsed = _on_uniques(series[mask], functools.partial(parse, lang=lang))
+            for key, values in (parsed.items() if isinstance(parsed, dict) else [(None, parsed)]):
+                results.setdefault(key, np.full(len(series), np.nan))[mask] = values.to_numpy(dtype=float)
+        results = {key: pd.Series(values, index=series.index) for key, values in results.items()}
+        return results if len(results) > 1 or None not in results else results[None]
+    codes, uniques = pd.factorize(series)
+    parsed = parse(pd.Series(uniques, dtype=object).astype(str))
+    if isinstance(parsed, pd.Series):
+        parsed = {None: parsed}
+    results = {}
+    for key, values in parsed.items():
+        values = np.append(values.to_numpy(dtype=float), np.nan)
+        results[key] = pd.Series(values[codes], index=series.index)
+    return results if len(results) > 1 or None not in results else results[None]
+
+
+def to_number(strings, lang='hun'):
+    '''
+    First number of each string. 'hun' has space as thousands separator and ',' or '|' as decimal mark, 'eng' has
+    ',' or space as thousands separator and '.' as decimal mark. Other languages are read as 'hun'.
+    '''
+    if lang == 'eng':
+        numbers = strings.str.extract(NUMBERS['eng'], expand=False).str.replace(r'[\s\xa0,]', '', regex=True)
+    else:
+        numbers = strings.str.extract(NUMBERS['hun'], expand=False).str.replace(r'[\s\xa0]', '', regex=True).str.replace(r'[,|]', '.', regex=True)
+    return pd.to_numeric(numbers, errors='coerce')
+
+
+def parse_price(strings, lang='hun'):
+    units = strings.str.lower().str.extract(r'\d\s*(mrd|milliárd|millió|ezer|m|e)?\s*(?:ft|huf|eur|€)', expand=False).fillna('')
+    return to_number(strings, lang) * units.map(PRICE_UNITS).astype(float)
+
+
+def parse_room(strings):
+    # '2 + 1 fél', '3' or '2 fél', the number before fél is of half rooms only
+    rooms = strings.str.extract(r'^\s*(?:(\d+)(?!\d|\s*fél))?\s*(?:\+\s*)?(?:(\d+)\s*fél)?', expand=True)
+    return {'rooms': pd.to_numeric(rooms[0], errors='coerce'), 'half_rooms': pd.to_numeric(rooms[1], errors='coerce')}
+
+
+def parse_floor(strings, lang='hun'):
+    lower = strings.str.strip().str.lower()
+    return lower.map(FLOOR_WORDS).fillna(to_number(lower, lang)).astype(float)
+
+
+def parse_year_built(strings, this_year=None):
+    '''
+    Bounds of the construction year buckets: '1950 előtt', '1950 és 1980 között', '1981-2000', '2016', '50+ years'.
+    An open end is NaN.
+    '''
+    this_year = this_year or datetime.date.today().year
+    lower = strings.str.strip().str.lower()
+    years = lower.str.extract(r'(\d{4})\D*(\d{4})?', expand=True).apply(pd.to_numeric, errors='coerce')
+    before = lower.str.contains('előtt') | lower.str.contains('before')
+    after = lower.str.contains('után') | lower.str.contains('after')
+    year_min = years[0].where(~before)
+    year_max = years[1].fillna(years[0]).where(~after)
+    year_max = year_max.where(~before, years[0] - 1)
+    age = pd.to_numeric(lower.str.extract(r'^(\d+)\+\s*years', expand=False), errors='coerce')
+    year_max = year_max.fillna(this_year - age)
+    new = lower.str.contains('newly built') | lower.str.contains('új építésű')
+    year_min = year_min.where(~new, this_year - 1)
+    return {'year_built_min': year_min, 'year_built_max': year_max.where(~new, this_year)}
+
+
+def normalize(df, keep_raw=False):
+    '''
+    Typed copy of a DataFrame of records, from listings_to_df or a stored snapshot of either language.
+
+    Prices become nullable int64 HUF/EUR, sizes float32 square meters, rooms and half rooms nullable int8, the floor
+    float32 (0 for the ground floor), the construction year bounds float32, and heating, condition and the other
+    low-cardinality strings categories. price_per_m2 is price_huf over area_size. Numbers are read in the format
+    of the lang column, 'hun' without it. The parsed raw columns are dropped unless keep_raw, the rest of the
+    columns are kept as they are.
+
+    Examples
+    --------
+    >>> df=normalize(page.listings_to_df())
+    >>> df[['price_huf', 'area_size', 'price_per_m2']].head(1)
+       price_huf  area_size  price_per_m2
+    0   56400000       52.0  1084615.375
+    '''
+    out = {}
+    parsed_sources = set()
+    langs = df['lang'] if 'lang' in df.columns else None
+    def source(name):
+        columns = SOURCES[name]
+        parsed_sources.update(c for c in columns if c in df.columns)
+        return _coalesce(df, columns)
+    for name, parse in (('price_huf', parse_price), ('price_eur', parse_price)):
+        series = source(name)
+        if series is not None:
+            out[name] = _on_uniques(series, parse, langs).round().astype('Int64')
+    for name in ('area_size', 'lot_size', 'balcony_size'):
+        series = source(name)
+        if series is not None:
+            out[name] = _on_uniques(series, to_number, langs).astype('float32')
+    series = source('room')
+    if series is not None:
+        for name, values in _on_uniques(series, parse_room).items():
+            out[name] = values.astype('Int8')
+    series = source('floor')
+    if series is not None:
+        out['floor'] = _on_uniques(series, parse_floor, langs).astype('float32')
+    series = source('year_built')
+    if series is not None:
+        for name, values in _on_uniques(series, parse_year_built).items():
+            out[name] = values.astype('float32')
+        out['year_built'] = series
+    for name in ('heating', 'condition'):
+        series = source(name)
+        if series is not None:
+            out[name] = series
+    if 'price_huf' in out and 'area_size' in out:
+        area = out['area_size'].where(out['area_size'] > 0)
+        out['price_per_m2'] = (out['price_huf'].astype('float64') / area).astype('float32')
+    kept = [c for c in df.columns if keep_raw or c not in parsed_sources]
+    typed = pd.concat([df[kept], pd.DataFrame(out, index=df.index)], axis=1)
+    typed = typed.loc[:, ~typed.columns.duplicated(keep='last')]
+    for name in CATEGORIES:
+        if name in typed.columns:
+            typed[name] = typed[name].astype('category')
+    for name in typed.columns:
+        dtype = COUNTS.get(name, 'Int16' if name.endswith('_count') else None)
+        if dtype is not None:
+            typed[name] = pd.to_numeric(typed[name], errors='coerce').astype(dtype)
+    if 'timestamp' in typed.columns:
+        typed['timestamp'] = pd.to_datetime(typed['timestamp'], errors='coerce')
+    return typed
+
+
+def normalize_snapshot(path, keep_raw=False):
+    '''
+    Typed DataFrame of a stored raw.csv or Parquet snapshot.
+    '''
+    if path.endswith('.parquet'):
+        df = pd.read_parquet(path)
+    else:
+        df = pd.read_csv(path, dtype=str)
+    return normalize(df, keep_raw)
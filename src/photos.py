@@ -0,0 +1,209 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from . import metrics
+from .scheduler import PHOTO
+from .transport import get_default_session
+
+
+class _ByteRateLimiter:
+    '''
+    Spreading the downloaded bytes of all workers evenly over time, at most rate bytes per second.
+    '''
+    def __init__(self, rate):
+        self.rate = rate
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, num_bytes):
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + num_bytes / self.rate
+        if start > now:
+            time.sleep(start - now)
+
+
+class PhotoDownloader:
+    '''
+    Downloading photos in a bounded pool of workers, streaming the bodies to disk in chunks.
+
+    A photo is skipped when its file already exists with the size and ETag recorded in the manifest (the server is
+    asked with If-None-Match when there is an ETag), or, for files from earlier runs without a manifest entry, when
+    its size equals the Content-Length of the response. Identical images of different listings are stored once:
+    the file of an already downloaded image with the same sha256 is hard linked instead, or kept as a copy where the
+    file system has no hard links. The hash is known only once the body is downloaded, so this saves disk, not
+    bandwidth. The manifest lists only the photos downloaded completely.
+
+    Parameters
+    ----------
+    save_dir : string
+        Directory of the photos.
+    max_workers : int
+        Number of simultaneous downloads.
+    max_bytes_per_sec : float, optional
+        Bandwidth limit shared by all workers.
+    chunk_size : int
+        Size of the chunks streamed to disk.
+    session : transport.Session, optional
+        Shared transport, defaults to the module wide session.
+    manifest_path : string, optional
+        JSON manifest mapping property ids to their photo files, defaults to manifest.json in save_dir.
+
+    Examples
+    --------
+    >>> downloader=PhotoDownloader('photos', max_workers=8, max_bytes_per_sec=2*1024**2)
+    >>> downloader.submit('31337', [('https://img.ingatlan.com/photo/large/1.jpg', '1_1.jpg')])
+    >>> downloader.close()
+    '''
+    def __init__(self, save_dir, max_workers=8, max_bytes_per_sec=None, chunk_size=64 * 1024, session=None, manifest_path=None):
+        self.save_dir = save_dir
+        os.makedirs(save_dir, exist_ok=True)
+        self.chunk_size = chunk_size
+        self.session = session if session is not None else get_default_session()
+        self.manifest_path = manifest_path or os.path.join(save_dir, 'manifest.json')
+        self._limiter = _ByteRateLimiter(max_bytes_per_sec) if max_bytes_per_sec else None
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._futures = []
+        self._lock = threading.Lock()
+        self.manifest = self._load_manifest()
+        self.stats = {'downloaded': 0, 'skipped': 0, 'deduplicated': 0, 'failed': 0, 'bytes': 0}
+
+    def __repr__(self):
+        return 'PhotoDownloader({0}, stats={1})'.format(self.save_dir, self.stats)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def _load_manifest(self):
+        try:
+            with open(self.manifest_path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {'properties': {}, 'files': {}, 'hashes': {}}
+
+    def save_manifest(self):
+        with self._lock:
+            manifest = json.dumps(self.manifest)
+        tmp_path = '{0}.{1}.tmp'.format(self.manifest_path, os.getpid())
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(manifest)
+        os.replace(tmp_path, self.manifest_path)
+
+    def submit(self, property_id, photos):
+        '''
+        Queueing the (url, file name) pairs of a property, returns immediately.
+        '''
+        property_id = str(property_id)
+        futures = [self._executor.submit(self._download_safely, property_id, url, file_name) for url, file_name in photos]
+        with self._lock:
+            self._futures.extend(futures)
+        return futures
+
+    def _download_safely(self, property_id, url, file_name):
+        try:
+            entry = self.download(url, file_name)
+        except Exception as err:
+            with self._lock:
+                self.stats['failed'] += 1
+            return {'url': url, 'file': file_name, 'error': repr(err)}
+        with self._lock:
+            files = self.manifest['properties'].setdefault(property_id, [])
+            if file_name not in files:
+                files.append(file_name)
+        return entry
+
+    @metrics.timed('photo_download_seconds')
+    def download(self, url, file_name):
+        path = os.path.join(self.save_dir, file_name)
+        with self._lock:
+            entry = self.manifest['files'].get(file_name)
+        exists = os.path.exists(path)
+        headers = {}
+        if exists and entry is not None and entry.get('size') == os.path.getsize(path):
+            if not entry.get('etag'):
+                return self._skip(entry)
+            headers['If-None-Match'] = entry['etag']
+        with self.session.stream(url, headers=headers, chunk_size=self.chunk_size, priority=PHOTO) as resp:
+            if resp.status == 304:
+                return self._skip(entry)
+            length = resp.headers.get('Content-Length')
+            if exists and entry is None and length is not None and int(length) == os.path.getsize(path):
+                entry = {'url': url, 'size': int(length), 'etag': resp.headers.get('ETag'), 'sha256': None}
+                with self._lock:
+                    self.manifest['files'][file_name] = entry
+                return self._skip(entry)
+            tmp_path = '{}.part'.format(path)
+            try:
+                sha256 = hashlib.sha256()
+                size = 0
+                with open(tmp_path, 'wb') as f:
+                    for chunk in resp.content:
+                        if self._limiter is not None:
+                            self._limiter.consume(len(chunk))
+                        f.write(chunk)
+                        sha256.update(chunk)
+                        size += len(chunk)
+                etag = resp.headers.get('ETag')
+                digest = sha256.hexdigest()
+                with self._lock:
+                    self.stats['bytes'] += size
+                    original = self.manifest['hashes'].get(digest)
+                metrics.observe('photo_bytes', size)
+                self._place(tmp_path, path, original if original != file_name else None)
+            finally:
+                # an interrupted download leaves no partial file behind
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+        entry = {'url': url, 'size': size, 'etag': etag, 'sha256': digest}
+        with self._lock:
+            known = self.manifest['hashes'].get(digest)
+            if known is None or not os.path.exists(os.path.join(self.save_dir, known)):
+                self.manifest['hashes'][digest] = file_name
+            self.manifest['files'][file_name] = entry
+        return entry
+
+    def _place(self, tmp_path, path, original):
+        '''
+        Moving the downloaded file to path, or hard linking the file of the same image downloaded earlier.
+        '''
+        original_path = None if original is None else os.path.join(self.save_dir, original)
+        if original_path is not None and os.path.exists(original_path):
+            try:
+                if os.path.exists(path):
+                    os.remove(path)
+                os.link(original_path, path)
+            except OSError:
+                pass
+            else:
+                os.remove(tmp_path)
+                with self._lock:
+                    self.stats['deduplicated'] += 1
+                return
+        os.replace(tmp_path, path)
+        with self._lock:
+            self.stats['downloaded'] += 1
+
+    def _skip(self, entry):
+        with self._lock:
+            self.stats['skipped'] += 1
+        return entry
+
+    def wait(self):
+        with self._lock:
+            futures, self._futures = self._futures, []
+        wait(futures)
+        self.save_manifest()
+        return [f.result() for f in futures]
+
+    def close(self):
+        results = self.wait()
+        self._executor.shutdown()
+        return results
@@ -0,0 +1,246 @@
+import asyncio
+import multiprocessing
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, BrokenExecutor
+from urllib.error import HTTPError
+from .scheduler import DETAIL
+from .scraper import RealEstateHungarySettings, RealEstateHungaryPageListings, RealEstateHungary, RequestWithHeaders, \
+    records_to_df, remove_spec_chars
+
+_DONE = object()
+
+# settings of the worker processes by language, created once from the options sent along with the jobs
+_worker_settings = {}
+
+
+def extract_record(page_params, options, url, content, page_attrs, ids, parser=None):
+    '''
+    Extraction of a fetched property page in a worker process. Only plain data crosses the process boundary:
+    the record dict and the (url, file name) pairs of the photos are returned, never the parsed document.
+    '''
+    lang = page_params['lang']
+    settings = _worker_settings.get(lang)
+    if settings is None or settings.options != options:
+        settings = _worker_settings[lang] = RealEstateHungarySettings.from_options(lang, options['listing_types'], options['property_types'])
+    page = RealEstateHungaryPageListings(settings, page_params['city'], page_params['listing_type'],
+                                         page_params['property_type'], page_params['page_num'], parser=parser)
+    single_property = RealEstateHungary(url, page, content=content, parser=parser)
+    record, photo_files = page._record_from_property(single_property, page_attrs, **ids), single_property.photo_files()
+    single_property.release()
+    return record, photo_files
+
+
+class _Failure:
+    def __init__(self, err):
+        self.err = err
+
+
+class Pipeline:
+    '''
+    Two-stage crawl of result pages: fetchers download the property pages as raw bytes, and a pool of processes
+    parses them and extracts the records, so parsing is not bound to the one core the GIL allows. Bounded queues
+    between the stages hold the fetchers back when parsing falls behind, and the fetchers back when the consumer
+    of the records does.
+
+    The fetchers are coroutines on an event loop, but the downloads are the blocking transport.Session calls run in
+    a thread pool with run_in_executor: the loop only coordinates the stages, the concurrency of the downloads is
+    the number of threads.
+
+    Result pages are fetched and parsed by the fetchers too, they are one in LISTINGS_PER_PAGE documents.
+    A listing (or result page) whose download or extraction fails is skipped, counted as failed and kept with its
+    error in failures, the others go on. An error of the stages themselves, e.g. of the consumer of the records or a
+    broken process pool, cancels all of them and is raised.
+
+    Parameters
+    ----------
+    processes : int, optional
+        Number of parsing processes, defaults to the number of cores.
+    fetchers : int
+        Number of simultaneous downloads.
+    queue_size : int, optional
+        Capacity of the queues between the stages, defaults to twice the number of processes.
+    session : transport.Session, optional
+        Transport of the downloads, defaults to the session of each page.
+    parser : string, optional
+        BeautifulSoup tree builder of the workers, one of PARSERS.
+    photo_downloader : photos.PhotoDownloader, optional
+        The photos of the extracted records are submitted to it.
+    mp_context : multiprocessing context, optional
+        Start method of the processes, defaults to spawn as forking a process with running threads is unsafe.
+
+    Examples
+    --------
+    >>> settings=RealEstateHungarySettings('hun')
+    >>> pages=[RealEstateHungaryPageListings(settings, 'budapest', 'elado', 'lakas', page_num) for page_num in range(1, 51)]
+    >>> pipeline=Pipeline(processes=8, fetchers=16)
+    >>> df=pipeline.to_df(pages)
+    >>> pipeline.stats
+    {'pages': 50, 'fetched': 1000, 'missing': 0, 'extracted': 1000, 'failed': 0}
+    '''
+    def __init__(self, processes=None, fetchers=8, queue_size=None, session=None, parser=None, photo_downloader=None, mp_context=None):
+        self.processes = processes or os.cpu_count() or 1
+        self.fetchers = fetchers
+        self.queue_size = queue_size or 2 * self.processes
+        self.session = session
+        self.parser = parser
+        self.photo_downloader = photo_downloader
+        self.mp_context = mp_context if mp_context is not None else multiprocessing.get_context('spawn')
+        self.stats = {'pages': 0, 'fetched': 0, 'missing': 0, 'extracted': 0, 'failed': 0}
+        self.failures = []
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return 'Pipeline(processes={0}, fetchers={1}, stats={2})'.format(self.processes, self.fetchers, self.stats)
+
+    def _count(self, key, value=1):
+        with self._lock:
+            self.stats[key] += value
+
+    def _fail(self, url, err):
+        with self._lock:
+            self.stats['failed'] += 1
+            self.failures.append((url, repr(err)))
+
+    def _page_jobs(self, page, num_listings):
+        # runs in a fetcher thread, the result page is downloaded and parsed here
+        page_params = {'lang': page.lang, 'city': page.city, 'listing_type': page.listing_type,
+                       'property_type': page.property_type, 'page_num': page.page_num}
+        options = page._real_estate_hun_settings.options
+        page_attrs = page.extract_attrs()
+        session = self.session if self.session is not None else page.session
+        jobs = [(session, page_params, options, url, page_attrs, ids) for url, ids in page._iter_listing_params(num_listings)]
+        self._count('pages')
+        return jobs
+
+    @staticmethod
+    def _fetch(session, url):
+        request = RequestWithHeaders(remove_spec_chars(url), session=session, priority=DETAIL)
+        try:
+            return request.get_http_resp_cont(request.url, request.headers, session=request.session, priority=request.priority)
+        except HTTPError as err:
+            if err.code == 404:
+                return None
+            raise
+
+    async def _run(self, pages, num_listings, emit, stop):
+        loop = asyncio.get_running_loop()
+        fetch_queue = asyncio.Queue(self.queue_size)
+        parse_queue = asyncio.Queue(self.queue_size)
+        num_parsers = 2 * self.processes
+
+        async def produce(io_executor):
+            for page in pages:
+                if stop.is_set():
+                    break
+                try:
+                    jobs = await loop.run_in_executor(io_executor, self._page_jobs, page, num_listings)
+                except Exception as err:
+                    self._fail(page.page_url, err)
+                    continue
+                for job in jobs:
+                    await fetch_queue.put(job)
+            for _ in range(self.fetchers):
+                await fetch_queue.put(None)
+
+        async def fetch(io_executor):
+            while True:
+                job = await fetch_queue.get()
+                if job is None:
+                    break
+                if stop.is_set():
+                    continue
+                session, page_params, options, url, page_attrs, ids = job
+                try:
+                    content = await loop.run_in_executor(io_executor, self._fetch, session, url)
+                except Exception as err:
+                    self._fail(url, err)
+                    continue
+                if content is None:
+                    self._count('missing')
+                    continue
+                self._count('fetched')
+                await parse_queue.put((page_params, options, url, content, page_attrs, ids))
+
+        async def parse(process_pool, io_executor):
+            while True:
+                item = await parse_queue.get()
+                if item is None:
+                    break
+                if stop.is_set():
+                    continue
+                try:
+                    record, photos = await asyncio.wrap_future(process_pool.submit(extract_record, *item, self.parser))
+                    if self.photo_downloader is not None:
+                        self.photo_downloader.submit(record.get('property_id') or record.get('property_url'), photos)
+                except BrokenExecutor:
+                    raise
+                except Exception as err:
+                    self._fail(item[2], err)
+                    continue
+                self._count('extracted')
+                await loop.run_in_executor(io_executor, emit, record)
+
+        async def close_parsers(fetchers):
+            await asyncio.gather(*fetchers)
+            for _ in range(num_parsers):
+                await parse_queue.put(None)
+
+        with ThreadPoolExecutor(max_workers=self.fetchers + num_parsers + 1) as io_executor, \
+                ProcessPoolExecutor(max_workers=self.processes, mp_context=self.mp_context) as process_pool:
+            fetchers = [asyncio.ensure_future(produce(io_executor))] + \
+                       [asyncio.ensure_future(fetch(io_executor)) for _ in range(self.fetchers)]
+            parsers = [asyncio.ensure_future(parse(process_pool, io_executor)) for _ in range(num_parsers)]
+            stages = fetchers + parsers + [asyncio.ensure_future(close_parsers(fetchers))]
+            done, pending = await asyncio.wait(stages, return_when=asyncio.FIRST_EXCEPTION)
+            # a failed stage would leave the others blocked on its queue, they are cancelled instead
+            for stage in pending:
+                stage.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            for stage in done:
+                if not stage.cancelled() and stage.exception() is not None:
+                    raise stage.exception()
+
+    def iter_records(self, pages, num_listings=None):
+        '''
+        Yielding the records of the listings on the given RealEstateHungaryPageListings objects as they are
+        extracted, in completion order. Properties not found (404) are skipped and counted as missing, the ones
+        failing otherwise are counted as failed and listed in failures.
+        '''
+        records = queue.Queue(self.queue_size)
+        stop = threading.Event()
+        def emit(record):
+            if not stop.is_set():
+                records.put(record)
+        def run():
+            try:
+                asyncio.run(self._run(pages, num_listings, emit, stop))
+            except BaseException as err:
+                records.put(_Failure(err))
+            finally:
+                records.put(_DONE)
+        thread = threading.Thread(target=run, name='pipeline', daemon=True)
+        thread.start()
+        try:
+            while True:
+                record = records.get()
+                if record is _DONE:
+                    break
+                if isinstance(record, _Failure):
+                    raise record.err
+                yield record
+        finally:
+            stop.set()
+            # unblocking the stages waiting to emit, then letting them wind down
+            while thread.is_alive():
+                try:
+                    records.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            thread.join()
+            if self.photo_downloader is not None:
+                self.photo_downloader.wait()
+
+    def to_df(self, pages, num_listings=None):
+        return records_to_df(list(self.iter_records(pages, num_listings)))
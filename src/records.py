@@ -0,0 +1,129 @@
+import collections.abc
+import functools
+import sqlite3
+import sys
+import threading
+import zlib
+from .index import content_hash
+
+# Compact records: the values of a record in a tuple, its keys in an index shared by every record of the same
+# columns, short strings interned. A record of 30 columns takes a fraction of the memory of a dict.
+
+INTERN_MAX_LENGTH = 64
+# column sets whose index is kept, records of an evicted one keep theirs, new records get a fresh copy
+MAX_SHARED_INDEXES = 1024
+
+
+@functools.lru_cache(maxsize=MAX_SHARED_INDEXES)
+def _shared_index(keys):
+    return {key: i for i, key in enumerate(keys)}
+
+
+class CompactRecord(collections.abc.Mapping):
+    '''
+    Read-only record with the interface of a dict, e.g. for records_to_df, ChunkedWriter or SpatialIndex.add_records.
+    Use dict(record) where a real dict is needed, e.g. for json.dumps.
+    '''
+    __slots__ = ('_index', '_values')
+
+    def __init__(self, keys, values):
+        self._index = _shared_index(tuple(keys))
+        self._values = tuple(values)
+
+    def __getitem__(self, key):
+        return self._values[self._index[key]]
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def __repr__(self):
+        return 'CompactRecord({})'.format(dict(self))
+
+    def __reduce__(self):
+        return CompactRecord, (tuple(self._index), self._values)
+
+
+class TextStore:
+    '''
+    Content-addressed store of long texts, e.g. the descriptions of the listings, compressed in SQLite.
+    Records keep the key of their text only, repeated texts are stored once.
+
+    Parameters
+    ----------
+    path : string
+        Path of the SQLite file, ':memory:' keeps the texts for the lifetime of the object.
+
+    Examples
+    --------
+    >>> texts=TextStore('descriptions.sqlite')
+    >>> page=RealEstateHungaryPageListings(settings, 'budapest', 'elado', 'lakas', 1, compact=True, desc=texts)
+    >>> df=texts.resolve(page.listings_to_df())
+    '''
+    def __init__(self, path=':memory:'):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=60., check_same_thread=False, isolation_level=None)
+        if path != ':memory:':
+            self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS texts (key TEXT PRIMARY KEY, text BLOB NOT NULL)')
+
+    def __repr__(self):
+        return 'TextStore({})'.format(self.path)
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM texts').fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def put(self, text):
+        data = text.encode('utf-8')
+        key = content_hash(data)[:32]
+        with self._lock:
+            self._conn.execute('INSERT OR IGNORE INTO texts VALUES (?, ?)', (key, zlib.compress(data)))
+        return key
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute('SELECT text FROM texts WHERE key = ?', (key,)).fetchone()
+        return None if row is None else zlib.decompress(row[0]).decode('utf-8')
+
+    def resolve(self, df, column='desc_ref', target='desc'):
+        '''
+        Copy of a DataFrame with the texts of the keys in column as target.
+        '''
+        df = df.copy()
+        if column in df.columns:
+            texts = {key: self.get(key) for key in df[column].dropna().unique()}
+            df[target] = df[column].map(texts)
+        return df
+
+
+def compact_record(record, desc=None):
+    '''
+    CompactRecord of a record dict. Strings are made plain str, short ones interned so repeated values such as
+    the district or the page attributes are shared. desc: None keeps the description as it is, 'intern' shares
+    repeated descriptions, a TextStore stores it out of line and the record keeps its key as desc_ref.
+    '''
+    keys, values = [], []
+    for key, value in record.items():
+        if isinstance(value, str):
+            value = str(value)
+            if key == 'desc':
+                if isinstance(desc, TextStore):
+                    key, value = 'desc_ref', desc.put(value)
+                elif desc == 'intern':
+                    value = sys.intern(value)
+            elif len(value) <= INTERN_MAX_LENGTH:
+                value = sys.intern(value)
+        keys.append(sys.intern(key))
+        values.append(value)
+    return CompactRecord(keys, values)
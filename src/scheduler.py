@@ -0,0 +1,227 @@
+import collections
+import heapq
+import itertools
+import threading
+import time
+from urllib.parse import urlsplit
+
+LISTING = 0
+DETAIL = 1
+PHOTO = 2
+PRIORITIES = (LISTING, DETAIL, PHOTO)
+
+THROTTLE_STATUSES = (429, 503)
+
+# the latency baseline of a host is the median of its last LATENCY_SAMPLES responses, once it has MIN_LATENCY_SAMPLES
+LATENCY_SAMPLES = 50
+MIN_LATENCY_SAMPLES = 5
+
+# requests per second of the hosts, the longest matching suffix of the host name applies
+DEFAULT_HOST_RATES = {'ingatlan.com': 2., 'realestate.hu': 2., 'img.ingatlan.com': 10.}
+# requests per second of the other hosts
+DEFAULT_RATE = 5.
+
+
+class _Host:
+    def __init__(self, name, rate, burst, concurrency):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.refilled_at = time.monotonic()
+        self.limit = float(concurrency)
+        self.in_flight = 0
+        self.blocked_until = 0.
+        self.waiting = []
+        self.latencies = collections.deque(maxlen=LATENCY_SAMPLES)
+        self.mean_latency = None
+        self.decreased_at = 0.
+        self.completed = collections.deque()
+        self.created_at = self.refilled_at
+        self.stats = {'requests': 0, 'throttled': 0, 'errors': 0, 'wait_sec': 0.}
+
+    def baseline_latency(self):
+        if len(self.latencies) < MIN_LATENCY_SAMPLES:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[len(ordered) // 2]
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.refilled_at) * self.rate)
+        self.refilled_at = now
+
+    def wait_time(self, now):
+        '''
+        Seconds until the next request may start, None when it has to wait for a running one to finish.
+        '''
+        if self.in_flight >= int(self.limit):
+            return None
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        self.refill(now)
+        if self.tokens < 1:
+            return (1 - self.tokens) / self.rate
+        return 0.
+
+
+class _Slot:
+    __slots__ = ('host', 'priority', 'started_at')
+
+    def __init__(self, host, priority, started_at):
+        self.host = host
+        self.priority = priority
+        self.started_at = started_at
+
+
+class Scheduler:
+    '''
+    Admission of the requests of all threads per host: a token bucket limits the request rate, an adaptive limit the
+    number of requests in flight, and waiting requests start in the order of their priority (LISTING, DETAIL, PHOTO).
+
+    The concurrency limit grows by one per limit successful requests and is halved on 429/503 responses, connection
+    errors and on latencies above latency_tolerance times the median of the recent ones (AIMD), at most once per mean
+    latency. The latency of a request is the time to its response headers, so body sizes do not count as congestion.
+    Retry-After pauses the whole host.
+
+    Parameters
+    ----------
+    host_rates : dict, optional
+        Requests per second by host name suffix, defaults to DEFAULT_HOST_RATES.
+    default_rate : float
+        Requests per second of the other hosts.
+    burst : float
+        Size of the token buckets, the number of requests allowed at once after an idle period.
+    initial_concurrency : int
+        Starting concurrency limit of a host.
+    min_concurrency : int
+    max_concurrency : int
+        Bounds of the adaptive concurrency limit.
+    latency_tolerance : float
+        Latency above this multiple of the median recent latency counts as congestion, None ignores the latency.
+    decrease_factor : float
+        Multiplier of the concurrency limit on congestion.
+    window : float
+        Seconds over which the achieved throughput is measured.
+
+    Examples
+    --------
+    >>> scheduler=Scheduler(host_rates={'ingatlan.com': 1.})
+    >>> set_default_session(Session(scheduler=scheduler))
+    >>> scheduler.stats()['ingatlan.com']
+    {'requests': 120, 'throttled': 2, 'errors': 0, 'wait_sec': 95.1, 'in_flight': 3, 'concurrency_limit': 3.4,
+     'rate_limit': 1.0, 'achieved_per_sec': 0.97, 'utilisation': 0.97, 'mean_latency': 0.41}
+    '''
+    def __init__(self, host_rates=None, default_rate=DEFAULT_RATE, burst=2., initial_concurrency=2, min_concurrency=1, max_concurrency=16,
+                 latency_tolerance=3., decrease_factor=0.5, window=30.):
+        self.host_rates = dict(DEFAULT_HOST_RATES if host_rates is None else host_rates)
+        self.default_rate = default_rate
+        self.burst = burst
+        self.initial_concurrency = initial_concurrency
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.latency_tolerance = latency_tolerance
+        self.decrease_factor = decrease_factor
+        self.window = window
+        self._hosts = {}
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    def __repr__(self):
+        return 'Scheduler(hosts={})'.format(sorted(self._hosts))
+
+    def rate_of(self, host):
+        matches = [suffix for suffix in self.host_rates if host == suffix or host.endswith('.' + suffix)]
+        if not matches:
+            return self.default_rate
+        return self.host_rates[max(matches, key=len)]
+
+    def _host(self, url):
+        host = (urlsplit(url).hostname or '').lower()
+        state = self._hosts.get(host)
+        if state is None:
+            state = self._hosts[host] = _Host(host, self.rate_of(host), self.burst, self.initial_concurrency)
+        return state
+
+    def acquire(self, url, priority=None):
+        '''
+        Blocking until a request to the host of url may start, returns the slot to release.
+        '''
+        priority = DETAIL if priority is None else priority
+        with self._cond:
+            state = self._host(url)
+            ticket = (priority, next(self._seq))
+            heapq.heappush(state.waiting, ticket)
+            queued_at = time.monotonic()
+            try:
+                while True:
+                    now = time.monotonic()
+                    wait = state.wait_time(now) if state.waiting[0] == ticket else None
+                    if wait == 0:
+                        break
+                    self._cond.wait(wait)
+            except BaseException:
+                state.waiting.remove(ticket)
+                heapq.heapify(state.waiting)
+                self._cond.notify_all()
+                raise
+            heapq.heappop(state.waiting)
+            state.tokens -= 1
+            state.in_flight += 1
+            state.stats['requests'] += 1
+            state.stats['wait_sec'] += now - queued_at
+            # the next in line may be admitted as well
+            self._cond.notify_all()
+        return _Slot(state, priority, now)
+
+    def release(self, slot, status=None, latency=None, retry_after=None):
+        '''
+        Finishing the request of the slot, adapting the limits of the host to its outcome.
+        A status of None stands for a connection error, latency defaults to the time since acquire.
+        '''
+        now = time.monotonic()
+        if latency is None:
+            latency = now - slot.started_at
+        with self._cond:
+            state = slot.host
+            state.in_flight -= 1
+            state.completed.append(now)
+            while state.completed and state.completed[0] < now - self.window:
+                state.completed.popleft()
+            if retry_after is not None:
+                state.blocked_until = max(state.blocked_until, now + retry_after)
+            congested = status is None or status in THROTTLE_STATUSES
+            if status in THROTTLE_STATUSES:
+                state.stats['throttled'] += 1
+            elif status is None:
+                state.stats['errors'] += 1
+            else:
+                # a median, unlike the fastest response, is not set by one tiny or 304 response
+                baseline = state.baseline_latency()
+                state.latencies.append(latency)
+                state.mean_latency = latency if state.mean_latency is None else 0.8 * state.mean_latency + 0.2 * latency
+                congested = self.latency_tolerance is not None and baseline is not None and latency > self.latency_tolerance * baseline
+            if congested:
+                # one decrease per round trip, the requests already in flight saw the same congestion
+                if now - state.decreased_at > (state.mean_latency or 0.):
+                    state.limit = max(self.min_concurrency, state.limit * self.decrease_factor)
+                    state.decreased_at = now
+            else:
+                state.limit = min(self.max_concurrency, state.limit + 1 / state.limit)
+            self._cond.notify_all()
+
+    def stats(self):
+        '''
+        Metrics per host, achieved_per_sec is the completed requests per second over the last window seconds
+        and utilisation its ratio to the rate limit.
+        '''
+        now = time.monotonic()
+        with self._cond:
+            stats = {}
+            for host, state in self._hosts.items():
+                span = max(min(self.window, now - state.created_at), 1e-9)
+                achieved = sum(1 for t in state.completed if t >= now - span) / span
+                stats[host] = dict(state.stats, wait_sec=round(state.stats['wait_sec'], 3), in_flight=state.in_flight,
+                                   concurrency_limit=round(state.limit, 2), rate_limit=state.rate, achieved_per_sec=round(achieved, 3),
+                                   utilisation=round(achieved / state.rate, 3),
+                                   mean_latency=None if state.mean_latency is None else round(state.mean_latency, 3))
+            return stats
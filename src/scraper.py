@@ -1,14 +1,68 @@
-import urllib
+import collections
+import functools
 import json
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import cached_property
+from urllib.parse import urlsplit
 from urllib.error import HTTPError
 import bs4
-import html5lib
+try:
+    from bs4.filter import ElementFilter
+except ImportError:
+    # bs4 before 4.13, parsing is never restricted to the needed regions
+    ElementFilter=None
 import datetime
-import numpy as np
-import pandas as pd
+import math
 import re
-import certifi
+import warnings
+from . import metrics
+from .index import content_hash, record_hash
+from .photos import PhotoDownloader
+from .records import TextStore, compact_record
+from .scheduler import LISTING, DETAIL
+from .transport import get_default_session
+
+PARSERS=('html5lib', 'lxml', 'html.parser')
+FALLBACK_PARSER='html5lib'
+_default_parser=FALLBACK_PARSER
+
+def set_default_parser(parser):
+    '''
+    Setting the BeautifulSoup tree builder used by every class without its own parser, e.g. 'lxml'.
+    '''
+    global _default_parser
+    if parser not in PARSERS:
+        raise ValueError('Please specify one of the following parsers: {}'.format(', '.join(PARSERS)))
+    _default_parser=parser
+
+def get_default_parser():
+    return _default_parser
+
+def _has_class(tag, class_):
+    # as class_ of find: one of the classes of the tag or all of them as written
+    if class_ is None:
+        return True
+    classes=tag.get('class')
+    if not classes:
+        return False
+    if isinstance(classes, str):
+        classes=classes.split()
+    return class_ in classes or ' '.join(classes)==class_
+
+def is_missing(value):
+    return value is None or (isinstance(value, float) and value!=value)
+
+def records_to_df(records):
+    '''
+    Building one DataFrame from a list of record dicts. The columns are the union of the record keys in order of
+    first appearance, records without a key get NaN, just like concatenating one-row DataFrames would give.
+    '''
+    import pandas as pd
+    columns=list(dict.fromkeys(key for record in records for key in record))
+    return pd.DataFrame.from_records(records, columns=columns)
 
 def remove_spec_chars(s):
     SPECIAL='äáéíóőúüű'
@@ -24,6 +78,11 @@ class RequestWithHeaders:
     Parameters
     ----------
     url: string
+    headers: dict, optional
+    session: transport.Session, optional
+        Shared transport with pooled keep-alive connections, defaults to the module wide session.
+    priority: int, optional
+        One of scheduler.PRIORITIES, orders the request among the ones waiting for the same host.
     
     Returns
     -------
@@ -36,9 +95,11 @@ class RequestWithHeaders:
     <h1 class="page-title">PEP 20 -- The Zen of Python</h1>
     
     '''
-    def __init__(self, url, headers=None):
+    def __init__(self, url, headers=None, session=None, priority=None):
         self.url=url
-        self.headers=headers  
+        self.headers=headers
+        self.session=session
+        self.priority=priority
     
     @property
     def headers(self):
@@ -51,66 +112,218 @@ class RequestWithHeaders:
             headers={'User-Agent': default_user_agent}
         self._headers=headers
     
+    @property
+    def session(self):
+        return self._session
+    
+    @session.setter
+    def session(self, session):
+        if session is None:
+            session=get_default_session()
+        self._session=session
+    
     @staticmethod
-    def get_http_resp_cont(url, headers):
-        http_req=urllib.request.Request(url, headers=headers)
-        byte_resp = urllib.request.urlopen(http_req, cafile=certifi.where())
-        content = byte_resp.read()
-        return content
+    def get_http_resp(url, headers, session=None, priority=None):
+        '''
+        transport.Response of the request, recorded in the HTTP metrics.
+        '''
+        if session is None:
+            session=get_default_session()
+        start=time.perf_counter()
+        try:
+            resp = session.request(url, headers=headers, priority=priority)
+        except HTTPError as err:
+            metrics.count('http_responses_total', status=err.code)
+            raise
+        metrics.observe('http_request_seconds', time.perf_counter()-start)
+        metrics.observe('http_response_bytes', len(resp.content))
+        metrics.count('http_responses_total', status=resp.status)
+        return resp
+
+    @staticmethod
+    def get_http_resp_cont(url, headers, session=None, priority=None):
+        return RequestWithHeaders.get_http_resp(url, headers, session, priority).content
+
+    def fetch(self):
+        return self.get_http_resp_cont(self.url, headers=self.headers, session=self.session, priority=self.priority)
 
     def download(self, file_path):
-        content = self.get_http_resp_cont(self.url, headers=self.headers)
+        content = self.fetch()
         with open(file_path, 'wb') as f:
             f.write(content)
     
-    def parse_to_html(self, parser=None):
-        content = self.get_http_resp_cont(self.url, headers=self.headers)
+    @staticmethod
+    def parse_content(content, parser=None, parse_only=None):
         if parser is None:
-            parser='html5lib'
-        parsed_bs_html=bs4.BeautifulSoup(content, parser)
+            parser=_default_parser
+        start=time.perf_counter()
+        try:
+            parsed_bs_html=bs4.BeautifulSoup(content, parser, parse_only=parse_only)
+        except bs4.FeatureNotFound:
+            warnings.warn('{0} parser is not installed, falling back to {1}.'.format(parser, FALLBACK_PARSER))
+            parser=FALLBACK_PARSER
+            parsed_bs_html=bs4.BeautifulSoup(content, FALLBACK_PARSER)
+        metrics.observe('parse_seconds', time.perf_counter()-start, parser=parser, partial=parse_only is not None)
+        metrics.observe('document_bytes', len(content))
         return parsed_bs_html
+    
+    def parse_to_html(self, parser=None):
+        return self.parse_content(self.fetch(), parser)
+
+SETTINGS_CACHE_DIR=os.path.join(os.path.expanduser('~'), '.cache', 'real_estate_hungary')
 
 class RealEstateHungarySettings:
     '''
     Initialize an object to retrieve the available real estates in Hungary.
     
+    The options of a language are extracted from the homepage once and cached in memory and on disk until
+    cache_ttl expires, so further settings objects of the language cost no network and no parsing.
+    
     Parameters
     ----------
     lang : string
         Language of the requested real estate website in Hungary.
+    session : transport.Session, optional
+        Shared transport used by this object and by the page listings created from it.
+    content : bytes, optional
+        Already downloaded homepage, nothing is fetched if it is given.
+    parser : string, optional
+        BeautifulSoup tree builder, one of PARSERS. Defaults to the parser class attribute, then to the module default.
+    cache_dir : string, optional
+        Directory of the on-disk options cache, None switches it off.
+    cache_ttl : float
+        Seconds after which the cached options are extracted again from the homepage.
+    offline : bool
+        Only the cached options are used, a KeyError is raised if there are none.
+    url : string, optional
+        Base URL of the website, defaults to URL_LANG of the language, e.g. a local stand-in of the site.
     '''
-    def __init__(self, lang):
+    URL_LANG={'hun': 'https://ingatlan.com/', 'eng':'https://realestate.hu/'}
+    parser=None
+    _options_cache={}
+    _options_lock=threading.Lock()
+    
+    def __init__(self, lang, session=None, content=None, parser=None, cache_dir=SETTINGS_CACHE_DIR, cache_ttl=7*24*3600., offline=False, url=None):
         self.lang=lang.lower()
-        URL_LANG={'hun': 'https://ingatlan.com/', 'eng':'https://realestate.hu/'}
+        self.session=session if session is not None else get_default_session()
+        if parser is not None:
+            self.parser=parser
+        self.cache_dir=cache_dir
+        self.cache_ttl=cache_ttl
         try:
-            self.url=URL_LANG[self.lang]
+            self.url=self.URL_LANG[self.lang] if url is None else url
         except KeyError:
-            available_langs=", ".join(URL_LANG.keys())
+            available_langs=", ".join(self.URL_LANG.keys())
             raise KeyError('Please specify one of the following languages: {}'.format(available_langs))
-        self.parsed_html=RequestWithHeaders(url=self.url).parse_to_html()
+        self._parsed_html=None
+        if content is not None:
+            self._parsed_html=RequestWithHeaders.parse_content(content, self.parser)
+            options=self._store_options(self._extract_options())
+        else:
+            options=self._load_options()
+            if options is None:
+                if offline:
+                    raise KeyError('No cached options of {} language, please create a settings object online first.'.format(self.lang))
+                options=self._store_options(self._extract_options())
+        self._set_options(options)
         
     def __repr__(self):
         return self.url
     
+    @classmethod
+    def from_options(cls, lang, listing_types, property_types, session=None, url=None):
+        '''
+        Creating a settings object from known options, without network, parsing or cache.
+        '''
+        settings=cls.__new__(cls)
+        settings.lang=lang.lower()
+        settings.session=session if session is not None else get_default_session()
+        settings.url=cls.URL_LANG[settings.lang] if url is None else url
+        settings.cache_dir=None
+        settings.cache_ttl=None
+        settings._parsed_html=None
+        settings._set_options({'listing_types': list(listing_types), 'property_types': list(property_types)})
+        return settings
+    
     @property
-    def property_types(self):
+    def parsed_html(self):
+        if self._parsed_html is None:
+            self._parsed_html=RequestWithHeaders(url=self.url, session=self.session, priority=LISTING).parse_to_html(self.parser)
+        return self._parsed_html
+    
+    @property
+    def options(self):
+        return {'listing_types': self.listing_types, 'property_types': self.property_types}
+    
+    def _set_options(self, options):
+        self._listing_types=list(options['listing_types'])
+        self._property_types=list(options['property_types'])
+        self.valid_listing_types=frozenset(self._listing_types)
+        self.valid_property_types=frozenset(self._property_types)
+    
+    def _cache_key(self):
+        # options of another site stand apart from the ones of the real one
+        if self.url==self.URL_LANG[self.lang]:
+            return self.lang
+        return '{0}_{1}'.format(self.lang, content_hash(self.url.encode('utf-8'))[:12])
+    
+    def _cache_path(self):
+        return os.path.join(self.cache_dir, 'settings_{}.json'.format(self._cache_key()))
+    
+    def _load_options(self):
+        now=time.time()
+        with self._options_lock:
+            cached=self._options_cache.get(self._cache_key())
+        if cached is not None and now-cached['extracted_at']<=self.cache_ttl:
+            return cached
+        if self.cache_dir is None:
+            return None
+        try:
+            with open(self._cache_path(), encoding='utf-8') as f:
+                cached=json.load(f)
+        except (OSError, ValueError):
+            return None
+        if now-cached.get('extracted_at', 0)>self.cache_ttl:
+            return None
+        with self._options_lock:
+            self._options_cache[self._cache_key()]=cached
+        return cached
+    
+    def _store_options(self, options):
+        options={**options, 'extracted_at': time.time()}
+        with self._options_lock:
+            self._options_cache[self._cache_key()]=options
+        if self.cache_dir is not None:
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                tmp_path='{0}.{1}.tmp'.format(self._cache_path(), os.getpid())
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(options, f)
+                os.replace(tmp_path, self._cache_path())
+            except OSError as err:
+                warnings.warn('Settings cache could not be written: {}'.format(err))
+        return options
+    
+    def _extract_options(self):
         if self.lang=='eng':
             property_types_selector=self.parsed_html.find_all(name='select', class_='input-type')[0]
             propert_types=[tp['value'] for tp in property_types_selector.find_all('option') if len(tp['value'])>0]
+            listing_types_selector=self.parsed_html.find_all(name='select', class_='input-type')[1]
+            listing_types=[tp['value'] for tp in listing_types_selector.find_all('option') if len(tp['value'])>0]
         elif self.lang=='hun':
             property_types_selector=self.parsed_html.find(name='select', class_='search-filter-select search-filter-select-long')
             propert_types=[tp['value'] for tp in property_types_selector.find_all('option') if len(tp['value'])>0]
-        return propert_types
+            listing_types_selector=self.parsed_html.find(name='div', class_='search-filter-box listing-type')
+            listing_types=[tp['value'] for tp in listing_types_selector.find_all('input') if len(tp['value'])>0]
+        return {'listing_types': listing_types, 'property_types': propert_types}
+    
+    @property
+    def property_types(self):
+        return list(self._property_types)
     
     @property
     def listing_types(self):
-        if self.lang=='eng':
-            listing_types_selector=self.parsed_html.find_all(name='select', class_='input-type')[1]
-            listing_types=[tp['value'] for tp in listing_types_selector.find_all('option') if len(tp['value'])>0]
-        elif self.lang=='hun':
-            listing_types_selector=self.parsed_html.find(name='div', class_='search-filter-box listing-type')
-            listing_types=[tp['value'] for tp in listing_types_selector.find_all('input') if len(tp['value'])>0]
-        return listing_types
+        return list(self._listing_types)
 
 class RealEstateHungaryPageListings:
     '''
@@ -128,15 +341,45 @@ class RealEstateHungaryPageListings:
         Type of property, e.g. apartment, house etc
     page_num :  int
         Page number on the website
+    session : transport.Session, optional
+        Shared transport, defaults to the session of real_estate_hun_settings.
+    content : bytes, optional
+        Already downloaded result page, nothing is fetched if it is given.
+    parser : string, optional
+        BeautifulSoup tree builder, one of PARSERS. Defaults to the parser class attribute, then to the module default.
+    photo_downloader : photos.PhotoDownloader, optional
+        Shared background downloader of the photos, one is created from photos_dir otherwise.
+    listing_index : index.ListingIndex, optional
+        Index of earlier crawls, listings whose page did not change since are skipped and left out of the records.
+    cluster_map : clusters.ClusterMap, optional
+        Only the representative of each cluster of listings is fetched, the rest are recorded in the map as its members.
+    compact : bool
+        Records are records.CompactRecord instead of dicts, and the tree of the result page is freed once its
+        listings are collected, it is parsed again from the downloaded page if needed.
+    desc : {None, 'intern'} or records.TextStore
+        Keeping the descriptions of compact records as they are, interned, or out of line in a TextStore as desc_ref.
     '''
-    def __init__(self, real_estate_hun_settings, city, listing_type, property_type, page_num, photos_dir=None):
+    parser = None
+    
+    def __init__(self, real_estate_hun_settings, city, listing_type, property_type, page_num, photos_dir=None, session=None, content=None, parser=None, photo_downloader=None, listing_index=None, cluster_map=None, compact=False, desc=None):
         self._real_estate_hun_settings = real_estate_hun_settings
+        self.session = session if session is not None else self._real_estate_hun_settings.session
+        if parser is not None:
+            self.parser = parser
         self.lang = self._real_estate_hun_settings.lang
         self._url = self._real_estate_hun_settings.url
         self.listing_type = listing_type
         self.property_type = property_type
         self.page_num = page_num
         self.photos_dir = photos_dir
+        self._photo_downloader = photo_downloader
+        self._owns_photo_downloader = False
+        self.listing_index = listing_index
+        self.cluster_map = cluster_map
+        if not (desc is None or desc == 'intern' or isinstance(desc, TextStore)):
+            raise ValueError("Please specify desc as None, 'intern' or a TextStore.")
+        self.compact = compact
+        self.desc = desc
         self.city = city
         self.params = {'real_estate_hun_settings': self._real_estate_hun_settings,
                      'city':self.city,
@@ -151,10 +394,36 @@ class RealEstateHungaryPageListings:
             self.page_url = '{url}search?location={city}&type={property_type}&sell_type={listing_type}&price[min]=&price[max]=&page={page_num}&per-page={listings_per_page}'.format(**url_map)
         elif self.lang == 'hun':
             self.page_url = '{url}lista/{listing_type}+{property_type}+{city}?page={page_num}'.format(**url_map)
-        self.parsed_html = RequestWithHeaders(url=self.page_url).parse_to_html()
+        self._content = content
+        self._parsed_html = None if content is None else RequestWithHeaders.parse_content(content, self.parser)
 
     def __repr__(self):
         return self.page_url
+    
+    @property
+    def photo_downloader(self):
+        # photos are downloaded in the background while the next listings are scraped
+        if self._photo_downloader is None and self.photos_dir is not None:
+            self._photo_downloader = PhotoDownloader(self.photos_dir, session=self.session)
+            self._owns_photo_downloader = True
+        return self._photo_downloader
+    
+    @property
+    def parsed_html(self):
+        # fetched on first use, so the object can serve as context of a single property without downloading the page
+        if self._parsed_html is None:
+            if self._content is None:
+                self._content = RequestWithHeaders(url=self.page_url, session=self.session, priority=LISTING).fetch()
+            self._parsed_html = RequestWithHeaders.parse_content(self._content, self.parser)
+        return self._parsed_html
+    
+    def release(self):
+        '''
+        Freeing the parsed result page, the downloaded page is kept to parse it again if needed.
+        '''
+        if self._parsed_html is not None:
+            self._parsed_html.decompose()
+            self._parsed_html = None
         
     @property
     def city(self):
@@ -180,9 +449,8 @@ class RealEstateHungaryPageListings:
     
     @listing_type.setter
     def listing_type(self, listing_type):
-        valid_listing_types=self._real_estate_hun_settings.listing_types
-        if listing_type not in valid_listing_types:
-            raise BaseException('Please specify one of the following listing types: {}'.format(', '.join(valid_listing_types)))
+        if listing_type not in self._real_estate_hun_settings.valid_listing_types:
+            raise BaseException('Please specify one of the following listing types: {}'.format(', '.join(self._real_estate_hun_settings.listing_types)))
         self._listing_type=listing_type
 
     @property
@@ -191,9 +459,8 @@ class RealEstateHungaryPageListings:
 
     @property_type.setter
     def property_type(self, property_type):
-        valid_property_types=self._real_estate_hun_settings.property_types
-        if property_type not in valid_property_types:
-            raise BaseException('Please specify one of the following property types: {}'.format(', '.join(valid_property_types)))
+        if property_type not in self._real_estate_hun_settings.valid_property_types:
+            raise BaseException('Please specify one of the following property types: {}'.format(', '.join(self._real_estate_hun_settings.property_types)))
         self._property_type=property_type        
         
     @property
@@ -207,22 +474,72 @@ class RealEstateHungaryPageListings:
         except ValueError:
             raise ValueError('Page number must be integer.')
     
-    @property
-    def max_page(self):
+    @cached_property
+    def _summary(self):
+        '''
+        Totals and listing cards of the result page, collected in a single walk over the parsed document.
+        The accessors below are served from it, so the page is scanned once however many listings are scraped.
+        '''
+        pagination, results_count, collection=None, None, None
+        cards, favorites=[], []
+        for tag in self.parsed_html.descendants:
+            name=tag.name
+            if name is None:
+                continue
+            if self.lang=='hun':
+                if name=='div' and _has_class(tag, 'listing__card'):
+                    cards.append(tag)
+                elif pagination is None and name=='div' and _has_class(tag, 'pagination__page-number'):
+                    pagination=tag
+                elif results_count is None and name=='span' and _has_class(tag, 'filtered_results_count'):
+                    results_count=tag
+            elif self.lang=='eng':
+                if results_count is None and name=='strong':
+                    results_count=tag
+                elif name=='div':
+                    if collection is None and _has_class(tag, 'Apartment-Collection row'):
+                        collection=tag
+                    elif collection is not None and _has_class(tag, 'Apartment__details'):
+                        cards.append(tag)
+                    elif collection is not None and _has_class(tag, 'Apartment--favorite'):
+                        favorites.append(tag)
+        summary={'max_listing': None if results_count is None else int(results_count.get_text())}
         if self.lang=='eng':
-            max_page=np.ceil(self.max_listing/self._LISTINGS_PER_PAGE)
+            if summary['max_listing'] is not None:
+                summary['max_page']=math.ceil(summary['max_listing']/self._LISTINGS_PER_PAGE)
+            if collection is not None:
+                # cards of the collection only, the walk goes on after its subtree
+                inside=lambda div: any(parent is collection for parent in div.parents)
+                summary['property_urls']=tuple("{0}{1}".format(self._url, div.a.get("href").lstrip('/')) for div in cards if inside(div))
+                summary['property_ids']=tuple(div.a.get('data-apartment-id') for div in favorites if inside(div))
         elif self.lang=='hun':
-            pagination=self.parsed_html.find("div",class_="pagination__page-number").get_text().replace(" ", "")
-            max_page=pagination.split("/")[1].replace("oldal", "")
-        return int(max_page)
+            if pagination is not None:
+                summary['max_page']=int(pagination.get_text().replace(" ", "").split("/")[1].replace("oldal", ""))
+            page_ids=[(div.a.parent.parent.get("data-id"),
+            div.a.parent.parent.get("data-cluster-id"),
+            "{0}{1}".format(self._url, div.a.get("href").lstrip('/'))) for div in cards]
+            summary['property_ids']=tuple(t[0] for t in page_ids)
+            summary['cluster_ids']=tuple(t[1] for t in page_ids)
+            summary['property_urls']=tuple(t[2] for t in page_ids)
+            prices=[div.find('div', class_='price') for div in cards]
+            summary['card_prices']=tuple(None if price is None else price.get_text().strip() for price in prices)
+        if self.compact:
+            self.release()
+        return summary
+    
+    def _summary_value(self, key):
+        value=self._summary.get(key)
+        if value is None:
+            raise AttributeError('{0} is not found on the page {1}.'.format(key, self.page_url))
+        return value
+    
+    @property
+    def max_page(self):
+        return self._summary_value('max_page')
     
     @property    
     def max_listing(self):
-        if self.lang=='eng':
-            max_listing=self.parsed_html.find(name='strong').get_text()
-        elif self.lang=='hun':    
-            max_listing=self.parsed_html.find("span",class_="filtered_results_count").get_text()
-        return int(max_listing)
+        return self._summary_value('max_listing')
     
     def extract_attrs(self):
         page_attrs={'lang':self.lang,
@@ -234,33 +551,20 @@ class RealEstateHungaryPageListings:
         return page_attrs
 
     def get_page_listings(self):
-        if self.lang=='eng':
-            prop_coll=self.parsed_html.find(name='div', class_='Apartment-Collection row')
-            page={
-                'property_urls': ["{0}{1}".format(self._url, div.a.get("href").lstrip('/')) for div in prop_coll.find_all(name='div', class_='Apartment__details')],
-                'property_ids': [div.a.get('data-apartment-id') for div in prop_coll.find_all(name='div', class_='Apartment--favorite')]
-            }
-        elif self.lang=='hun':
-            prop_coll=self.parsed_html.find_all(name="div", class_='listing__card')
-            page_ids=[(div.a.parent.parent.get("data-id"),
-            div.a.parent.parent.get("data-cluster-id"), 
-            "{0}{1}".format(self._url, div.a.get("href").lstrip('/'))) for div in prop_coll]
-            page={'property_ids':[t[0] for t in page_ids], 'cluster_ids':[t[1] for t in page_ids], 'property_urls':[t[2] for t in page_ids]}   
-        return page
+        keys=('property_urls', 'property_ids') if self.lang=='eng' else ('property_ids', 'cluster_ids', 'property_urls')
+        return {key: list(self._summary_value(key)) for key in keys}
     
     def get_property_ids(self):
-        page_listings=self.get_page_listings()
-        return page_listings.get('property_ids')
+        return list(self._summary_value('property_ids'))
 
     def get_cluster_ids(self):
-        ids=self.get_property_ids()
-        len_ids=len(ids)
-        page_listings=self.get_page_listings()
-        return page_listings.get('cluster_ids', [None,]*len_ids)
+        cluster_ids=self._summary.get('cluster_ids')
+        if cluster_ids is None:
+            return [None,]*len(self._summary_value('property_ids'))
+        return list(cluster_ids)
     
     def get_property_urls(self):
-        page_listings=self.get_page_listings()
-        return page_listings.get('property_urls')
+        return list(self._summary_value('property_urls'))
     
     @staticmethod
     def add_timestamp_to_dict(d, ts_format='%Y-%m-%d %H:%M:%S'):
@@ -268,47 +572,210 @@ class RealEstateHungaryPageListings:
         d['timestamp']=datetime.datetime.strftime(now, ts_format)
         return d
     
-    def _create_record(self, url, timestamp=True, **kwargs):
-        page_attrs = self.extract_attrs()
-        real_estate_params = {'real_estate_hun_page_listings':self}
-        real_estate_params['property_url'] = url
-        single_property = RealEstateHungary(**real_estate_params)
-        if self.photos_dir is not None:
-            single_property.extract_photos(self.photos_dir)
-        attrs = single_property.extract_attrs()
+    def _fetch_if_changed(self, url, property_id, cluster_id):
+        '''
+        Content of the property page, or None if the listing index trusts the stored version or the server says
+        it is not modified. Whether the content changed is decided on its record, see _is_unchanged.
+        '''
+        index = self.listing_index
+        index_key = property_id or url
+        entry = index.get(index_key)
+        if index.is_fresh(entry):
+            index.touch(index_key, cluster_id, url)
+            index.count('skipped_fresh')
+            return None
+        headers = {**RequestWithHeaders(url).headers, **index.conditional_headers(entry)}
+        try:
+            resp = RequestWithHeaders.get_http_resp(remove_spec_chars(url), headers, session=self.session, priority=DETAIL)
+        except HTTPError as err:
+            if err.code==404:
+                raise HTTPError(url, err.code, 'Property does not exist, probably already sold/rent or being edited', err.hdrs, err.fp)
+            raise
+        if resp.status == 304:
+            index.touch(index_key, cluster_id, url)
+            index.count('not_modified')
+            return None
+        return {'content': resp.content, 'entry': entry, 'etag': resp.headers.get('ETag'), 'last_modified': resp.headers.get('Last-Modified')}
+    
+    def _is_unchanged(self, url, record, fetched, property_id=None, cluster_id=None):
+        '''
+        Recording the fetch in the listing index, True if the record has the stored hash.
+        '''
+        entry = fetched['entry']
+        fetched_hash = record_hash(record)
+        self.listing_index.record_fetch(property_id or url, cluster_id, url, fetched_hash, fetched['etag'], fetched['last_modified'])
+        if entry is not None and entry['content_hash'] == fetched_hash:
+            self.listing_index.count('unchanged')
+            return True
+        self.listing_index.count('new' if entry is None or entry['content_hash'] is None else 'changed')
+        return False
+    
+    def _record_from_property(self, single_property, page_attrs, timestamp=True, fields=None, **kwargs):
+        attrs = single_property.extract_attrs(fields)
         attrs.update({**page_attrs, **kwargs})
         if timestamp:
             self.add_timestamp_to_dict(attrs)
-        record = pd.DataFrame(attrs, index=[0])
-        return record.dropna(axis=1)
+        return {k: v for k, v in attrs.items() if not is_missing(v)}
     
-    def _check_unique_ids(self, in_df, in_df_col_name='property_url'):
-        ids=pd.DataFrame(self.get_page_listings())
-        if not in_df.empty:
-            uniq_urls=~ids.property_urls.isin(in_df[in_df_col_name])
-            return ids[uniq_urls]
-        else:
-            return ids
+    @metrics.timed('record_seconds')
+    def _create_record(self, url, timestamp=True, page_attrs=None, fields=None, **kwargs):
+        fetched = None
+        if self.listing_index is not None:
+            fetched = self._fetch_if_changed(url, kwargs.get('property_id'), kwargs.get('cluster_id'))
+            if fetched is None:
+                return None
+        if page_attrs is None:
+            page_attrs = self.extract_attrs()
+        real_estate_params = {'real_estate_hun_page_listings':self}
+        real_estate_params['property_url'] = url
+        real_estate_params['content'] = None if fetched is None else fetched['content']
+        single_property = RealEstateHungary(**real_estate_params)
+        if fields is not None and self.photo_downloader is not None:
+            # the photos region goes into the partial parse of the fields, photo_files would parse the whole page otherwise
+            single_property._locate_for_fields([*([fields] if isinstance(fields, str) else fields), 'photos'])
+        record = self._record_from_property(single_property, page_attrs, timestamp, fields, **kwargs)
+        if fetched is not None and self._is_unchanged(url, record, fetched, kwargs.get('property_id'), kwargs.get('cluster_id')):
+            single_property.release()
+            return None
+        if self.photo_downloader is not None:
+            self.photo_downloader.submit(kwargs.get('property_id') or url, single_property.photo_files())
+        single_property.release()
+        if self.compact:
+            record = compact_record(record, self.desc)
+        metrics.count('records_total')
+        return record
+    
+    def _check_unique_ids(self, in_df=None, in_df_col_name='property_url'):
+        ids=self.get_page_listings()
+        if len(set(map(len, ids.values())))>1:
+            raise ValueError('Listings of the page differ in length: {}'.format({key: len(values) for key, values in ids.items()}))
+        rows=[dict(zip(ids, values)) for values in zip(*ids.values())]
+        if in_df is not None and not in_df.empty:
+            seen=set(in_df[in_df_col_name])
+            rows=[row for row in rows if row['property_urls'] not in seen]
+        return rows
     
-    def listings_to_df(self, num_listings=None, checking_unique_in_df=pd.DataFrame()):
+    def _iter_listing_params(self, num_listings=None, checking_unique_in_df=None):
         urls = self.get_property_urls()
         max_listing = len(urls)
         if num_listings and num_listings > max_listing:
             raise ValueError('Given number of listings exceeded the maximum number of listings on the page, please specify equal or less than {0}.'.format(max_listing))
-        counter = 0
-        records = pd.DataFrame()
         unique_ids = self._check_unique_ids(in_df=checking_unique_in_df)
-        for i, r in unique_ids.iterrows():
-            prop_id, cluster_id, url=r['property_ids'], r['cluster_ids'], r['property_urls']
-            additional_ids = {'property_id':prop_id,
-                              'cluster_id':cluster_id}
-            single = self._create_record(url, **additional_ids)
-            records = pd.concat([records, single], axis=0, sort=False)
-            if num_listings:               
-                counter += 1
-                if counter == num_listings: break
-        return records.reset_index(drop=True)
+        if num_listings:
+            unique_ids = unique_ids[:num_listings]
+        if self.cluster_map is not None and self.lang == 'hun':
+            prices = dict(zip(self._summary_value('property_urls'), self._summary.get('card_prices', ())))
+            selected = self.cluster_map.select([r['property_ids'] for r in unique_ids], [r['cluster_ids'] for r in unique_ids],
+                                               [r['property_urls'] for r in unique_ids], [prices.get(r['property_urls']) for r in unique_ids])
+            unique_ids = [r for r, keep in zip(unique_ids, selected) if keep]
+        for r in unique_ids:
+            additional_ids = {'property_id':r['property_ids'],
+                              'cluster_id':r.get('cluster_ids')}
+            yield r['property_urls'], additional_ids
     
+    def _create_records_in_threads(self, listing_params, max_workers, max_per_host, fields=None):
+        host_limits = collections.defaultdict(lambda: threading.BoundedSemaphore(max_per_host))
+        host_limits_lock = threading.Lock()
+        def create_record(url, additional_ids):
+            with host_limits_lock:
+                host_limit = host_limits[urlsplit(url).netloc]
+            with host_limit:
+                return self._create_record(url, fields=fields, **additional_ids)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(create_record, url, additional_ids) for url, additional_ids in listing_params]
+            for future in futures:
+                yield future.result()
+    
+    async def _create_records_async(self, listing_params, max_workers, max_per_host, fields=None):
+        import asyncio
+        loop = asyncio.get_running_loop()
+        host_limits = collections.defaultdict(lambda: asyncio.Semaphore(max_per_host))
+        async def create_record(executor, url, additional_ids):
+            async with host_limits[urlsplit(url).netloc]:
+                return await loop.run_in_executor(executor, functools.partial(self._create_record, url, fields=fields, **additional_ids))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return await asyncio.gather(*[create_record(executor, url, additional_ids) for url, additional_ids in listing_params])
+    
+    def iter_listings(self, num_listings=None, checking_unique_in_df=None, concurrency=None, max_workers=8, max_per_host=4, fields=None):
+        '''
+        Yielding the record dict of each listing on the page in listing order, as soon as it is scraped.
+        Parameters are the ones of listings_to_df, concurrency is None or 'threads'.
+        '''
+        listing_params = self._iter_listing_params(num_listings, checking_unique_in_df)
+        if concurrency is None:
+            records = (self._create_record(url, fields=fields, **additional_ids) for url, additional_ids in listing_params)
+        elif concurrency == 'threads':
+            records = self._create_records_in_threads(list(listing_params), max_workers, max_per_host, fields)
+        else:
+            raise ValueError("Please specify concurrency as one of the following: None, 'threads'.")
+        for record in records:
+            # None stands for a listing left unchanged since the last crawl
+            if record is not None:
+                yield record
+        self._wait_for_photos()
+    
+    def _wait_for_photos(self):
+        if self._owns_photo_downloader:
+            self._photo_downloader.wait()
+    
+    def listings_to_df(self, num_listings=None, checking_unique_in_df=None, concurrency=None, max_workers=8, max_per_host=4, fields=None):
+        '''
+        Scraping the listings on the page into a DataFrame, in listing order.
+        
+        Parameters
+        ----------
+        num_listings : int, optional
+            Number of listings to scrape from the top of the page.
+        checking_unique_in_df : pandas.DataFrame, optional
+            Listings whose property_url is already in this DataFrame are skipped.
+        concurrency : {None, 'threads', 'asyncio'}
+            None fetches the properties one by one, 'threads' fetches them in a bounded thread pool,
+            'asyncio' schedules them on an event loop, which must not be running already.
+        max_workers : int
+            Size of the thread pool in the concurrent modes.
+        max_per_host : int
+            Maximum number of simultaneous requests per host in the concurrent modes.
+        fields : list of string, optional
+            Fields of the properties to extract, see RealEstateHungary.FIELDS, all of them by default.
+            The page attributes, ids and timestamp are added either way. With photos_dir the photos region is
+            located along with the fields, without a full parse of the pages.
+        '''
+        if concurrency == 'asyncio':
+            import asyncio
+            listing_params = list(self._iter_listing_params(num_listings, checking_unique_in_df))
+            singles = [single for single in asyncio.run(self._create_records_async(listing_params, max_workers, max_per_host, fields)) if single is not None]
+            self._wait_for_photos()
+        elif concurrency in (None, 'threads'):
+            singles = list(self.iter_listings(num_listings, checking_unique_in_df, concurrency, max_workers, max_per_host, fields))
+        else:
+            raise ValueError("Please specify concurrency as one of the following: None, 'threads', 'asyncio'.")
+        return records_to_df(singles)
+    
+if ElementFilter is not None:
+    class _SectionFilter(ElementFilter):
+        '''
+        parse_only filter of BeautifulSoup keeping the subtrees of the tags matching any (tag name, class, attributes)
+        spec, the rest of the document is not built at all.
+        '''
+        def __init__(self, specs):
+            super().__init__()
+            self.specs=list(specs)
+        
+        def allow_tag_creation(self, nsprefix, name, attrs):
+            attrs=attrs or {}
+            for spec_name, class_, spec_attrs in self.specs:
+                if name!=spec_name:
+                    continue
+                if not _has_class(attrs, class_):
+                    continue
+                if spec_attrs and any(attrs.get(k)!=v for k, v in spec_attrs.items()):
+                    continue
+                return True
+            return False
+        
+        def allow_string_creation(self, string):
+            return False
+
 class RealEstateHungary:
     '''
     Initialize an object to extract all the available data of the single real estate in Hungary.
@@ -319,24 +786,74 @@ class RealEstateHungary:
         URL of the single real estate.
     real_estate_hun_page_listings : RealEstateHungaryPageListings
         Instance of RealEstateHungaryPageListings, which includes information of source real estate page.
+    session : transport.Session, optional
+        Shared transport used for the property page and its photos, defaults to the session of real_estate_hun_page_listings.
+    content : bytes, optional
+        Already downloaded property page, nothing is fetched if it is given.
+    parser : string, optional
+        BeautifulSoup tree builder, one of PARSERS. Defaults to the parser class attribute, then to the module default.
     '''
-    def __init__(self, property_url, real_estate_hun_page_listings):
+    parser=None
+    
+    def __init__(self, property_url, real_estate_hun_page_listings, session=None, content=None, parser=None):
         self._real_estate_hun_page_listings=real_estate_hun_page_listings
+        self.session=session if session is not None else self._real_estate_hun_page_listings.session
+        if parser is not None:
+            self.parser=parser
         self._lang=self._real_estate_hun_page_listings.lang
         self.city=self._real_estate_hun_page_listings.city
         self.src_page_num=self._real_estate_hun_page_listings.page_num
         self.src_listing_type=self._real_estate_hun_page_listings.listing_type
         self.src_property_type=self._real_estate_hun_page_listings.property_type
         self.property_url=remove_spec_chars(property_url)
+        self._parsed_html=None
+        self._partial_html=[]
+        self._located={}
+        self._content=content
+        self._released=False
+        if content is not None:
+            return
         try:
-            self.parsed_html=RequestWithHeaders(self.property_url).parse_to_html()
+            self._content=RequestWithHeaders(self.property_url, session=self.session, priority=DETAIL).fetch()
         except HTTPError as err:
             if err.code==404:
                 raise HTTPError(property_url, err.code, 'Property does not exist, probably already sold/rent or being edited', err.hdrs, err.fp)
+            raise
         
     def __repr__(self):
         return self.property_url
     
+    @property
+    def parsed_html(self):
+        # parsed on first use, extract_attrs with a few fields may get along with the needed regions only
+        if self._parsed_html is None:
+            if self._released:
+                raise ValueError('Please create a new object, the document of {} is released.'.format(self.property_url))
+            self._parsed_html=RequestWithHeaders.parse_content(self._content, self.parser)
+            self._content=None
+            # regions located in a partial parse belong to another tree
+            self._located={}
+        return self._parsed_html
+    
+    @parsed_html.setter
+    def parsed_html(self, parsed_html):
+        self._parsed_html=parsed_html
+        self._located={}
+    
+    def release(self):
+        '''
+        Freeing the parsed document once the needed fields are extracted, the fields already extracted are kept.
+        The tree is decomposed, its reference cycles would keep it in memory until the next garbage collection.
+        '''
+        for document in [self._parsed_html]+self._partial_html:
+            if document is not None:
+                document.decompose()
+        self._parsed_html=None
+        self._partial_html=[]
+        self._located={}
+        self._content=None
+        self._released=True
+    
     @property
     def _real_estate_hun_page_listings(self):
         return self._real_estate_hun_page_listings_copy
@@ -347,9 +864,84 @@ class RealEstateHungary:
             raise BaseException('Please provide an instance of RealEstateHungaryPageListings class.')       
         self._real_estate_hun_page_listings_copy=real_estate_hun_page_listings
     
+    # first tag of each document region the fields are extracted from: (tag name, class, attributes)
+    _SECTIONS={'hun': {'inactive_text': ('div', 'inactive-text', None),
+                       'static_map': ('a', 'static-map', {'href': '#terkep'}),
+                       'title': ('h1', 'js-listing-title', None),
+                       'listing_parameters': ('div', 'listing-parameters', None),
+                       'parameters': ('div', 'paramterers', None),
+                       'public_transports': ('div', 'public-transports', None),
+                       'description': ('div', 'long-description', None),
+                       'head': ('head', None, None),
+                       'photos': ('div', 'card listing', None)},
+               'eng': {'title': ('h1', 'ApartmentPage__Title', None),
+                       'price_huf': ('h4', 'ApartmentPage__Price', None),
+                       'price_eur': ('span', 'ApartmentPage__Price--eur', None),
+                       'details': ('div', 'row ApartmentPage__detailsrow', None),
+                       'description': ('div', 'ApartmentPage__section', None),
+                       'photos': ('div', 'row ApartmentImage__list', None),
+                       'map_script': ('script', None, None)}}
+    _GPS_KEYWORD='map.addMarker'
+    
+    def _locate(self, keys, document=None):
+        '''
+        Locating the tags of the given document regions in a single walk over the parsed document, stopping as
+        soon as all of them are found. A region missing from the document is None.
+        '''
+        specs=self._SECTIONS[self._lang]
+        keys=[key for key in keys if key not in self._located]
+        if not keys:
+            return
+        specs_by_name=collections.defaultdict(list)
+        for key in keys:
+            name, class_, attrs=specs[key]
+            specs_by_name[name].append((key, class_, attrs))
+        # the document is parsed before the walk is timed, parsing is observed in parse_seconds
+        self._walk(self.parsed_html if document is None else document, keys, specs_by_name)
+    
+    @metrics.timed('locate_seconds')
+    def _walk(self, document, keys, specs_by_name):
+        sections=dict.fromkeys(keys)
+        not_found=len(keys)
+        for tag in document.descendants:
+            for key, class_, attrs in specs_by_name.get(tag.name, ()):
+                if sections[key] is not None or not _has_class(tag, class_):
+                    continue
+                if attrs and any(tag.get(k)!=v for k, v in attrs.items()):
+                    continue
+                if key=='map_script' and self._GPS_KEYWORD not in (tag.string or ''):
+                    continue
+                sections[key]=tag
+                not_found-=1
+            if not_found==0:
+                break
+        self._located.update(sections)
+    
+    def _section(self, key):
+        if key not in self._located:
+            # all the regions at once, the ones of the other fields are likely needed too
+            self._locate(self._SECTIONS[self._lang])
+        return self._located[key]
+    
+    def _locate_for_fields(self, fields):
+        # unknown fields are left to extract_attrs to report
+        keys={key for field in fields for key in self._FIELD_SECTIONS[self._lang].get(field, ())}
+        keys=[key for key in self._SECTIONS[self._lang] if key in keys and key not in self._located]
+        if not keys:
+            return
+        parser=self.parser if self.parser is not None else _default_parser
+        if self._parsed_html is None and ElementFilter is not None and parser!='html5lib':
+            # only the subtrees of the needed regions are built, the content is kept for a full parse later on
+            specs=[self._SECTIONS[self._lang][key] for key in keys]
+            document=RequestWithHeaders.parse_content(self._content, parser, parse_only=_SectionFilter(specs))
+            self._partial_html.append(document)
+            self._locate(keys, document)
+        else:
+            self._locate(keys)
+    
     def _inactive_text_exist(self):
         if self._lang=='hun':
-            inactive_text=self.parsed_html.find("div", class_="inactive-text").get_text()
+            inactive_text=self._section('inactive_text').get_text()
         elif self._lang=='eng':
             return None
         return True if inactive_text else False
@@ -366,17 +958,20 @@ class RealEstateHungary:
             return self._inactive_text_exist()
         return is_ad_active
     
-    @property
+    @cached_property
+    @metrics.timed('field_seconds', field='gps_coordinates')
     def gps_coordinates(self):
         if self._lang=='hun':
-            gps_img=self.parsed_html.find("a", class_="static-map", href="#terkep").img.get("src")
+            gps_img=self._section('static_map').img.get("src")
             lat, lng=gps_img.split("&")[2].split("=")[1].split(",")
             gps_coordinates={'lat': float(lat), 'lng': float(lng)}
         elif self._lang=='eng':
-            raw_html=str(self.parsed_html)
-            gps_keyword='map.addMarker'
-            intermed_part=raw_html[raw_html.find(gps_keyword)+len(gps_keyword):]
-            result=re.sub(pattern='[[({})]', string=intermed_part[:intermed_part.find(',title')], repl='')
+            map_script=self._section('map_script')
+            if map_script is None:
+                return {'lat': None, 'lng': None}
+            raw_script=map_script.string
+            intermed_part=raw_script[raw_script.find(self._GPS_KEYWORD)+len(self._GPS_KEYWORD):]
+            result=re.sub(pattern=r'[\[({})]', string=intermed_part[:intermed_part.find(',title')], repl='')
             try:
                 gps_coordinates={v.split(':')[0]: float(v.split(':')[1].strip()) for v in result.split(',')}
             except IndexError:
@@ -391,17 +986,17 @@ class RealEstateHungary:
     def longitude(self):
         return self.gps_coordinates['lng']
     
-    @property
+    @cached_property
+    @metrics.timed('field_seconds', field='full_address')
     def full_address(self):
+        addrs_full=self._section('title').get_text()
         if self._lang=='hun':
-            addrs_full=self.parsed_html.find("h1", class_="js-listing-title").get_text()
             try:
                 city_district, addrs = addrs_full.split(",")
             except ValueError:
                 city_district, addrs = addrs_full, None
             full_addrs_d={'city_district': city_district, 'address': None if addrs is None else addrs.strip()}
         elif self._lang=='eng':
-            addrs_full=self.parsed_html.find(name='h1', class_='ApartmentPage__Title').get_text()
             city_district = ','.join(addrs_full.split(',')[1:])
             full_addrs_d={'city_district': city_district.strip(), 'address': None}
         return full_addrs_d
@@ -414,15 +1009,16 @@ class RealEstateHungary:
     def address(self):
         return self.full_address['address']
     
-    @property
+    @cached_property
+    @metrics.timed('field_seconds', field='main_params')
     def main_params(self):
         if self._lang=='hun':
-            listing_params=self.parsed_html.find('div', class_='listing-parameters')
+            listing_params=self._section('listing_parameters')
             main_params={'_'.join(par.get('class')[1].split('-')[1:]): par.find(name='span', class_='parameter-value').get_text().strip() for par in listing_params.find_all('div')}
             main_params['price']={'huf': main_params['price']}
         elif self._lang=='eng':
-            price_huf=self.parsed_html.find(name='h4', class_='ApartmentPage__Price').get_text()
-            price_eur=self.parsed_html.find(name='span', class_='ApartmentPage__Price--eur').get_text()
+            price_huf=self._section('price_huf').get_text()
+            price_eur=self._section('price_eur').get_text()
             main_params={'price':{'huf': price_huf.strip(), 'eur': price_eur.strip()}}
         return main_params
 
@@ -448,14 +1044,14 @@ class RealEstateHungary:
     def room(self):
         return self.main_params.get('room', None)
 
-    @property
+    @cached_property
+    @metrics.timed('field_seconds', field='param_details')
     def param_details(self):
         if self._lang=='hun':
-            details_l=[td.string for td in self.parsed_html.find("div", class_="paramterers").find_all("td")]
+            details_l=[td.string for td in self._section('parameters').find_all("td")]
             details_d={k.replace(" ", "_").lower(): v.replace(",", "|") for k, v in zip(details_l[::2],details_l[1::2])}
         elif self._lang=='eng':
-            details_section=self.parsed_html.find(name='div', class_='row ApartmentPage__detailsrow')
-            details_cols=details_section.find_all(name='div', class_='col-sm-4')
+            details_cols=self._section('details').find_all(name='div', class_='col-sm-4')
             all_details_d={col.div.label.get_text(): col.div.p.get_text().strip() for col in details_cols}
             NA_STR='n/a'
             details_d={}
@@ -464,11 +1060,12 @@ class RealEstateHungary:
                     details_d.update({k.replace(' ', '_').lower():v})
         return details_d
     
-    @property
+    @cached_property
+    @metrics.timed('field_seconds', field='public_transports')
     def public_transports(self):
         transports={}
         if self._lang=='hun':
-            transports_html=self.parsed_html.find("div", class_="public-transports")
+            transports_html=self._section('public_transports')
             if transports_html:
                 for div in transports_html.find_all("div",class_="public-transport-group"):
                     transport_modes_lines={div.span.get_text().lower(): [a.get_text().strip() for a in div.find_all("a")]}
@@ -479,37 +1076,37 @@ class RealEstateHungary:
             pass
         return transports
 
-    @property
+    @cached_property
+    @metrics.timed('field_seconds', field='desc')
     def desc(self):
         desc=None
+        desc_html_tag=self._section('description')
         if self._lang=='hun':
-            if self.parsed_html.find('div', class_='long-description'):
-                desc_html_tag=self.parsed_html.find('div', class_='long-description')
+            if desc_html_tag:
                 desc=desc_html_tag.get_text()
         elif self._lang=='eng':
-            desc_html_tag=self.parsed_html.find('div', class_='ApartmentPage__section')
             sections=[' '.join(sect.split()) for sect in [p.get_text() for p in desc_html_tag.find_all(name='p')]]
             desc=' '.join(sections)
         return desc
     
-    @property
+    @cached_property
+    @metrics.timed('field_seconds', field='all_attributes')
     def all_attributes(self):
         all_attributes = None
         if self._lang=='hun':
-            head= self.parsed_html.find('head')
-            script = head.find_all('script')[2].get_text().strip()
+            script = self._section('head').find_all('script')[2].string.strip()
             all_attributes = json.loads(script.split('(')[1].split(')')[0])
         return all_attributes
     
-    @property
+    @cached_property
+    @metrics.timed('field_seconds', field='photos')
     def _photos(self):
         if self._lang == 'hun':
-            card_listing = self.parsed_html.find('div', class_='card listing')
-            script = card_listing.script.get_text().strip()
+            script = self._section('photos').script.string.strip()
             photos = json.loads(script.split('=')[1].split(';')[0].strip())
             return photos
         elif self._lang == 'eng':
-            images = self.parsed_html.find('div', class_ = 'row ApartmentImage__list')
+            images = self._section('photos')
             photos = [image.get('href') for image in images.find_all('a')]
             return photos
     
@@ -517,21 +1114,32 @@ class RealEstateHungary:
     def num_photos(self):
         return len(self._photos)
         
-    def extract_photos(self, save_dir):
-        if not os.path.exists(save_dir):
-            os.mkdir(save_dir)
+    def photo_files(self):
+        '''
+        (url, file name) pairs of the photos of the property.
+        '''
+        files = []
         for photo in self._photos:
             if self._lang == 'hun':
                 fp = os.path.split(photo['large_url'])[1]
                 fn, ext = os.path.splitext(fp)
-                save_path = os.path.join(save_dir, '{0}_{1}{2}'.format(fn, photo['label'], ext))
-                r = RequestWithHeaders(photo['large_url'])
+                files.append((photo['large_url'], '{0}_{1}{2}'.format(fn, photo['label'], ext)))
             elif self._lang == 'eng':
                 fn = os.path.split(photo)[1]
                 ext = '.jpg'
-                save_path = os.path.join(save_dir, '{0}{2}'.format(fn, ext))
-                r = RequestWithHeaders(photo)
-            r.download(save_path)
+                files.append((photo, '{0}{1}'.format(fn, ext)))
+        return files
+    
+    @metrics.timed('photos_seconds')
+    def extract_photos(self, save_dir, photo_downloader=None):
+        '''
+        Downloading the photos into save_dir in parallel, waiting for them to finish.
+        With a shared photo_downloader they are only queued and the downloader's owner waits for them.
+        '''
+        if photo_downloader is not None:
+            return photo_downloader.submit(self.property_url, self.photo_files())
+        with PhotoDownloader(save_dir, session=self.session) as downloader:
+            downloader.submit(self.property_url, self.photo_files())
             
     def _extract_single_attrs_to_dict(self):
         single_attrs={'property_url': self.property_url,
@@ -552,12 +1160,80 @@ class RealEstateHungary:
                         **self.public_transports}
         return multiple_attrs
     
-    def extract_attrs(self):
-        single=self._extract_single_attrs_to_dict()
-        multiple=self._extract_multiple_attrs_to_dict()
-        union={**single, **multiple}
-        return union
+    # getters of the fields of extract_attrs, each returning the columns of its field
+    _FIELD_GETTERS={'property_url': lambda self: {'property_url': self.property_url},
+                    'city_district': lambda self: {'city_district': self.city_district},
+                    'address': lambda self: {'address': self.address},
+                    'lot_size': lambda self: {'lot_size': self.lot_size},
+                    'area_size': lambda self: {'area_size': self.area_size},
+                    'room': lambda self: {'room': self.room},
+                    'photos': lambda self: {'photos': self.num_photos},
+                    'desc': lambda self: {'desc': self.desc},
+                    'price_in_huf': lambda self: {'price_in_{}'.format(k): v for k, v in self.price.items() if k=='huf'},
+                    'price_in_eur': lambda self: {'price_in_{}'.format(k): v for k, v in self.price.items() if k=='eur'},
+                    'lat': lambda self: {'lat': self.latitude},
+                    'lng': lambda self: {'lng': self.longitude},
+                    'param_details': lambda self: self.param_details,
+                    'public_transports': lambda self: self.public_transports}
+    FIELDS=tuple(_FIELD_GETTERS)
+    # document regions each field is extracted from
+    _FIELD_SECTIONS={'hun': {'property_url': (),
+                             'city_district': ('title',),
+                             'address': ('title',),
+                             'lot_size': ('listing_parameters',),
+                             'area_size': ('listing_parameters',),
+                             'room': ('listing_parameters',),
+                             'photos': ('photos',),
+                             'desc': ('description',),
+                             'price_in_huf': ('listing_parameters',),
+                             'price_in_eur': ('listing_parameters',),
+                             'lat': ('static_map',),
+                             'lng': ('static_map',),
+                             'param_details': ('parameters',),
+                             'public_transports': ('public_transports',)},
+                     'eng': {'property_url': (),
+                             'city_district': ('title',),
+                             'address': ('title',),
+                             'lot_size': ('details',),
+                             'area_size': ('details',),
+                             'room': ('price_huf', 'price_eur'),
+                             'photos': ('photos',),
+                             'desc': ('description',),
+                             'price_in_huf': ('price_huf', 'price_eur'),
+                             'price_in_eur': ('price_huf', 'price_eur'),
+                             'lat': ('map_script',),
+                             'lng': ('map_script',),
+                             'param_details': ('details',),
+                             'public_transports': ()}}
+    
+    def extract_attrs(self, fields=None):
+        '''
+        Dict of the attributes of the property, all of them or only the given fields, see FIELDS.
+        param_details and public_transports stand for all of their columns.
+        With fields only the document regions they are extracted from are located, and parsed when the page
+        is not parsed yet and the parser allows, e.g. 4 fields of a few regions cost a fraction of a full extraction.
+        '''
+        if fields is None:
+            # located up front, so field_seconds measures the extraction only and not the parse and walk of the first field
+            self._locate(self._SECTIONS[self._lang])
+            single=self._extract_single_attrs_to_dict()
+            multiple=self._extract_multiple_attrs_to_dict()
+            union={**single, **multiple}
+            return union
+        if isinstance(fields, str):
+            fields=[fields]
+        unknown=[field for field in fields if field not in self._FIELD_GETTERS]
+        if unknown:
+            raise ValueError('Please specify fields from the following: {}'.format(', '.join(self.FIELDS)))
+        self._locate_for_fields(fields)
+        attrs={}
+        # in the order of the full extraction
+        for field in self.FIELDS:
+            if field in fields:
+                attrs.update(self._FIELD_GETTERS[field](self))
+        return attrs
     
     def attrs_to_df(self):
+        import pandas as pd
         record=pd.DataFrame(self.extract_attrs())
         return record.dropna(axis=1)
@@ -0,0 +1,155 @@
+import collections
+import os
+import warnings
+import pandas as pd
+from .utils import data_dir
+
+FORMATS = ('parquet', 'csv')
+
+
+def _pyarrow_installed():
+    try:
+        import pyarrow.parquet
+    except ImportError:
+        return False
+    return True
+
+
+class ChunkedWriter:
+    '''
+    Writing a stream of record dicts into date partitioned files under the output/<date>/data/ layout, chunk by chunk,
+    so memory use does not grow with the number of records.
+
+    Records are partitioned by the date part of their timestamp. Each chunk of a partition is a row group of its
+    current part file (raw-00000.parquet, raw-00001.parquet, ...). A new part file is started when a chunk brings
+    columns the current part cannot hold, e.g. a param_details key not seen before.
+
+    Parameters
+    ----------
+    output_dir : string
+        Root of the date directories, e.g. '../output/'.
+    fmt : string
+        'parquet' or 'csv'. Without pyarrow installed, csv is written instead of Parquet.
+    chunk_size : int
+        Number of buffered records per partition before they are written.
+    date_column : string
+        Column holding the '%Y-%m-%d %H:%M:%S' timestamp of the records.
+
+    Examples
+    --------
+    >>> with ChunkedWriter('../output/', fmt='parquet') as writer:
+    ...     for record in crawler.iter_records():
+    ...         writer.write(record)
+    '''
+    def __init__(self, output_dir, fmt='parquet', chunk_size=10000, date_column='timestamp'):
+        if fmt not in FORMATS:
+            raise ValueError('Please specify one of the following formats: {}'.format(', '.join(FORMATS)))
+        if fmt == 'parquet' and not _pyarrow_installed():
+            warnings.warn('pyarrow is not installed, falling back to csv.')
+            fmt = 'csv'
+        self.output_dir = output_dir
+        self.fmt = fmt
+        self.chunk_size = chunk_size
+        self.date_column = date_column
+        self._buffers = collections.defaultdict(list)
+        self._parts = {}
+        self.paths = []
+        self.rows_written = 0
+
+    def __repr__(self):
+        return 'ChunkedWriter({0}, fmt={1}, rows_written={2})'.format(self.output_dir, self.fmt, self.rows_written)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def _date_name(self, record):
+        timestamp = record.get(self.date_column)
+        if timestamp is None:
+            return 'undated'
+        return str(timestamp)[:10]
+
+    def write(self, record):
+        date_name = self._date_name(record)
+        buffer = self._buffers[date_name]
+        buffer.append(record)
+        if len(buffer) >= self.chunk_size:
+            self._flush(date_name)
+
+    def write_all(self, records):
+        for record in records:
+            self.write(record)
+        return self
+
+    def _new_part_path(self, date_name):
+        target_dir = data_dir(self.output_dir, date_name)
+        part_num = 0
+        while True:
+            path = os.path.join(target_dir, 'raw-{0:05d}.{1}'.format(part_num, self.fmt))
+            if not os.path.exists(path) and path not in self.paths:
+                self.paths.append(path)
+                return path
+            part_num += 1
+
+    def _flush(self, date_name):
+        records = self._buffers.pop(date_name, None)
+        if not records:
+            return
+        columns = list(dict.fromkeys(key for record in records for key in record))
+        chunk = pd.DataFrame.from_records(records, columns=columns)
+        if self.fmt == 'csv':
+            self._write_csv(date_name, chunk)
+        else:
+            self._write_parquet(date_name, chunk)
+        self.rows_written += len(chunk)
+
+    def _write_csv(self, date_name, chunk):
+        part = self._parts.get(date_name)
+        if part is None or not set(chunk.columns) <= set(part['columns']):
+            part = {'path': self._new_part_path(date_name), 'columns': list(chunk.columns)}
+            self._parts[date_name] = part
+            chunk.to_csv(part['path'], index=False)
+        else:
+            chunk.reindex(columns=part['columns']).to_csv(part['path'], mode='a', header=False, index=False)
+
+    def _write_parquet(self, date_name, chunk):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        part = self._parts.get(date_name)
+        if part is not None and set(chunk.columns) <= set(part['writer'].schema.names):
+            try:
+                table = pa.Table.from_pandas(chunk.reindex(columns=part['writer'].schema.names), schema=part['writer'].schema, preserve_index=False)
+                part['writer'].write_table(table)
+                return
+            except (pa.ArrowInvalid, pa.ArrowTypeError):
+                pass
+        if part is not None:
+            part['writer'].close()
+        table = pa.Table.from_pandas(chunk, preserve_index=False)
+        writer = pq.ParquetWriter(self._new_part_path(date_name), table.schema)
+        writer.write_table(table)
+        self._parts[date_name] = {'writer': writer}
+
+    def flush(self):
+        for date_name in list(self._buffers):
+            self._flush(date_name)
+
+    def close(self):
+        self.flush()
+        for part in self._parts.values():
+            if 'writer' in part:
+                part['writer'].close()
+        self._parts = {}
+
+
+def write_records(records, output_dir, fmt='parquet', chunk_size=10000):
+    '''
+    Streaming an iterable of record dicts, e.g. Crawler.iter_records(), into output/<date>/data/. Returns the written paths,
+    csv files when fmt is 'parquet' but pyarrow is not installed.
+    '''
+    with ChunkedWriter(output_dir, fmt=fmt, chunk_size=chunk_size) as writer:
+        writer.write_all(records)
+    return writer.paths
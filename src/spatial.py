@@ -0,0 +1,228 @@
+import os
+import numpy as np
+import pandas as pd
+
+EARTH_RADIUS = 6371008.8
+METERS_PER_DEGREE = np.pi * EARTH_RADIUS / 180
+
+
+def haversine(lat1, lng1, lat2, lng2):
+    '''
+    Great-circle distance in meters between points given in degrees, vectorized over numpy arrays.
+    '''
+    lat1, lng1, lat2, lng2 = (np.radians(a) for a in (lat1, lng1, lat2, lng2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.minimum(a, 1.)))
+
+
+def index_path(snapshot_path):
+    return '{}.spatial.npz'.format(os.path.splitext(snapshot_path)[0])
+
+
+class SpatialIndex:
+    '''
+    Grid index over the coordinates of listings for radius, k-nearest and bounding box queries.
+
+    The points are kept sorted by the key of their grid cell, row by row, so the cells of a latitude row in a query
+    box are one contiguous slice found by binary search. Distances are haversine. New points go to a small unsorted
+    buffer that is scanned as it is, and merged into the sorted arrays once it holds merge_every points.
+
+    Parameters
+    ----------
+    ids : array-like, optional
+        Identifiers of the points, e.g. property ids. Adding an existing id moves the point.
+    lat : array-like, optional
+    lng : array-like, optional
+        Coordinates in degrees, points with a missing coordinate are left out.
+    cell_size : float
+        Size of the grid cells in degrees, about 1 km at the default.
+    merge_every : int
+        Size of the buffer of added points.
+
+    Examples
+    --------
+    >>> index=SpatialIndex.for_snapshot('../output/2020-03-01/data/raw.csv')
+    >>> ids, meters=index.radius(47.4979, 19.0402, 500)
+    >>> ids, meters=index.knn(47.4979, 19.0402, k=10)
+    >>> ids=index.bbox(47.49, 19.03, 47.51, 19.06)
+    '''
+    def __init__(self, ids=(), lat=(), lng=(), cell_size=0.01, merge_every=10000):
+        self.cell_size = cell_size
+        self.merge_every = merge_every
+        self._row_width = int(np.ceil(360 / cell_size)) + 1
+        self._set_sorted(*self._clean(ids, lat, lng))
+        self._pending_ids, self._pending_lat, self._pending_lng = self._clean((), (), ())
+
+    def __repr__(self):
+        return 'SpatialIndex(points={0}, cell_size={1})'.format(len(self), self.cell_size)
+
+    def __len__(self):
+        return int(self._alive.sum()) + len(self._pending_ids)
+
+    def __contains__(self, point_id):
+        point_id = str(point_id)
+        position = self._positions.get(point_id)
+        if position is not None and self._alive[position]:
+            return True
+        return bool(np.any(self._pending_ids == point_id))
+
+    @staticmethod
+    def _clean(ids, lat, lng):
+        ids = np.asarray(ids, dtype=str)
+        lat = np.asarray(lat, dtype=float)
+        lng = np.asarray(lng, dtype=float)
+        if not len(ids) == len(lat) == len(lng):
+            raise ValueError('Please specify ids, lat and lng of the same length.')
+        valid = ~(np.isnan(lat) | np.isnan(lng))
+        return ids[valid], lat[valid], lng[valid]
+
+    def _cell(self, lat, lng):
+        return np.floor((np.asarray(lat) + 90) / self.cell_size).astype(np.int64), np.floor((np.asarray(lng) + 180) / self.cell_size).astype(np.int64)
+
+    def _keys(self, lat, lng):
+        rows, cols = self._cell(lat, lng)
+        return rows * self._row_width + cols
+
+    def _set_sorted(self, ids, lat, lng):
+        keys = self._keys(lat, lng)
+        order = np.argsort(keys, kind='stable')
+        self._ids, self._lat, self._lng, self._cell_keys = ids[order], lat[order], lng[order], keys[order]
+        self._alive = np.ones(len(ids), dtype=bool)
+        self._positions = {point_id: i for i, point_id in enumerate(self._ids)}
+
+    def _merge(self):
+        alive = self._alive
+        self._set_sorted(np.concatenate([self._ids[alive], self._pending_ids]),
+                         np.concatenate([self._lat[alive], self._pending_lat]),
+                         np.concatenate([self._lng[alive], self._pending_lng]))
+        self._pending_ids, self._pending_lat, self._pending_lng = self._clean((), (), ())
+
+    def remove(self, ids):
+        ids = np.asarray(ids, dtype=str)
+        for point_id in ids:
+            position = self._positions.get(point_id)
+            if position is not None:
+                self._alive[position] = False
+        if len(self._pending_ids):
+            keep = ~np.isin(self._pending_ids, ids)
+            self._pending_ids, self._pending_lat, self._pending_lng = self._pending_ids[keep], self._pending_lat[keep], self._pending_lng[keep]
+
+    def add(self, ids, lat, lng):
+        '''
+        Adding new points, or moving the existing points of the ids.
+        '''
+        ids, lat, lng = self._clean(ids, lat, lng)
+        # the last occurrence of a repeated id wins
+        _, last = np.unique(ids[::-1], return_index=True)
+        last = np.sort(len(ids) - 1 - last)
+        ids, lat, lng = ids[last], lat[last], lng[last]
+        self.remove(ids)
+        self._pending_ids = np.concatenate([self._pending_ids, ids])
+        self._pending_lat = np.concatenate([self._pending_lat, lat])
+        self._pending_lng = np.concatenate([self._pending_lng, lng])
+        if len(self._pending_ids) >= self.merge_every:
+            self._merge()
+
+    def add_records(self, records, id_key='property_id'):
+        '''
+        Adding the points of record dicts, e.g. the ones of Crawler.iter_records, as they arrive.
+        '''
+        records = [r for r in records if r.get('lat') is not None and r.get('lng') is not None]
+        self.add([r.get(id_key) or r.get('property_url') for r in records], [r['lat'] for r in records], [r['lng'] for r in records])
+
+    def _gather(self, min_lat, min_lng, max_lat, max_lng):
+        min_row, min_col = self._cell(min_lat, max(min_lng, -180.))
+        max_row, max_col = self._cell(max_lat, min(max_lng, 180.))
+        rows = np.arange(min_row, max_row + 1, dtype=np.int64)
+        starts = np.searchsorted(self._cell_keys, rows * self._row_width + min_col, side='left')
+        ends = np.searchsorted(self._cell_keys, rows * self._row_width + max_col, side='right')
+        lengths = ends - starts
+        # positions of all the points in the slices of the rows, without a Python loop over the rows
+        positions = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        positions = positions[self._alive[positions]]
+        ids = np.concatenate([self._ids[positions], self._pending_ids])
+        lat = np.concatenate([self._lat[positions], self._pending_lat])
+        lng = np.concatenate([self._lng[positions], self._pending_lng])
+        inside = (lat >= min_lat) & (lat <= max_lat) & (lng >= min_lng) & (lng <= max_lng)
+        return ids[inside], lat[inside], lng[inside]
+
+    def bbox(self, min_lat, min_lng, max_lat, max_lng):
+        '''
+        Ids of the points inside the bounding box.
+        '''
+        return self._gather(min_lat, min_lng, max_lat, max_lng)[0]
+
+    def radius(self, lat, lng, meters):
+        '''
+        Ids and distances in meters of the points within meters of (lat, lng), nearest first.
+        '''
+        dlat = meters / METERS_PER_DEGREE
+        # a degree of longitude is shortest at the edge of the box farthest from the equator, the box is widened
+        # for that latitude so the points near its poleward corners are not cut off
+        far_lat = min(max(abs(lat - dlat), abs(lat + dlat)), 90.)
+        dlng = min(dlat / max(np.cos(np.radians(far_lat)), 1e-6), 360.)
+        ids, lats, lngs = self._gather(lat - dlat, lng - dlng, lat + dlat, lng + dlng)
+        distances = haversine(lat, lng, lats, lngs)
+        within = distances <= meters
+        ids, distances = ids[within], distances[within]
+        order = np.argsort(distances, kind='stable')
+        return ids[order], distances[order]
+
+    def knn(self, lat, lng, k=10):
+        '''
+        Ids and distances in meters of the k points nearest to (lat, lng), nearest first.
+        '''
+        meters = self.cell_size * METERS_PER_DEGREE
+        while True:
+            # every point within the searched radius is found, so k of them there are the k nearest
+            ids, distances = self.radius(lat, lng, meters)
+            if len(ids) >= k or meters >= np.pi * EARTH_RADIUS:
+                return ids[:k], distances[:k]
+            meters *= 4 if len(ids) == 0 else 2
+
+    def to_frame(self):
+        self._merge()
+        return pd.DataFrame({'id': self._ids, 'lat': self._lat, 'lng': self._lng})
+
+    def save(self, path):
+        self._merge()
+        tmp_path = '{0}.{1}.tmp.npz'.format(path, os.getpid())
+        np.savez_compressed(tmp_path, ids=self._ids, lat=self._lat, lng=self._lng, cell_size=self.cell_size)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, merge_every=10000):
+        with np.load(path) as data:
+            index = cls(cell_size=float(data['cell_size']), merge_every=merge_every)
+            # saved sorted by cell key, only the lookup of the ids is rebuilt
+            index._ids, index._lat, index._lng = data['ids'], data['lat'], data['lng']
+        index._cell_keys = index._keys(index._lat, index._lng)
+        index._alive = np.ones(len(index._ids), dtype=bool)
+        index._positions = {point_id: i for i, point_id in enumerate(index._ids)}
+        return index
+
+    @classmethod
+    def from_frame(cls, df, id_column='property_id', **kwargs):
+        ids = df[id_column] if id_column in df.columns else pd.Series(None, index=df.index, dtype=object)
+        if 'property_url' in df.columns:
+            ids = ids.where(ids.notna(), df['property_url'])
+        return cls(ids.astype(str).to_numpy(), pd.to_numeric(df['lat'], errors='coerce'), pd.to_numeric(df['lng'], errors='coerce'), **kwargs)
+
+    @classmethod
+    def for_snapshot(cls, snapshot_path, **kwargs):
+        '''
+        Index of a raw.csv or Parquet snapshot, stored next to it as raw.spatial.npz and rebuilt when the
+        snapshot is newer.
+        '''
+        path = index_path(snapshot_path)
+        if os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(snapshot_path):
+            return cls.load(path)
+        columns = ['property_id', 'property_url', 'lat', 'lng']
+        if snapshot_path.endswith('.parquet'):
+            import pyarrow.parquet as pq
+            df = pd.read_parquet(snapshot_path, columns=[c for c in columns if c in pq.read_schema(snapshot_path).names])
+        else:
+            df = pd.read_csv(snapshot_path, usecols=lambda c: c in columns, dtype={'property_id': str})
+        index = cls.from_frame(df, **kwargs)
+        index.save(path)
+        return index
@@ -0,0 +1,255 @@
+import collections
+import glob
+import json
+import os
+import shutil
+import pandas as pd
+from .normalize import normalize
+
+PARTITIONS = ('date', 'lang', 'property_type')
+PRICE_COLUMNS = ['price_huf', 'price_eur']
+STATE_COLUMNS = ['key', 'property_id', 'cluster_id', 'lang'] + PRICE_COLUMNS + ['valid_from', 'last_seen']
+CHANGE_COLUMNS = ['key', 'property_id', 'cluster_id', 'lang'] + PRICE_COLUMNS + ['valid_from', 'valid_to']
+
+
+def _pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError('Please install pyarrow to use the listing store.')
+    return pa, ds, pq
+
+
+def listing_key(df):
+    '''
+    Stable key of the listings, '<lang>:<property_id>', the property_url stands in for a missing id.
+    '''
+    ids = df['property_id'] if 'property_id' in df.columns else pd.Series(None, index=df.index, dtype=object)
+    if 'property_url' in df.columns:
+        ids = ids.where(ids.notna(), df['property_url'])
+    lang = df['lang'].astype(str) if 'lang' in df.columns else pd.Series('', index=df.index)
+    return lang.str.cat(ids.astype(str), sep=':')
+
+
+class ListingStore:
+    '''
+    Columnar store of listing snapshots: Parquet files partitioned as listings/date=<date>/lang=<lang>/property_type=<type>/,
+    each sorted by key, so scans read only the partitions, columns and row groups they need.
+
+    Snapshots are normalized (see normalize.normalize, the raw strings are kept too) and keyed by listing_key.
+    Ingesting them in date order maintains a type 2 slowly changing dimension of the prices: price_state.parquet
+    holds the current price of every key since valid_from, and each price change closes the previous version
+    into price_changes/date=<date>/ with its valid_to, so history is never recomputed from the snapshots.
+
+    Parameters
+    ----------
+    root : string
+        Directory of the store.
+
+    Examples
+    --------
+    >>> store=ListingStore('../store/')
+    >>> store.ingest_output_dir('../output/')
+    >>> store.scan(columns=['key', 'price_huf', 'area_size'], filters=[('lang', '=', 'hun'), ('price_huf', '<', 50000000)])
+    >>> store.history('31337')
+    >>> store.price_history('31337')
+    '''
+    def __init__(self, root):
+        self.root = root
+        self.listings_dir = os.path.join(root, 'listings')
+        self.changes_dir = os.path.join(root, 'price_changes')
+        self.state_path = os.path.join(root, 'price_state.parquet')
+        self.log_path = os.path.join(root, 'ingested.json')
+        os.makedirs(self.listings_dir, exist_ok=True)
+        os.makedirs(self.changes_dir, exist_ok=True)
+        self.ingested = self._load_log()
+
+    def __repr__(self):
+        return 'ListingStore({0}, dates={1})'.format(self.root, len(self.ingested))
+
+    def _load_log(self):
+        try:
+            with open(self.log_path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_log(self):
+        tmp_path = '{0}.{1}.tmp'.format(self.log_path, os.getpid())
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.ingested, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.log_path)
+
+    @staticmethod
+    def _read_snapshot(path):
+        if path.endswith('.parquet'):
+            return pd.read_parquet(path)
+        return pd.read_csv(path, dtype=str)
+
+    @staticmethod
+    def _plain(df):
+        # categories of different files would carry different dictionaries, Parquet dictionary-encodes them anyway
+        return df.astype({c: object for c in df.columns if isinstance(df[c].dtype, pd.CategoricalDtype)})
+
+    def _write_partition(self, values, part):
+        pa, ds, pq = _pyarrow()
+        part_dir = os.path.join(self.listings_dir, *['{0}={1}'.format(k, v) for k, v in zip(PARTITIONS, values)])
+        os.makedirs(part_dir, exist_ok=True)
+        path = os.path.join(part_dir, 'part-{0:05d}.parquet'.format(len(glob.glob(os.path.join(part_dir, 'part-*.parquet')))))
+        table = pa.Table.from_pandas(self._plain(part.drop(columns=list(PARTITIONS))).sort_values('key'), preserve_index=False)
+        pq.write_table(table, path, row_group_size=50000)
+        return path
+
+    def ingest(self, snapshot, date=None):
+        '''
+        Adding a snapshot, a DataFrame of records or the path of a raw.csv/Parquet file, partitioned by the date part
+        of its timestamp column (or date). Dates must come in order, an already ingested date is skipped and a date
+        older than the last ingested one raises ValueError. A date counts as ingested once it is in the log, the files
+        left by an ingest interrupted before that are replaced when the date is ingested again.
+        Returns the number of ingested rows and price changes by date.
+        '''
+        df = self._read_snapshot(snapshot) if isinstance(snapshot, str) else snapshot
+        typed = normalize(df, keep_raw=True)
+        typed['key'] = listing_key(typed)
+        if date is not None:
+            typed['date'] = str(date)[:10]
+        elif 'timestamp' in typed.columns:
+            typed['date'] = typed['timestamp'].dt.strftime('%Y-%m-%d').fillna('undated')
+        else:
+            raise ValueError('Please specify the date of a snapshot without timestamp column.')
+        for column in PARTITIONS[1:]:
+            typed[column] = typed[column].astype(object).fillna('unknown') if column in typed.columns else 'unknown'
+        results = {}
+        for date_name, rows in typed.groupby('date', sort=True):
+            if date_name in self.ingested:
+                continue
+            if self.ingested and date_name < max(self.ingested):
+                raise ValueError('Please ingest the snapshots in date order, {0} is older than {1}.'.format(date_name, max(self.ingested)))
+            rows = rows.drop_duplicates('key', keep='last')
+            # part files of an interrupted ingest of the date, they would be scanned twice next to the new ones
+            shutil.rmtree(os.path.join(self.listings_dir, 'date={}'.format(date_name)), ignore_errors=True)
+            paths = [self._write_partition(values, part) for values, part in rows.groupby(list(PARTITIONS), sort=True, observed=True)]
+            if self._state_date() == date_name:
+                # the prices were updated before the interruption, updating them again would find no changes
+                num_changes = self._num_changes(date_name)
+            else:
+                num_changes = self._update_prices(date_name, rows)
+            self.ingested[date_name] = {'rows': len(rows), 'price_changes': num_changes, 'files': len(paths)}
+            self._save_log()
+            results[date_name] = self.ingested[date_name]
+        return results
+
+    def ingest_output_dir(self, output_dir):
+        '''
+        Ingesting every snapshot of the output/<date>/data/ layout in date order.
+        '''
+        paths = sorted(glob.glob(os.path.join(output_dir, '*', 'data', 'raw*.csv')) + glob.glob(os.path.join(output_dir, '*', 'data', 'raw*.parquet')))
+        by_date_dir = collections.defaultdict(list)
+        for path in paths:
+            by_date_dir[os.path.dirname(os.path.dirname(path))].append(path)
+        results = {}
+        for date_dir in sorted(by_date_dir):
+            # the part files of ChunkedWriter make up one snapshot
+            results.update(self.ingest(pd.concat([self._read_snapshot(path) for path in by_date_dir[date_dir]], ignore_index=True)))
+        return results
+
+    def price_state(self):
+        if not os.path.exists(self.state_path):
+            return pd.DataFrame({c: pd.Series(dtype='Int64' if c in PRICE_COLUMNS else object) for c in STATE_COLUMNS})
+        return pd.read_parquet(self.state_path)
+
+    def _state_date(self):
+        # date of the last snapshot applied to the price state
+        state = self.price_state()
+        return state['last_seen'].max() if len(state) else None
+
+    def _num_changes(self, date_name):
+        pa, ds, pq = _pyarrow()
+        path = os.path.join(self.changes_dir, 'date={}'.format(date_name), 'part-00000.parquet')
+        return pq.read_metadata(path).num_rows if os.path.exists(path) else 0
+
+    def _update_prices(self, date_name, rows):
+        pa, ds, pq = _pyarrow()
+        current = rows.reindex(columns=STATE_COLUMNS[:-2]).copy()
+        current['property_id'] = current['property_id'].astype(object)
+        current['cluster_id'] = current['cluster_id'].astype(object)
+        current['lang'] = current['lang'].astype(object)
+        for column in PRICE_COLUMNS:
+            current[column] = current[column].astype('Int64')
+        state = self.price_state().set_index('key')
+        previous = state.reindex(current['key'])
+        seen = previous['valid_from'].notna().to_numpy()
+        changed = seen & pd.concat([current[c].fillna(-1).reset_index(drop=True) != previous[c].fillna(-1).reset_index(drop=True)
+                                    for c in PRICE_COLUMNS], axis=1).any(axis=1).to_numpy()
+        if changed.any():
+            closed = previous[changed].reset_index()
+            closed['valid_to'] = date_name
+            change_dir = os.path.join(self.changes_dir, 'date={}'.format(date_name))
+            os.makedirs(change_dir, exist_ok=True)
+            pq.write_table(pa.Table.from_pandas(closed.reindex(columns=CHANGE_COLUMNS), preserve_index=False), os.path.join(change_dir, 'part-00000.parquet'))
+        current['valid_from'] = previous['valid_from'].where(seen & ~changed, date_name).to_numpy()
+        current['last_seen'] = date_name
+        new_state = pd.concat([state.drop(index=current['key'], errors='ignore').reset_index(), current], ignore_index=True).reindex(columns=STATE_COLUMNS)
+        tmp_path = '{0}.{1}.tmp'.format(self.state_path, os.getpid())
+        pq.write_table(pa.Table.from_pandas(new_state.sort_values('key'), preserve_index=False), tmp_path)
+        os.replace(tmp_path, self.state_path)
+        return int(changed.sum())
+
+    def _dataset(self, path, partitioning):
+        pa, ds, pq = _pyarrow()
+        files = sorted(glob.glob(os.path.join(path, '**', '*.parquet'), recursive=True))
+        if not files:
+            return None
+        # snapshots differ in their param_details columns, the files are read with the union of their schemas
+        schema = pa.unify_schemas([pq.read_schema(f) for f in files], promote_options='permissive')
+        partition_schema = pa.schema([(name, pa.string()) for name in partitioning])
+        return ds.dataset(files, schema=pa.unify_schemas([schema, partition_schema]), format='parquet',
+                          partitioning=ds.partitioning(partition_schema, flavor='hive'), partition_base_dir=path)
+
+    def scan(self, columns=None, filters=None):
+        '''
+        DataFrame of the stored listings, reading only the given columns and the partitions and row groups that may
+        match filters, given as in pandas.read_parquet, e.g. [('date', '>=', '2020-03-01'), ('lang', '=', 'hun')].
+        '''
+        pa, ds, pq = _pyarrow()
+        dataset = self._dataset(self.listings_dir, PARTITIONS)
+        if dataset is None:
+            return pd.DataFrame(columns=columns)
+        expression = pq.filters_to_expression(filters) if filters else None
+        return dataset.to_table(columns=columns, filter=expression).to_pandas()
+
+    def history(self, property_id, lang=None, columns=None):
+        '''
+        Every stored snapshot row of a listing, oldest first.
+        '''
+        filters = [('property_id', '=', str(property_id))]
+        if lang is not None:
+            filters.append(('lang', '=', lang))
+        return self.scan(columns=columns, filters=filters).sort_values('date', ignore_index=True)
+
+    def price_changes(self, since=None):
+        '''
+        Closed price versions: the price of a key from valid_from until the change on valid_to.
+        '''
+        pa, ds, pq = _pyarrow()
+        dataset = self._dataset(self.changes_dir, ('date',))
+        if dataset is None:
+            return pd.DataFrame(columns=CHANGE_COLUMNS)
+        expression = ds.field('valid_to') >= since if since is not None else None
+        return dataset.to_table(columns=CHANGE_COLUMNS, filter=expression).to_pandas()
+
+    def scd(self):
+        '''
+        Type 2 slowly changing dimension of the prices, the current versions have no valid_to.
+        '''
+        current = self.price_state().drop(columns='last_seen').assign(valid_to=None)
+        return pd.concat([self.price_changes(), current], ignore_index=True).sort_values(['key', 'valid_from'], ignore_index=True)
+
+    def price_history(self, property_id, lang=None):
+        scd = self.scd()
+        matches = scd['property_id'].astype(str) == str(property_id)
+        if lang is not None:
+            matches &= scd['lang'] == lang
+        return scd[matches].reset_index(drop=True)
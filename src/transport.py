@@ -0,0 +1,435 @@
+import base64
+import contextlib
+import gzip
+import http.client
+import io
+import socket
+import ssl
+import threading
+import time
+import zlib
+from collections import namedtuple
+from urllib.error import HTTPError
+from urllib.parse import unquote, urljoin, urlsplit
+from urllib.request import getproxies, proxy_bypass_environment
+from .scheduler import Scheduler
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+Response = namedtuple('Response', ['url', 'status', 'headers', 'content'])
+
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+MAX_REDIRECTS = 10
+
+
+def decode_content(content, encoding):
+    encoding = (encoding or '').strip().lower()
+    if encoding in ('', 'identity'):
+        return content
+    elif encoding in ('gzip', 'x-gzip'):
+        return gzip.decompress(content)
+    elif encoding == 'deflate':
+        try:
+            return zlib.decompress(content)
+        except zlib.error:
+            return zlib.decompress(content, -zlib.MAX_WBITS)
+    elif encoding == 'br':
+        if brotli is None:
+            raise ValueError('Brotli encoded response received, please install brotli package.')
+        return brotli.decompress(content)
+    raise ValueError('Unsupported content encoding: {}'.format(encoding))
+
+
+class _BrotliDecoder:
+    def __init__(self):
+        self._decompressor = brotli.Decompressor()
+
+    def decompress(self, chunk):
+        return self._decompressor.process(chunk)
+
+    def flush(self):
+        return b''
+
+
+class _DeflateDecoder:
+    # deflate comes zlib wrapped or raw, as decode_content the first chunk tells which
+    def __init__(self):
+        self._decompressor = None
+
+    def decompress(self, chunk):
+        if self._decompressor is None:
+            self._decompressor = zlib.decompressobj()
+            try:
+                return self._decompressor.decompress(chunk)
+            except zlib.error:
+                self._decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+        return self._decompressor.decompress(chunk)
+
+    def flush(self):
+        return b'' if self._decompressor is None else self._decompressor.flush()
+
+
+def content_decoder(encoding):
+    '''
+    Incremental decoder of a streamed body with the given Content-Encoding, None if it is not encoded.
+    '''
+    encoding = (encoding or '').strip().lower()
+    if encoding in ('', 'identity'):
+        return None
+    elif encoding in ('gzip', 'x-gzip'):
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    elif encoding == 'deflate':
+        return _DeflateDecoder()
+    elif encoding == 'br':
+        if brotli is None:
+            raise ValueError('Brotli encoded response received, please install brotli package.')
+        return _BrotliDecoder()
+    raise ValueError('Unsupported content encoding: {}'.format(encoding))
+
+
+def parse_retry_after(value):
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0.)
+    except ValueError:
+        pass
+    try:
+        from email.utils import parsedate_to_datetime
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.)
+    except (TypeError, ValueError):
+        return None
+
+
+class Session:
+    '''
+    Shared HTTP transport keeping alive a pool of connections per host.
+
+    Parameters
+    ----------
+    timeout : float
+        Socket timeout of a single request in seconds.
+    pool_size : int
+        Maximum number of idle connections kept alive per host.
+    max_retries : int
+        Number of retries on connection errors and on 429/5xx responses.
+    backoff_factor : float
+        Sleep between retries is backoff_factor * 2 ** (retry - 1) seconds, unless the server sends Retry-After.
+    cache : cache.ResponseCache, optional
+        Response cache consulted before the network, see its mode for record and replay.
+    scheduler : scheduler.Scheduler, optional
+        Per-host rate and concurrency limits every request to the network waits for, cache hits are not limited.
+    proxies : dict, optional
+        Proxy URL by scheme and the hosts to reach directly under 'no', as urllib.request.getproxies returns them,
+        which is the default: HTTP_PROXY, HTTPS_PROXY and NO_PROXY. HTTPS goes through a CONNECT tunnel, credentials
+        of the proxy URL are sent as Basic Proxy-Authorization.
+
+    Examples
+    --------
+    >>> session=Session(timeout=10)
+    >>> resp=session.request('https://www.python.org/dev/peps/pep-0020/')
+    >>> resp.status
+    200
+    >>> session.stats['pool_misses']
+    1
+    '''
+    def __init__(self, timeout=30., pool_size=10, max_retries=3, backoff_factor=0.5, retry_statuses=RETRY_STATUSES, cache=None, scheduler=None,
+                 proxies=None):
+        self.timeout = timeout
+        self.proxies = getproxies() if proxies is None else dict(proxies)
+        self._routes = {}
+        self.cache = cache
+        self.scheduler = scheduler
+        self.pool_size = pool_size
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.retry_statuses = tuple(retry_statuses)
+        self._ssl_context = None
+        self._pools = {}
+        self._lock = threading.Lock()
+        self.stats = {'requests': 0, 'pool_hits': 0, 'pool_misses': 0, 'retries': 0, 'bytes': 0}
+
+    @property
+    def ssl_context(self):
+        # loading the CA bundle takes a while, sessions served from a cache or talking plain HTTP never do it
+        if self._ssl_context is None:
+            import certifi
+            self._ssl_context = ssl.create_default_context(cafile=certifi.where())
+        return self._ssl_context
+
+    def __repr__(self):
+        return 'Session(hosts={0}, stats={1})'.format(len(self._pools), self.stats)
+
+    def _count(self, key, value=1):
+        with self._lock:
+            self.stats[key] += value
+
+    def _proxy(self, scheme, host):
+        '''
+        (host, port, headers) of the proxy to reach host through, None for a direct connection.
+        '''
+        key = (scheme, host)
+        if key not in self._routes:
+            proxy = self.proxies.get(scheme)
+            route = None
+            if proxy and not proxy_bypass_environment(host, self.proxies):
+                split = urlsplit(proxy if '://' in proxy else 'http://' + proxy)
+                headers = {}
+                if split.username is not None:
+                    credentials = '{0}:{1}'.format(unquote(split.username), unquote(split.password or ''))
+                    headers['Proxy-Authorization'] = 'Basic ' + base64.b64encode(credentials.encode('utf-8')).decode('ascii')
+                route = (split.hostname, split.port or (443 if split.scheme == 'https' else 80), headers)
+            self._routes[key] = route
+        return self._routes[key]
+
+    def _connect(self, scheme, host, port):
+        proxy = self._proxy(scheme, host)
+        if proxy is None:
+            if scheme == 'https':
+                return http.client.HTTPSConnection(host, port, timeout=self.timeout, context=self.ssl_context)
+            return http.client.HTTPConnection(host, port, timeout=self.timeout)
+        proxy_host, proxy_port, proxy_headers = proxy
+        if scheme == 'https':
+            conn = http.client.HTTPSConnection(proxy_host, proxy_port, timeout=self.timeout, context=self.ssl_context)
+            conn.set_tunnel(host, port, headers=proxy_headers)
+            return conn
+        # plain HTTP is forwarded by the proxy, the requests carry the absolute URL
+        return http.client.HTTPConnection(proxy_host, proxy_port, timeout=self.timeout)
+
+    def _acquire(self, scheme, host, port):
+        with self._lock:
+            idle = self._pools.setdefault((scheme, host, port), [])
+            if idle:
+                self.stats['pool_hits'] += 1
+                return idle.pop(), True
+            self.stats['pool_misses'] += 1
+        return self._connect(scheme, host, port), False
+
+    def _release(self, scheme, host, port, conn, reusable):
+        if reusable:
+            with self._lock:
+                idle = self._pools.setdefault((scheme, host, port), [])
+                if len(idle) < self.pool_size:
+                    idle.append(conn)
+                    return
+        conn.close()
+
+    def close(self):
+        with self._lock:
+            pools, self._pools = self._pools, {}
+        for idle in pools.values():
+            for conn in idle:
+                conn.close()
+
+    def _open(self, url, headers, method):
+        split = urlsplit(url)
+        scheme, host = split.scheme.lower(), split.hostname
+        port = split.port or (443 if scheme == 'https' else 80)
+        path = split.path or '/'
+        if split.query:
+            path = '{0}?{1}'.format(path, split.query)
+        req_headers = {'Accept-Encoding': 'gzip, deflate, br' if brotli is not None else 'gzip, deflate'}
+        req_headers.update(headers or {})
+        proxy = self._proxy(scheme, host) if scheme == 'http' else None
+        if proxy is not None:
+            path = '{0}://{1}{2}'.format(scheme, split.netloc.rpartition('@')[2], path)
+            req_headers.update(proxy[2])
+        conn, reused = self._acquire(scheme, host, port)
+        while True:
+            try:
+                conn.request(method, path, headers=req_headers)
+                return conn.getresponse(), conn, (scheme, host, port)
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                conn.close()
+                if not reused:
+                    raise
+                # the idle connection was dropped by the server, try once more on a fresh one
+                conn, reused = self._connect(scheme, host, port), False
+            except BaseException:
+                conn.close()
+                raise
+
+    def _send(self, url, headers, method):
+        '''
+        Response, body and the monotonic time its headers arrived at.
+        '''
+        resp, conn, pool_key = self._open(url, headers, method)
+        headers_at = time.monotonic()
+        try:
+            raw = resp.read()
+        except BaseException:
+            conn.close()
+            raise
+        self._release(*pool_key, conn, not resp.will_close)
+        return resp, raw, headers_at
+
+    def _schedule(self, url, priority):
+        if self.scheduler is None:
+            return None
+        return self.scheduler.acquire(url, priority)
+
+    def _unschedule(self, slot, status=None, retry_after=None, latency=None):
+        if slot is not None:
+            self.scheduler.release(slot, status, latency, retry_after)
+
+    @staticmethod
+    def _latency(slot, headers_at):
+        # time to the response headers, the body read is not part of the latency the scheduler adapts to
+        return None if slot is None else headers_at - slot.started_at
+
+    def _wait_before_retry(self, attempt, retry_after=None):
+        if retry_after is None:
+            time.sleep(self.backoff_factor * 2 ** (attempt - 1))
+        elif self.scheduler is None:
+            time.sleep(retry_after)
+        # otherwise the scheduler keeps the whole host paused for retry_after
+
+    @contextlib.contextmanager
+    def stream(self, url, headers=None, chunk_size=64 * 1024, priority=None):
+        '''
+        Streaming the body of a GET request in decoded chunks instead of holding it in memory, bypassing the cache.
+        Yields a Response whose content is an iterator of chunks. 304 Not Modified is yielded, 4xx/5xx raise HTTPError.
+        Connection errors and retry_statuses are retried with backoff like request does, until the headers arrive.
+        A body left unread closes the connection instead of returning it to the pool.
+        The scheduler slot, if any, is held until the body is consumed.
+
+        Examples
+        --------
+        >>> with session.stream(url) as resp:
+        ...     for chunk in resp.content:
+        ...         f.write(chunk)
+        '''
+        redirects = 0
+        attempt = 0
+        while True:
+            self._count('requests')
+            slot = self._schedule(url, priority)
+            try:
+                resp, conn, pool_key = self._open(url, headers, 'GET')
+            except (socket.timeout, ConnectionError, http.client.HTTPException):
+                self._unschedule(slot)
+                if attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                self._count('retries')
+                self._wait_before_retry(attempt)
+                continue
+            except BaseException:
+                self._unschedule(slot)
+                raise
+            latency = self._latency(slot, time.monotonic())
+            retry_after = parse_retry_after(resp.getheader('Retry-After'))
+            redirect = resp.status in REDIRECT_STATUSES and resp.getheader('Location') and redirects < MAX_REDIRECTS
+            retry = resp.status in self.retry_statuses and attempt < self.max_retries
+            if not (redirect or retry):
+                break
+            resp.read()
+            self._release(*pool_key, conn, not resp.will_close)
+            self._unschedule(slot, resp.status, retry_after, latency)
+            if redirect:
+                redirects += 1
+                url = urljoin(url, resp.getheader('Location'))
+            else:
+                attempt += 1
+                self._count('retries')
+                self._wait_before_retry(attempt, retry_after)
+        if resp.status >= 400:
+            content = resp.read()
+            self._release(*pool_key, conn, not resp.will_close)
+            self._unschedule(slot, resp.status, retry_after, latency)
+            raise HTTPError(url, resp.status, resp.reason, resp.headers, io.BytesIO(content))
+        decoder = content_decoder(resp.getheader('Content-Encoding'))
+        def chunks():
+            while True:
+                chunk = resp.read(chunk_size)
+                if not chunk:
+                    break
+                self._count('bytes', len(chunk))
+                yield decoder.decompress(chunk) if decoder is not None else chunk
+            if decoder is not None:
+                yield decoder.flush()
+        try:
+            yield Response(url, resp.status, resp.headers, chunks())
+        finally:
+            if resp.isclosed():
+                self._release(*pool_key, conn, not resp.will_close)
+            else:
+                conn.close()
+            self._unschedule(slot, resp.status, latency=latency)
+
+    def request(self, url, headers=None, method='GET', priority=None):
+        '''
+        Sending a HTTP request through the cache and the pool, following redirects and retrying with backoff.
+        Raises urllib.error.HTTPError on 4xx/5xx, as urllib.request.urlopen does.
+        priority is one of scheduler.PRIORITIES, it orders the requests waiting for the same host.
+        '''
+        if self.cache is not None:
+            return self.cache.request(url, headers, method, lambda url, headers, method: self._request(url, headers, method, priority))
+        return self._request(url, headers, method, priority)
+
+    def _request(self, url, headers, method, priority=None):
+        redirects = 0
+        attempt = 0
+        while True:
+            self._count('requests')
+            slot = self._schedule(url, priority)
+            try:
+                resp, raw, headers_at = self._send(url, headers, method)
+            except (socket.timeout, ConnectionError, http.client.HTTPException):
+                self._unschedule(slot)
+                if attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                self._count('retries')
+                self._wait_before_retry(attempt)
+                continue
+            except BaseException:
+                self._unschedule(slot)
+                raise
+            retry_after = parse_retry_after(resp.getheader('Retry-After'))
+            self._unschedule(slot, resp.status, retry_after, self._latency(slot, headers_at))
+            if resp.status in REDIRECT_STATUSES and resp.getheader('Location') and redirects < MAX_REDIRECTS:
+                redirects += 1
+                url = urljoin(url, resp.getheader('Location'))
+                if resp.status == 303:
+                    method = 'GET'
+                continue
+            if resp.status in self.retry_statuses and attempt < self.max_retries:
+                attempt += 1
+                self._count('retries')
+                self._wait_before_retry(attempt, retry_after)
+                continue
+            content = decode_content(raw, resp.getheader('Content-Encoding'))
+            self._count('bytes', len(raw))
+            if resp.status >= 400:
+                raise HTTPError(url, resp.status, resp.reason, resp.headers, io.BytesIO(content))
+            return Response(url, resp.status, resp.headers, content)
+
+    def get(self, url, headers=None, priority=None):
+        return self.request(url, headers=headers, priority=priority).content
+
+
+_default_session = None
+_default_session_lock = threading.Lock()
+
+
+def get_default_session():
+    '''
+    Session of every object created without one, its scheduler keeps the requests to each host within
+    scheduler.DEFAULT_HOST_RATES and orders them by priority.
+    '''
+    global _default_session
+    with _default_session_lock:
+        if _default_session is None:
+            _default_session = Session(scheduler=Scheduler())
+        return _default_session
+
+
+def set_default_session(session):
+    global _default_session
+    with _default_session_lock:
+        _default_session = session
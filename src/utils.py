@@ -10,11 +10,17 @@ def feed_dir(output_dir):
             yield p, date_name
 
 
+def data_dir(output_dir, date_name):
+    target_dir = os.path.join(output_dir, date_name, 'data')
+    os.makedirs(target_dir, exist_ok=True)
+    return target_dir
+
+
 def make_output_dirs(output_dir):
     for p, date_name in feed_dir(output_dir):
         target_dir = os.path.join(output_dir, date_name, 'data')
         try:
-            os.mkdir(target_dir)
+            os.makedirs(target_dir)
             print('{} is created!'.format(target_dir))
         except FileExistsError as err:
             print(err)
@@ -0,0 +1,63 @@
+import io
+from urllib.error import HTTPError
+import pytest
+from src.cache import ResponseCache
+from src.transport import Response
+
+
+def _failing(code, calls):
+    def send(url, headers, method):
+        calls.append(code)
+        raise HTTPError(url, code, 'Error', {}, io.BytesIO(b'error'))
+    return send
+
+
+@pytest.mark.parametrize('code', [429, 500, 503])
+def test_transient_errors_are_not_cached(tmp_path, code):
+    cache = ResponseCache(str(tmp_path / 'responses.sqlite'))
+    calls = []
+    for _ in range(2):
+        with pytest.raises(HTTPError):
+            cache.request('https://example.com/1', {}, 'GET', _failing(code, calls))
+    assert calls == [code, code]
+    assert len(cache) == 0
+
+
+@pytest.mark.parametrize('code', [404, 410])
+def test_permanent_errors_are_cached(tmp_path, code):
+    cache = ResponseCache(str(tmp_path / 'responses.sqlite'))
+    calls = []
+    for _ in range(2):
+        with pytest.raises(HTTPError) as err:
+            cache.request('https://example.com/1', {}, 'GET', _failing(code, calls))
+        assert err.value.code == code
+    assert calls == [code]
+
+
+def _sending(responses, calls):
+    def send(url, headers, method):
+        calls.append(dict(headers))
+        return responses.pop(0)
+    return send
+
+
+def test_recordings_answer_conditional_requests(tmp_path):
+    path = str(tmp_path / 'responses.sqlite')
+    recorder = ResponseCache(path, mode='record')
+    calls = []
+    page = Response('https://example.com/1', 200, {'ETag': '"a"'}, b'page')
+    recorder.request('https://example.com/1', {'User-Agent': 'test'}, 'GET', _sending([page], calls))
+    recorder.close()
+    replay = ResponseCache(path, mode='replay')
+    conditional = {'User-Agent': 'test', 'If-None-Match': '"a"', 'If-Modified-Since': 'Mon, 01 Jan 2024 00:00:00 GMT'}
+    assert replay.request('https://example.com/1', conditional, 'GET', _sending([], calls)).content == b'page'
+    assert len(calls) == 1
+
+
+def test_not_modified_is_not_stored_over_the_page(tmp_path):
+    cache = ResponseCache(str(tmp_path / 'responses.sqlite'), mode='record')
+    calls = []
+    responses = [Response('https://example.com/1', 200, {'ETag': '"a"'}, b'page'), Response('https://example.com/1', 304, {}, b'')]
+    cache.request('https://example.com/1', {}, 'GET', _sending(responses, calls))
+    assert cache.request('https://example.com/1', {'If-None-Match': '"a"'}, 'GET', _sending(responses, calls)).status == 304
+    assert cache.get('https://example.com/1').content == b'page'
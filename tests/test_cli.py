@@ -0,0 +1,53 @@
+import io
+import json
+import subprocess
+import sys
+import pytest
+from src import cli
+from src.benchmarks import HEAVY_MODULES, _package_env
+
+# runs a command of the CLI in a fresh interpreter, printing the heavy modules it loaded
+CODE = '''
+import json, sys
+from src import cli
+try:
+    cli.run({argv!r})
+except SystemExit:
+    pass
+print(json.dumps([m for m in {heavy!r} if m in sys.modules]))
+'''
+
+
+@pytest.mark.parametrize('argv', [['--help'], ['crawl', '--help'], ['reorganise', '{tmp}']])
+def test_light_commands_load_no_heavy_modules(argv, tmp_path):
+    argv = [arg.format(tmp=tmp_path) for arg in argv]
+    out = subprocess.run([sys.executable, '-c', CODE.format(argv=argv, heavy=HEAVY_MODULES)], env=_package_env(),
+                         capture_output=True, text=True, check=True).stdout
+    assert json.loads(out.splitlines()[-1]) == []
+
+
+@pytest.mark.parametrize('option', [['--profile', 'crawl.prof'], ['--metrics', 'crawl.json']])
+def test_single_process_options_are_rejected_with_processes(option, tmp_path):
+    with pytest.raises(SystemExit):
+        cli.run(['resume', str(tmp_path / 'queue.sqlite'), '--processes', '2'] + option)
+
+
+def test_worker_jobs_share_one_session_per_cache(tmp_path, monkeypatch, capsys):
+    created, closed = [], []
+    new_session, close_session = cli._session, cli._close_session
+    def creating(*args):
+        created.append(new_session(*args))
+        return created[-1]
+    def closing(session):
+        closed.append(session)
+        close_session(session)
+    monkeypatch.setattr(cli, '_session', creating)
+    monkeypatch.setattr(cli, '_close_session', closing)
+    queue, cache = str(tmp_path / 'queue.sqlite'), str(tmp_path / 'responses.sqlite')
+    jobs = [['resume', queue], ['resume', queue], ['resume', queue, '--cache', cache], ['resume', queue, '--cache', cache]]
+    monkeypatch.setattr(sys, 'stdin', io.StringIO(''.join(json.dumps(job) + '\n' for job in jobs)))
+    assert cli.run(['worker']) == {'jobs': 4}
+    assert [json.loads(line)['status'] for line in capsys.readouterr().out.splitlines()] == ['ok'] * 4
+    # one session without and one with the cache, closed when the worker stops
+    assert len(created) == 2 and created[1].cache is not None
+    assert closed == created
@@ -0,0 +1,81 @@
+import pytest
+from src import crawler as crawler_module
+from src.clusters import ClusterMap
+from src.crawler import Crawler
+from src.fixtures import property_id
+from src.localsite import LocalSite
+from src.scraper import RealEstateHungaryPageListings, RealEstateHungarySettings
+from src.transport import Session
+
+IDS = ['101', '103', '102']
+URLS = ['https://ingatlan.com/{}'.format(i) for i in IDS]
+PRICES = ['30 M Ft', '10 M Ft', '20 M Ft']
+
+
+@pytest.mark.parametrize('keep, expected', [('first', '101'), ('cheapest', '103'), ('newest', '103')])
+def test_select_keeps_one_card_per_cluster(keep, expected):
+    cluster_map = ClusterMap(keep=keep)
+    selected = cluster_map.select(IDS + ['200'], ['a', 'a', 'a', None], URLS + ['https://ingatlan.com/200'], PRICES + ['5 M Ft'])
+    assert selected == [i == expected for i in IDS] + [True]
+    assert cluster_map.representative('a')['property_id'] == expected
+    assert len(cluster_map.members('a')) == 3
+    assert cluster_map.stats == {'representatives': 1, 'replaced': 0, 'skipped': 2}
+
+
+@pytest.mark.parametrize('keep, price, replaced', [('first', '1 M Ft', False), ('cheapest', '1 M Ft', True), ('cheapest', '50 M Ft', False),
+                                                   ('newest', '50 M Ft', True)])
+def test_select_on_later_page(keep, price, replaced):
+    cluster_map = ClusterMap(keep=keep)
+    cluster_map.select(IDS, ['a'] * 3, URLS, PRICES)
+    representative = cluster_map.representative('a')
+    assert cluster_map.select(['104'], ['a'], ['https://ingatlan.com/104'], [price]) == [replaced]
+    assert cluster_map.representative('a')['property_id'] == ('104' if replaced else representative['property_id'])
+    # the representative is fetched again when its card shows up again
+    assert cluster_map.select(IDS[:1], ['a'], URLS[:1], PRICES[:1]) == [not replaced and representative['property_id'] == IDS[0]]
+
+
+@pytest.mark.parametrize('keep', ['first', 'cheapest', 'newest'])
+def test_failed_representative_hands_over_to_next_member(keep):
+    # the next member is '102' in every mode: the first by id of the others, the cheaper and the newer one
+    expected = '102'
+    cluster_map = ClusterMap(keep=keep)
+    cluster_map.select(IDS, ['a'] * 3, URLS, PRICES)
+    failing = cluster_map.representative('a')['property_id']
+    assert cluster_map.fail('a', failing) == {'property_id': expected, 'url': 'https://ingatlan.com/102', 'price': 20000000.}
+    assert cluster_map.representative('a')['property_id'] == expected
+    # a failed member is never chosen again
+    assert cluster_map.select(IDS, ['a'] * 3, URLS, PRICES) == [i == expected for i in IDS]
+
+
+def test_failed_member_without_replacement():
+    cluster_map = ClusterMap(keep='cheapest')
+    cluster_map.select(IDS, ['a'] * 3, URLS, PRICES)
+    assert cluster_map.fail('a', '101') is None
+    assert cluster_map.representative('a')['property_id'] == '103'
+    cluster_map.select(['104'], ['b'], ['https://ingatlan.com/104'], ['1 M Ft'])
+    assert cluster_map.fail('b', '104') is None
+    # a new member takes over a cluster whose only listing failed
+    assert cluster_map.select(['105'], ['b'], ['https://ingatlan.com/105'], ['90 M Ft']) == [True]
+
+
+def test_crawler_scrapes_next_member_when_representative_fails(tmp_path, monkeypatch):
+    with LocalSite(num_photos=0, max_listing=20) as site:
+        monkeypatch.setattr(crawler_module, 'RealEstateHungarySettings',
+                            lambda lang, session=None: RealEstateHungarySettings(lang, url=site.url(lang), cache_dir=None, session=session))
+        # the sixth card shares the cluster of the fifth, whose property page is gone
+        gone = str(property_id(1, 4))
+        create_record = RealEstateHungaryPageListings._create_record
+        def failing(self, url, **kwargs):
+            if url.endswith('/' + gone):
+                raise crawler_module.HTTPError(url, 404, 'Not Found', None, None)
+            return create_record(self, url, **kwargs)
+        monkeypatch.setattr(RealEstateHungaryPageListings, '_create_record', failing)
+        crawler = Crawler(str(tmp_path / 'queue.sqlite'), session=Session(backoff_factor=0.), cluster_path=str(tmp_path / 'clusters.sqlite'))
+        crawler.add([('hun', 'budapest', 'elado', 'lakas')])
+        crawler.run()
+        ids = set(crawler.to_df()['property_id'].astype(str))
+        assert gone not in ids and str(property_id(1, 5)) in ids
+        # 20 cards in 17 clusters, every cluster has a record
+        assert len(ids) == 17
+        assert crawler.cluster_map.representative('c{}'.format(gone))['property_id'] == str(property_id(1, 5))
+        crawler.close()
@@ -0,0 +1,81 @@
+import socket
+import subprocess
+import sys
+import time
+import pytest
+from src import crawler as crawler_module
+from src.crawler import Crawler, FAILED, PAGE, PROPERTY, RUNNING
+from src.localsite import LocalSite
+from src.scraper import RealEstateHungarySettings
+from src.transport import Session
+
+SEARCH = ('hun', 'budapest', 'elado', 'lakas')
+
+
+@pytest.fixture
+def site(monkeypatch):
+    with LocalSite(num_photos=0, max_listing=30) as site:
+        # the crawler builds the settings of the live sites
+        monkeypatch.setattr(crawler_module, 'RealEstateHungarySettings',
+                            lambda lang, session=None: RealEstateHungarySettings(lang, url=site.url(lang), cache_dir=None, session=session))
+        yield site
+
+
+def _crawler(db_path, **kwargs):
+    kwargs.setdefault('session', Session(backoff_factor=0.))
+    return Crawler(str(db_path), **kwargs)
+
+
+def _statuses(crawler):
+    return {(row['kind'], row['status']): row['n'] for row in crawler._conn.execute(
+        'SELECT kind, status, COUNT(*) AS n FROM tasks GROUP BY kind, status')}
+
+
+def test_properties_are_claimed_before_pages(site, tmp_path):
+    crawler = _crawler(tmp_path / 'queue.sqlite')
+    crawler.add([SEARCH])
+    assert crawler.run(max_tasks=1) == 1
+    task = crawler.claim()
+    assert task['kind'] == PROPERTY and task['attempts'] == 1
+    crawler.close()
+
+
+def test_expired_lease_is_handed_out_again(site, tmp_path):
+    db_path = tmp_path / 'queue.sqlite'
+    gone = _crawler(db_path, worker_id='elsewhere:1')
+    gone.add([SEARCH])
+    claimed = gone.claim()
+    assert _crawler(db_path).claim() is None
+    time.sleep(0.05)
+    task = _crawler(db_path, lease_timeout=0.01).claim()
+    assert task['id'] == claimed['id'] and task['attempts'] == 2
+
+
+@pytest.mark.parametrize('status, attempts', [(403, 2), (404, 1)])
+def test_failing_task_is_tried_max_attempts_times(status, attempts, tmp_path, monkeypatch):
+    with LocalSite(num_photos=0, max_listing=30, error_rate=1., error_status=status) as site:
+        monkeypatch.setattr(crawler_module, 'RealEstateHungarySettings',
+                            lambda lang, session=None: RealEstateHungarySettings(lang, url=site.url(lang), cache_dir=None, session=session))
+        crawler = _crawler(tmp_path / 'queue.sqlite', max_attempts=2, session=Session(max_retries=0))
+        crawler.add([SEARCH])
+        assert crawler.run() == attempts
+        row = crawler._conn.execute('SELECT status, attempts, error FROM tasks').fetchone()
+        assert (row['status'], row['attempts']) == (FAILED, attempts)
+        assert str(status) in row['error']
+
+
+def test_resume_after_a_crash_does_not_wait_for_the_lease(site, tmp_path):
+    db_path = tmp_path / 'queue.sqlite'
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    crashed = _crawler(db_path, worker_id='{0}:{1}'.format(socket.gethostname(), process.pid))
+    crashed.add([SEARCH])
+    crashed.run(max_tasks=1)
+    assert crashed.claim()['kind'] == PROPERTY
+    crashed._conn.close()
+    resumed = _crawler(db_path)
+    start = time.monotonic()
+    resumed.run()
+    assert time.monotonic() - start < 30
+    assert (PROPERTY, RUNNING) not in _statuses(resumed) and (PAGE, RUNNING) not in _statuses(resumed)
+    assert len(resumed.to_df()) == 30
@@ -0,0 +1,34 @@
+import pytest
+from src.localsite import LocalSite
+from src.scraper import RealEstateHungarySettings, RealEstateHungaryPageListings, RealEstateHungary
+
+SEARCHES = {'hun': ('budapest', 'elado', 'lakas'), 'eng': ('budapest', 'for-sale', 'apartment')}
+
+
+class _Downloader:
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, property_id, photos):
+        self.submitted.append((property_id, photos))
+
+
+def test_photos_with_fields_do_not_parse_the_whole_page(monkeypatch):
+    # html5lib always builds the whole tree
+    pytest.importorskip('lxml')
+    monkeypatch.setattr('src.scraper._default_parser', 'lxml')
+    fully_parsed = []
+    release = RealEstateHungary.release
+    def spy(self):
+        fully_parsed.append(self._parsed_html is not None)
+        release(self)
+    monkeypatch.setattr(RealEstateHungary, 'release', spy)
+    with LocalSite(num_photos=3, max_listing=20) as site:
+        for lang, search in SEARCHES.items():
+            downloader = _Downloader()
+            settings = RealEstateHungarySettings(lang, url=site.url(lang), cache_dir=None)
+            page = RealEstateHungaryPageListings(settings, *search, 1, photo_downloader=downloader)
+            df = page.listings_to_df(num_listings=3, fields=['area_size'])
+            assert len(df) == 3 and 'photos' not in df.columns
+            assert [len(photos) for _, photos in downloader.submitted] == [3, 3, 3]
+    assert fully_parsed and not any(fully_parsed)
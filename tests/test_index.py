@@ -0,0 +1,36 @@
+import datetime
+import pandas as pd
+import pytest
+from src.index import ListingIndex, record_hash
+
+RECORD = {'property_url': 'https://ingatlan.com/31337', 'price_in_huf': '67,4 M Ft', 'lat': 47.525306, 'photos': 12,
+          'bus_count': 3, 'property_id': '31337', 'page_num': 1, 'timestamp': '2024-01-01 10:00:00'}
+
+
+def test_record_hash_ignores_context_and_csv_round_trip(tmp_path):
+    assert record_hash(RECORD) == record_hash({**RECORD, 'page_num': 7, 'timestamp': '2024-02-01 10:00:00'})
+    assert record_hash(RECORD) != record_hash({**RECORD, 'price_in_huf': '65 M Ft'})
+    path = str(tmp_path / 'raw.csv')
+    # a column with gaps is read back as floats, 3 as 3.0
+    pd.DataFrame([RECORD, {'property_id': '2', 'bus_count': None}]).to_csv(path, index=False)
+    row = pd.read_csv(path, dtype=str).iloc[0].dropna().to_dict()
+    assert record_hash(row) == record_hash(RECORD)
+
+
+def test_snapshot_seeds_fetch_state(tmp_path):
+    path = str(tmp_path / 'raw.csv')
+    pd.DataFrame([RECORD]).to_csv(path, index=False)
+    index = ListingIndex(str(tmp_path / 'listings.sqlite'), recheck_after=3600)
+    assert index.ingest_snapshot(path) == 1
+    entry = index.get('31337')
+    assert entry['content_hash'] == record_hash(RECORD)
+    assert entry['last_fetched'] == datetime.datetime(2024, 1, 1, 10).timestamp()
+    assert index.is_fresh(entry, now=entry['last_fetched'] + 60)
+    assert not index.is_fresh(entry, now=entry['last_fetched'] + 7200)
+
+
+def test_snapshot_without_property_id(tmp_path):
+    path = str(tmp_path / 'raw.csv')
+    pd.DataFrame([{'property_url': 'https://ingatlan.com/31337'}]).to_csv(path, index=False)
+    with pytest.raises(ValueError, match='property_id'):
+        ListingIndex(str(tmp_path / 'listings.sqlite')).ingest_snapshot(path)
@@ -0,0 +1,29 @@
+import pytest
+from src import fixtures, metrics
+from src.benchmarks import offline_page_listings
+from src.scraper import RealEstateHungary
+
+
+class _Recorder(metrics.Metrics):
+    def __init__(self):
+        super().__init__()
+        self.names = []
+
+    def observe(self, name, value, **labels):
+        self.names.append(name)
+        super().observe(name, value, **labels)
+
+
+@pytest.mark.parametrize('lang', ('hun', 'eng'))
+def test_field_timers_exclude_parse_and_locate(lang):
+    page = offline_page_listings(lang)
+    single_property = RealEstateHungary('https://example.com/1', page, content=fixtures.detail_page(lang, fixtures.property_id(1, 1, lang)))
+    recorder = metrics.enable_metrics(_Recorder())
+    try:
+        single_property.extract_attrs()
+    finally:
+        metrics.disable_metrics()
+    fields = [i for i, name in enumerate(recorder.names) if name == 'field_seconds']
+    assert fields and recorder.names.count('locate_seconds') == 1
+    assert recorder.names.index('parse_seconds') < recorder.names.index('locate_seconds') < fields[0]
+    assert 'parse_seconds' not in recorder.names[fields[0]:]
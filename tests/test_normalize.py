@@ -0,0 +1,109 @@
+import math
+import re
+import numpy as np
+import pandas as pd
+import pytest
+from src import fixtures
+from src.benchmarks import offline_page_listings
+from src.normalize import FLOOR_WORDS, PRICE_UNITS, normalize, parse_floor, parse_price, parse_room, to_number
+from src.scraper import RealEstateHungary, records_to_df
+
+
+def _records(lang, num_listings=20):
+    page = offline_page_listings(lang)
+    page_attrs = page.extract_attrs()
+    return [{**page_attrs, **RealEstateHungary('https://example.com/{}'.format(i), page, content=fixtures.detail_page(lang, fixtures.property_id(1, i, lang))).extract_attrs()}
+            for i in range(num_listings)]
+
+
+# parsing of one value at a time, as the consumers of the raw strings did before normalize
+
+def _row_number(text, lang):
+    if not isinstance(text, str):
+        return math.nan
+    if lang == 'eng':
+        match = re.search(r'\d{1,3}(?:,\d{3})+(?:\.\d+)?|\d[\d ]*(?:\.\d+)?', text)
+        return math.nan if match is None else float(match.group().replace(',', '').replace(' ', ''))
+    match = re.search(r'\d[\d ]*(?:[,|.]\d+)?', text)
+    return math.nan if match is None else float(match.group().replace(' ', '').replace(',', '.').replace('|', '.'))
+
+
+def _row_price(text, lang):
+    if not isinstance(text, str):
+        return math.nan
+    unit = text.lower().split()[-2] if len(text.split()) > 2 else ''
+    return _row_number(text, lang) * PRICE_UNITS[unit]
+
+
+def _row_floor(text, lang):
+    if not isinstance(text, str):
+        return math.nan
+    return FLOOR_WORDS.get(text.strip().lower(), _row_number(text, lang))
+
+
+def _row_rooms(text):
+    if not isinstance(text, str):
+        return math.nan, math.nan
+    whole, _, half = text.partition('+')
+    return float(whole), float(half.replace('fél', ''))
+
+
+@pytest.mark.parametrize('lang, thousands', [('hun', False), ('eng', False), ('eng', True)])
+def test_normalize_matches_row_by_row_parsing(lang, thousands):
+    records = _records(lang)
+    if thousands:
+        # realestate.hu groups the digits of the prices by ','
+        for record in records:
+            for column in ('price_in_huf', 'price_in_eur'):
+                number, unit = record[column].split()
+                record[column] = '{0:,} {1}'.format(int(number), unit)
+    df = records_to_df(records)
+    typed = normalize(df)
+    for name, column in (('price_huf', 'price_in_huf'), ('price_eur', 'price_in_eur')):
+        if column in df.columns:
+            assert typed[name].astype('float64').tolist() == [_row_price(v, lang) for v in df[column]]
+    assert np.allclose(typed['area_size'], [_row_number(v, lang) for v in df['area_size']], equal_nan=True)
+    floors = df['emelet' if lang == 'hun' else 'floors']
+    assert np.allclose(typed['floor'], [_row_floor(v, lang) for v in floors], equal_nan=True)
+    if lang == 'hun':
+        rooms = [_row_rooms(v) for v in df['room']]
+        assert typed['rooms'].tolist() == [r for r, _ in rooms] and typed['half_rooms'].tolist() == [h for _, h in rooms]
+        assert np.allclose(typed['balcony_size'], [_row_number(v, lang) for v in df['erkély']], equal_nan=True)
+
+
+def test_numbers_per_language():
+    strings = pd.Series(['1,250,000 HUF', '4,5 m²', '1 250 000 Ft', '88.5 square meter', '4|5 m²'])
+    assert to_number(strings, 'eng').tolist()[:4] == [1250000., 4., 1250000., 88.5]
+    assert to_number(strings, 'hun').tolist() == [1.25, 4.5, 1250000., 88.5, 4.5]
+    assert parse_price(pd.Series(['1,250,000 HUF', '3,205 EUR']), 'eng').tolist() == [1250000., 3205.]
+    assert parse_price(pd.Series(['56,4 M Ft', '850 E Ft', '1,2 Mrd Ft'])).tolist() == [56400000., 850000., 1200000000.]
+
+
+def test_normalize_mixed_languages():
+    df = pd.DataFrame({'lang': ['hun', 'eng', None], 'price_in_huf': ['56,4 M Ft', '1,250,000 HUF', '2 M Ft'],
+                       'area_size': ['52 m²', '1,200 square meter', None]})
+    typed = normalize(df)
+    assert typed['price_huf'].tolist() == [56400000, 1250000, 2000000]
+    assert typed['area_size'].tolist()[:2] == [52., 1200.] and np.isnan(typed['area_size'][2])
+
+
+def test_floor_edge_cases():
+    floors = parse_floor(pd.Series(['földszint', 'Ground floor', 'magasföldszint', 'félemelet', 'szuterén', '10 felett',
+                                    ' 3 ', '3rd floor', '', 'nincs megadva', 'n/a']))
+    assert floors.tolist()[:8] == [0., 0., 0.5, 0.5, -1., 11., 3., 3.]
+    assert floors[8:].isna().all()
+
+
+def test_room_edge_cases():
+    rooms = parse_room(pd.Series(['1 + 2 fél', '1+1 fél', '4 + 0 fél', '3', '10', '2 fél', '', 'nincs megadva']))
+    assert rooms['rooms'].tolist()[:5] == [1., 1., 4., 3., 10.] and rooms['rooms'][5:].isna().all()
+    assert rooms['half_rooms'].tolist()[:3] == [2., 1., 0.] and rooms['half_rooms'][5] == 2.
+    assert rooms['half_rooms'][[3, 4, 6, 7]].isna().all()
+
+
+def test_missing_values():
+    typed = normalize(pd.DataFrame({'lang': ['hun', 'hun', 'eng'], 'room': [None, '2', None], 'emelet': [None, 'földszint', None],
+                                    'floors': [None, None, None], 'price_in_huf': [None, '30 M Ft', None]}))
+    assert typed['rooms'].isna().tolist() == [True, False, True]
+    assert typed['floor'].isna().tolist() == [True, False, True]
+    assert typed['price_huf'].isna().tolist() == [True, False, True]
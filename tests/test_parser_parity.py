@@ -0,0 +1,39 @@
+import bs4
+import pytest
+from src import fixtures
+from src.benchmarks import offline_page_listings
+from src.scraper import RealEstateHungary
+
+LANGS = ('hun', 'eng')
+PARSERS = ('lxml', 'html.parser')
+
+
+def _require(parser):
+    try:
+        bs4.BeautifulSoup('', parser)
+    except bs4.FeatureNotFound:
+        pytest.skip('{} is not installed'.format(parser))
+
+
+def _property_attrs(lang, parser, num_listings=10):
+    page = offline_page_listings(lang, parser=parser)
+    return [RealEstateHungary('https://example.com/{}'.format(i), page, content=fixtures.detail_page(lang, fixtures.property_id(1, i, lang)),
+                              parser=parser).extract_attrs()
+            for i in range(num_listings)]
+
+
+@pytest.mark.parametrize('parser', PARSERS)
+@pytest.mark.parametrize('lang', LANGS)
+def test_result_page_matches_html5lib(lang, parser):
+    _require(parser)
+    expected = offline_page_listings(lang, parser='html5lib')
+    actual = offline_page_listings(lang, parser=parser)
+    assert actual.extract_attrs() == expected.extract_attrs()
+    assert actual.get_page_listings() == expected.get_page_listings()
+
+
+@pytest.mark.parametrize('parser', PARSERS)
+@pytest.mark.parametrize('lang', LANGS)
+def test_property_attrs_match_html5lib(lang, parser):
+    _require(parser)
+    assert _property_attrs(lang, parser) == _property_attrs(lang, 'html5lib')
@@ -0,0 +1,54 @@
+import contextlib
+import os
+from collections import namedtuple
+from unittest import mock
+from src.photos import PhotoDownloader
+
+_Response = namedtuple('_Response', ['status', 'headers', 'content'])
+
+
+class _Session:
+    '''
+    Streams the given bodies in two chunks, a body of b'FAIL' breaks off after the first one.
+    '''
+    def __init__(self, bodies):
+        self.bodies = bodies
+
+    @contextlib.contextmanager
+    def stream(self, url, headers=None, chunk_size=None, priority=None):
+        body = self.bodies[url]
+        def chunks():
+            yield body[:3]
+            if body == b'FAIL':
+                raise ConnectionError('Connection reset')
+            yield body[3:]
+        yield _Response(200, {'ETag': '"1"'}, chunks())
+
+
+def test_failed_download_leaves_no_file_and_no_manifest_entry(tmp_path):
+    with PhotoDownloader(str(tmp_path), session=_Session({'a': b'FAIL'})) as downloader:
+        downloader.submit('1', [('a', 'a.jpg')])
+    assert sorted(os.listdir(tmp_path)) == ['manifest.json']
+    assert downloader.manifest['properties'] == {}
+    assert downloader.stats['failed'] == 1
+
+
+def test_duplicate_is_linked(tmp_path):
+    with PhotoDownloader(str(tmp_path), session=_Session({'a': b'same image', 'b': b'same image'})) as downloader:
+        downloader.submit('1', [('a', 'a.jpg')])
+        downloader.wait()
+        downloader.submit('2', [('b', 'b.jpg')])
+    assert os.path.samefile(tmp_path / 'a.jpg', tmp_path / 'b.jpg')
+    assert downloader.stats['deduplicated'] == 1
+
+
+def test_duplicate_is_kept_as_copy_without_hard_links(tmp_path):
+    with PhotoDownloader(str(tmp_path), session=_Session({'a': b'same image', 'b': b'same image'})) as downloader:
+        downloader.submit('1', [('a', 'a.jpg')])
+        downloader.wait()
+        with mock.patch('os.link', side_effect=OSError('Hard links are not supported')):
+            downloader.submit('2', [('b', 'b.jpg')])
+            downloader.wait()
+    assert (tmp_path / 'b.jpg').read_bytes() == b'same image'
+    assert not os.path.exists(tmp_path / 'b.jpg.part')
+    assert downloader.manifest['properties'] == {'1': ['a.jpg'], '2': ['b.jpg']}
@@ -0,0 +1,18 @@
+from src.localsite import LocalSite
+from src.pipeline import Pipeline
+from src.scraper import RealEstateHungarySettings, RealEstateHungaryPageListings
+from src.transport import Session
+
+
+def test_failed_listings_are_recorded_and_the_rest_goes_on():
+    # 403 is not retried, every listing it hits fails
+    with LocalSite(error_rate=0.3, error_status=403, seed=3, num_photos=0, max_listing=100) as site:
+        settings = RealEstateHungarySettings('hun', url=site.url('hun'), cache_dir=None)
+        pages = [RealEstateHungaryPageListings(settings, 'budapest', 'elado', 'lakas', page_num) for page_num in range(1, 4)]
+        pipeline = Pipeline(processes=1, fetchers=4, session=Session(max_retries=0))
+        records = list(pipeline.iter_records(pages))
+    stats = pipeline.stats
+    assert stats['failed'] > 0
+    assert len(pipeline.failures) == stats['failed']
+    assert all('403' in error for url, error in pipeline.failures)
+    assert len(records) == stats['extracted'] > 0
@@ -0,0 +1,14 @@
+from src.records import MAX_SHARED_INDEXES, CompactRecord, _shared_index
+
+
+def test_records_share_the_index_of_their_columns():
+    first, second = CompactRecord(['a', 'b'], [1, 2]), CompactRecord(['a', 'b'], [3, 4])
+    assert first._index is second._index
+    assert dict(second) == {'a': 3, 'b': 4}
+
+
+def test_shared_indexes_are_bounded():
+    records = [CompactRecord(['column_{}'.format(i)], [i]) for i in range(MAX_SHARED_INDEXES + 10)]
+    assert _shared_index.cache_info().currsize <= MAX_SHARED_INDEXES
+    # records of evicted column sets keep their index
+    assert records[0]['column_0'] == 0
@@ -0,0 +1,43 @@
+import threading
+import time
+from src.scheduler import DETAIL, PHOTO, Scheduler
+from src.transport import get_default_session
+
+URL = 'https://ingatlan.com/1'
+
+
+def test_retry_after_pauses_the_host():
+    scheduler = Scheduler(host_rates={'ingatlan.com': 1000.})
+    slot = scheduler.acquire(URL)
+    scheduler.release(slot, 429, retry_after=0.3)
+    start = time.monotonic()
+    scheduler.release(scheduler.acquire('https://ingatlan.com/2'), 200)
+    assert time.monotonic() - start >= 0.29
+    assert scheduler.stats()['ingatlan.com']['throttled'] == 1
+
+
+def test_photo_waits_behind_detail():
+    scheduler = Scheduler(host_rates={'ingatlan.com': 1000.}, initial_concurrency=1)
+    running = scheduler.acquire(URL)
+    started = []
+    def request(priority):
+        slot = scheduler.acquire(URL, priority)
+        started.append(priority)
+        scheduler.release(slot, 200)
+    # the photo asks first, both queue behind the running request
+    threads = [threading.Thread(target=request, args=(PHOTO,))]
+    threads[0].start()
+    while len(scheduler._hosts['ingatlan.com'].waiting) < 1:
+        time.sleep(0.01)
+    threads.append(threading.Thread(target=request, args=(DETAIL,)))
+    threads[1].start()
+    while len(scheduler._hosts['ingatlan.com'].waiting) < 2:
+        time.sleep(0.01)
+    scheduler.release(running, 200)
+    for thread in threads:
+        thread.join(5)
+    assert started == [DETAIL, PHOTO]
+
+
+def test_default_session_is_scheduled():
+    assert get_default_session().scheduler is not None
@@ -0,0 +1,64 @@
+import os
+import time
+import pytest
+from src import fixtures
+from src.scraper import RealEstateHungarySettings
+
+URL = 'http://127.0.0.1:9/hun/'
+
+
+class _Offline:
+    def request(self, *args, **kwargs):
+        raise AssertionError('the options should come from the cache')
+
+    get = request
+
+
+@pytest.fixture(autouse=True)
+def memory_cache(monkeypatch):
+    cache = {}
+    monkeypatch.setattr(RealEstateHungarySettings, '_options_cache', cache)
+    return cache
+
+
+def _extracted(cache_dir, **kwargs):
+    return RealEstateHungarySettings('hun', content=fixtures.homepage('hun'), url=URL, cache_dir=cache_dir, **kwargs)
+
+
+def _cached(cache_dir, **kwargs):
+    return RealEstateHungarySettings('hun', session=_Offline(), url=URL, cache_dir=cache_dir, **kwargs)
+
+
+def test_memory_hit(tmp_path):
+    expected = _extracted(None).options
+    assert _cached(None).options == expected
+    assert not os.listdir(tmp_path)
+
+
+def test_disk_hit(tmp_path, memory_cache):
+    expected = _extracted(str(tmp_path)).options
+    assert len(os.listdir(tmp_path)) == 1
+    memory_cache.clear()
+    assert _cached(str(tmp_path)).options == expected
+    assert memory_cache
+
+
+def test_expired_options_are_not_used(tmp_path, memory_cache):
+    _extracted(str(tmp_path))
+    time.sleep(0.01)
+    with pytest.raises(KeyError):
+        _cached(str(tmp_path), cache_ttl=0.001, offline=True)
+    memory_cache.clear()
+    with pytest.raises(KeyError):
+        _cached(str(tmp_path), cache_ttl=0.001, offline=True)
+
+
+def test_offline_without_cached_options(tmp_path):
+    with pytest.raises(KeyError):
+        _cached(str(tmp_path), offline=True)
+
+
+def test_fixture_pages_leave_the_disk_cache_alone():
+    from src.benchmarks import offline_page_listings
+    for lang in ('hun', 'eng'):
+        assert offline_page_listings(lang)._real_estate_hun_settings.cache_dir is None
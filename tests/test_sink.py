@@ -0,0 +1,67 @@
+import os
+import sys
+import pandas as pd
+import pytest
+from src.sink import ChunkedWriter, write_records
+
+
+def _records(num_records, date='2020-03-01', new_column_from=None):
+    records = []
+    for i in range(num_records):
+        record = {'property_url': 'https://ingatlan.com/{}'.format(i), 'price_in_huf': '{} M Ft'.format(i), 'area_size': i,
+                  'timestamp': '{} 10:00:{:02d}'.format(date, i % 60)}
+        if new_column_from is not None and i >= new_column_from:
+            record['erkély'] = '{} m²'.format(i)
+        records.append(record)
+    return records
+
+
+def _read(paths):
+    read = pd.read_parquet if paths[0].endswith('.parquet') else lambda path: pd.read_csv(path, dtype=str)
+    return pd.concat([read(path) for path in paths], ignore_index=True)
+
+
+@pytest.mark.parametrize('fmt', ['parquet', 'csv'])
+def test_new_columns_roll_over_to_next_part(fmt, tmp_path):
+    # the first two chunks share a part, the third one brings erkély
+    paths = write_records(_records(6, new_column_from=4), str(tmp_path), fmt=fmt, chunk_size=2)
+    data_dir = os.path.join(str(tmp_path), '2020-03-01', 'data')
+    assert paths == [os.path.join(data_dir, 'raw-{0:05d}.{1}'.format(i, fmt)) for i in range(2)]
+    assert [len(_read([path])) for path in paths] == [4, 2]
+    # a later run adds parts next to the existing ones
+    more = write_records(_records(1), str(tmp_path), fmt=fmt)
+    assert more == [os.path.join(data_dir, 'raw-00002.{}'.format(fmt))]
+
+
+def test_records_are_partitioned_by_date(tmp_path):
+    records = _records(3) + _records(2, date='2020-03-02') + [{'property_url': 'https://ingatlan.com/x'}]
+    with ChunkedWriter(str(tmp_path), fmt='csv', chunk_size=100) as writer:
+        writer.write_all(records)
+    assert sorted(os.path.relpath(path, str(tmp_path)) for path in writer.paths) == [
+        os.path.join(date_name, 'data', 'raw-00000.csv') for date_name in ('2020-03-01', '2020-03-02', 'undated')]
+    assert writer.rows_written == 6
+
+
+@pytest.mark.parametrize('fmt', ['parquet', 'csv'])
+def test_parts_equal_single_write(fmt, tmp_path):
+    records = _records(25, new_column_from=12)
+    paths = write_records(records, str(tmp_path / 'chunked'), fmt=fmt, chunk_size=5)
+    assert len(paths) == 2
+    single = str(tmp_path / 'raw.{}'.format(fmt))
+    df = pd.DataFrame.from_records(records)
+    if fmt == 'parquet':
+        df.to_parquet(single, index=False)
+    else:
+        df.to_csv(single, index=False)
+    expected = _read([single])
+    pd.testing.assert_frame_equal(_read(paths)[list(expected.columns)], expected)
+
+
+def test_csv_without_pyarrow(tmp_path, monkeypatch):
+    # None in sys.modules makes the import fail as if pyarrow was not installed
+    monkeypatch.setitem(sys.modules, 'pyarrow', None)
+    monkeypatch.setitem(sys.modules, 'pyarrow.parquet', None)
+    with pytest.warns(UserWarning, match='pyarrow'):
+        paths = write_records(_records(3), str(tmp_path), fmt='parquet', chunk_size=2)
+    assert [os.path.basename(path) for path in paths] == ['raw-00000.csv']
+    assert len(_read(paths)) == 3
@@ -0,0 +1,23 @@
+import numpy as np
+from src.spatial import EARTH_RADIUS, SpatialIndex, haversine
+
+
+def _destination(lat, lng, meters, bearing):
+    lat, lng, bearing = np.radians(lat), np.radians(lng), np.radians(bearing)
+    d = meters / EARTH_RADIUS
+    lat2 = np.arcsin(np.sin(lat) * np.cos(d) + np.cos(lat) * np.sin(d) * np.cos(bearing))
+    lng2 = lng + np.arctan2(np.sin(bearing) * np.sin(d) * np.cos(lat), np.cos(d) - np.sin(lat) * np.sin(lat2))
+    return np.degrees(lat2), np.degrees(lng2)
+
+
+def test_radius_finds_a_point_at_the_north_east_edge():
+    lat, lng, meters = 60., 19., 500000.
+    # the point of the circle farthest to the east lies north of the center, outside a box sized by cos(lat)
+    points = [_destination(lat, lng, meters * 0.9999, bearing) for bearing in np.arange(45., 90.5, 0.5)]
+    edge_lat, edge_lng = max(points, key=lambda point: point[1])
+    assert edge_lng - lng > meters / (np.pi * EARTH_RADIUS / 180) / np.cos(np.radians(lat))
+    index = SpatialIndex(['center', 'edge'], [lat, edge_lat], [lng, edge_lng])
+    ids, distances = index.radius(lat, lng, meters)
+    assert list(ids) == ['center', 'edge']
+    assert np.isclose(distances[1], haversine(lat, lng, edge_lat, edge_lng))
+    assert 'edge' in index.knn(lat, lng, k=2)[0]
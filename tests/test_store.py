@@ -0,0 +1,34 @@
+import pandas as pd
+import pytest
+from src.store import ListingStore
+
+pytest.importorskip('pyarrow')
+
+
+def _snapshot(date, prices):
+    return pd.DataFrame({'property_id': [str(i) for i in range(len(prices))], 'lang': 'hun', 'property_type': 'lakas',
+                         'price_in_huf': ['{} M Ft'.format(p) for p in prices], 'timestamp': '{} 10:00:00'.format(date)})
+
+
+def test_reingest_after_an_interrupted_ingest(tmp_path, monkeypatch):
+    store = ListingStore(str(tmp_path))
+    store.ingest(_snapshot('2024-01-01', [10, 20, 30]))
+    def crash():
+        raise OSError('interrupted')
+    monkeypatch.setattr(store, '_save_log', crash)
+    with pytest.raises(OSError):
+        store.ingest(_snapshot('2024-01-02', [10, 25, 30]))
+    monkeypatch.undo()
+    store = ListingStore(str(tmp_path))
+    assert store.ingest(_snapshot('2024-01-02', [10, 25, 30]))['2024-01-02']['price_changes'] == 1
+    scan = store.scan(columns=['key', 'date'])
+    assert len(scan) == 6
+    assert not scan.duplicated().any()
+    assert len(store.price_changes()) == 1
+
+
+def test_ingest_out_of_order_raises(tmp_path):
+    store = ListingStore(str(tmp_path))
+    store.ingest(_snapshot('2024-01-02', [10]))
+    with pytest.raises(ValueError):
+        store.ingest(_snapshot('2024-01-01', [10]))